@@ -0,0 +1,146 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette import status
+from dotenv import load_dotenv
+
+load_dotenv("API.env")
+
+
+def _too_many_requests(detail: str, retry_after: float):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=int(os.getenv("RAG_MAX_CONCURRENT", 8)),
+                 max_queue=int(os.getenv("RAG_MAX_QUEUE", 32)),
+                 queue_timeout=float(os.getenv("RAG_QUEUE_TIMEOUT", 10.0))):
+        """
+        Bound the number of RAG requests doing work at the same time
+
+        Args:
+            max_concurrent (int, optional): Requests allowed to run concurrently
+            max_queue (int, optional): Requests allowed to wait for a free slot, more are shed
+            queue_timeout (float, optional): Seconds a request may wait for a slot before it is shed
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+
+    async def acquire(self):
+        """
+        Wait for a concurrency slot, release it with release()
+
+        Raises:
+            HTTPException: 429 with Retry-After if the wait queue is full or the wait times out
+        """
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.shed += 1
+            raise _too_many_requests("Server is busy, try again later", self.queue_timeout)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise _too_many_requests("Server is busy, try again later", self.queue_timeout)
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold a concurrency slot for the duration of the block
+        """
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class SlotStreamingResponse(StreamingResponse):
+    def __init__(self, content, release=None, **kwargs):
+        """
+        StreamingResponse giving back the admission slot its route took once the response is over
+
+        The slot is released however the response ends, including when the client is gone or
+        the response start can't be sent: the body generator never starts then, so a release in
+        its finally would never run. A started body generator is closed as well.
+
+        Args:
+            content: Async iterable producing the body
+            release (callable, optional): Releases the slot, called exactly once
+            **kwargs: StreamingResponse arguments (media_type, headers...)
+        """
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                if self._release is not None:
+                    self._release()
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate=float(os.getenv("RATE_LIMIT_PER_MINUTE", 30)) / 60,
+                 burst=int(os.getenv("RATE_LIMIT_BURST", 10)), max_keys=10000):
+        """
+        Per-key token bucket rate limiter
+
+        Args:
+            rate (float, optional): Tokens refilled per second
+            burst (int, optional): Bucket capacity, i.e. the largest allowed burst
+            max_keys (int, optional): Buckets kept in memory, least recently used ones are dropped
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill time)
+        # the rate_limit dependency is sync, FastAPI runs it on threadpool workers concurrently
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str):
+        """
+        Take one token from the bucket of the given key
+
+        Raises:
+            HTTPException: 429 with Retry-After if the bucket is empty
+        """
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+            else:
+                self._buckets[key] = (tokens - 1, now)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+        if tokens < 1:
+            raise _too_many_requests("Rate limit exceeded", (1 - tokens) / self.rate)
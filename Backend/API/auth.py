@@ -2,13 +2,17 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from starlette import status
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from datetime import timedelta, datetime, timezone
+from collections import OrderedDict
+import hashlib
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from typing import Optional
 from models import UserCreate, Token, CreateUserDatabase 
 from database import Database
+from passwords import PasswordHasher
 
 
 # Initialize an API router for authentication-related routes
@@ -22,10 +26,91 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-for-jwt")
 ALGORITHM = os.getenv("JWT_ALGO", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Initialize a password hashing context using bcrypt
-bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+# bcrypt is deliberately slow, hash and verify on a worker pool to keep the event loop free
+password_hasher = PasswordHasher()
 # Initialize OAuth2PasswordBearer for token-based authentication
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="authenticate/login")
+# Same scheme for routes that also serve anonymous users, a missing token is not an error
+optional_oauth2_bearer = OAuth2PasswordBearer(tokenUrl="authenticate/login", auto_error=False)
+
+class VerifiedTokenCache:
+    def __init__(self, max_size: int = int(os.getenv("TOKEN_CACHE_SIZE", 4096)),
+                 ttl: float = float(os.getenv("TOKEN_CACHE_TTL", 300))):
+        """
+        Cache of already verified JWT payloads, keyed by the SHA-256 digest of the token.
+
+        Entries live for at most `ttl` seconds and never past the token's own `exp`.
+
+        Args:
+            max_size (int): Maximum number of cached tokens, least recently used ones are evicted.
+            ttl (float): Maximum lifetime of a cache entry in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # digest -> (payload, cache expiry)
+        self._revoked_tokens = {}  # digest -> token expiry
+        # token_verifier is a sync dependency, FastAPI runs it on the threadpool
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str):
+        """
+        Return the cached payload of a verified token, or None on a miss.
+        """
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return payload
+
+    def put(self, token: str, payload: dict):
+        """
+        Cache the payload of a token that just passed verification.
+        """
+        expires_at = min(time.time() + self.ttl, payload.get("exp", 0))
+        with self._lock:
+            self._entries[self._digest(token)] = (payload, expires_at)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def is_revoked(self, token: str):
+        """
+        Check the token against the revoked tokens.
+        """
+        with self._lock:
+            return self._digest(token) in self._revoked_tokens
+
+    def revoke(self, token: str, expires_at: float):
+        """
+        Revoke a single token until it expires on its own.
+
+        Args:
+            token (str): The JWT token to revoke.
+            expires_at (float): The token's `exp`, after which the denylist entry is dropped.
+        """
+        digest = self._digest(token)
+        now = time.time()
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._revoked_tokens = {d: exp for d, exp in self._revoked_tokens.items() if exp > now}
+            self._revoked_tokens[digest] = expires_at
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Verified tokens are cached so repeated calls from the same session skip the HMAC check
+token_cache = VerifiedTokenCache()
 
 def generate_payload(username: str, expiration: Optional[timedelta] = None):
     """
@@ -61,13 +146,18 @@ def token_verifier(token: str = Depends(oauth2_bearer)):
     Raises:
         HTTPException: If the token is invalid or expired.
     """
+    # Serve repeated requests from the same session without re-verifying the signature
+    payload = token_cache.get(token)
+    if payload is not None and not token_cache.is_revoked(token):
+        return payload
     try:
         # Decode the token using the secret key and algorithm
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get('username')  # Extract the username from the token payload
-        if username is None:
-            # Raise an exception if the username is missing in the token
+        if username is None or token_cache.is_revoked(token):
+            # Raise an exception if the username is missing in the token or the token was revoked
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token is Invalid or expired")
+        token_cache.put(token, payload)
         return payload  # Return the token payload if valid
     except JWTError:
         # Raise an exception if there is an error in decoding or verifying the token
@@ -75,6 +165,23 @@ def token_verifier(token: str = Depends(oauth2_bearer)):
     finally:
         pass  # [Warning] The `finally` block is not necessary here since there's no resource cleanup needed
 
+def optional_token_verifier(token: Optional[str] = Depends(optional_oauth2_bearer)):
+    """
+    Verify the JWT token if the request carries one.
+
+    Args:
+        token (str | None): The JWT token to verify, None for anonymous requests.
+
+    Returns:
+        dict | None: The decoded payload, or None if no token was sent.
+
+    Raises:
+        HTTPException: If a token was sent but is invalid or expired.
+    """
+    if token is None:
+        return None
+    return token_verifier(token=token)
+
 
 @router.post('/register', status_code=status.HTTP_201_CREATED)
 async def create_user(create_new_user: UserCreate):
@@ -90,14 +197,14 @@ async def create_user(create_new_user: UserCreate):
     # Hash the password and prepare the new user request for the database
     new_user_request = CreateUserDatabase(
         username=create_new_user.username,
-        hashed_password=bcrypt_context.hash(create_new_user.password),  # Hash the user's password
+        hashed_password=await password_hasher.hash(create_new_user.password),  # Hash the user's password
         email=create_new_user.email,
         name=create_new_user.name,
         wallet_address=create_new_user.wallet_address
     )
 
     # Store the new user in the database
-    Database.create_user(user_data=new_user_request)
+    await Database.create_user(user_data=new_user_request)
     # Return a success message after the user is created
     return {'message': f'User {new_user_request.username} created successfully'}
 
@@ -116,10 +223,10 @@ async def generate_token(form_data: OAuth2PasswordRequestForm = Depends()):
         HTTPException: If the username or password is incorrect.
     """
     # Retrieve the hashed password for the provided username from the database
-    hashed_pass = Database.get_user_pass(username=form_data.username)
+    hashed_pass = await Database.get_user_pass(username=form_data.username)
 
     # Verify if the password is correct using the hashed password
-    if not hashed_pass or not bcrypt_context.verify(form_data.password, hashed_pass):
+    if not hashed_pass or not await password_hasher.verify(form_data.password, hashed_pass):
         # Raise an exception if the credentials are incorrect
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Incorrect username or password')
 
@@ -144,4 +251,22 @@ async def verify_token(token: str = Depends(oauth2_bearer)):
     token_verifier(token=token)
 
     # Return a message if the token is valid
-    return {"message": "token is valid"}
\ No newline at end of file
+    return {"message": "token is valid"}
+
+@router.post("/logout")
+async def logout(token: str = Depends(oauth2_bearer)):
+    """
+    Revoke the provided JWT token.
+
+    Args:
+        token (str): The JWT token to revoke (injected by OAuth2PasswordBearer).
+
+    Returns:
+        dict: A success message confirming the revocation.
+    """
+    # Only valid tokens can be revoked
+    payload = token_verifier(token=token)
+    token_cache.revoke(token, expires_at=payload["exp"])
+
+    # Return a message once the token is revoked
+    return {"message": "token revoked"}
@@ -0,0 +1,334 @@
+"""
+Local stand-ins for Pinecone, the Sentence Transformer encoder and the GitLab raw server, plus a
+synthetic MITRE / ExploitDB shaped corpus, so PineconeDB and RagModel can be benchmarked and load
+tested offline. The LLM stand-in is llm.LocalProvider.
+"""
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class FakeEncoder:
+    def __init__(self, dimension=1024, latency=0.0):
+        """
+        Deterministic stand-in for SentenceTransformer using signed feature hashing of the words,
+        so texts sharing words get similar vectors
+
+        Args:
+            dimension (int, optional): Embedding dimension, matches the index dimension
+            latency (float, optional): Simulated seconds per encode call
+        """
+        self.dimension = dimension
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in _TOKEN_PATTERN.findall(text.lower()):
+            digest = zlib.crc32(token.encode())
+            vector[digest % self.dimension] += 1.0 if digest & 0x80000000 else -1.0
+        return vector
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        single = isinstance(sentences, str)
+        vectors = np.stack([self._embed(text) for text in ([sentences] if single else sentences)])
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+        return vectors[0] if single else vectors
+
+
+class FakeQueryResponse:
+    def __init__(self, matches, namespace):
+        self.matches = [SimpleNamespace(**match) for match in matches]
+        self.namespace = namespace
+        self._matches = matches
+
+    def to_dict(self):
+        return {"matches": [dict(match) for match in self._matches], "namespace": self.namespace}
+
+
+class FakeIndex:
+    def __init__(self, latency=0.0):
+        """
+        In-memory, brute force cosine similarity index with the Pinecone Index interface
+
+        Args:
+            latency (float, optional): Simulated network round-trip per call in seconds
+        """
+        self.latency = latency
+        self._namespaces = {}  # namespace -> {"ids": [], "vectors": [], "metadata": [], "matrix": None}
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace=""):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            store = self._namespaces.setdefault(namespace, {"ids": [], "vectors": [], "metadata": [], "matrix": None})
+            for vector in vectors:
+                vector_id, values, metadata = vector if isinstance(vector, tuple) else (
+                    vector["id"], vector["values"], vector.get("metadata", {}))
+                store["ids"].append(vector_id)
+                store["vectors"].append(np.asarray(values, dtype=np.float32))
+                store["metadata"].append(metadata)
+            store["matrix"] = None
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k=10, include_metadata=False, namespace="", include_values=False, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            if not store or not store["ids"]:
+                return FakeQueryResponse([], namespace)
+            if store["matrix"] is None:
+                store["matrix"] = np.stack(store["vectors"])
+            matrix, ids, metadata = store["matrix"], store["ids"], store["metadata"]
+        scores = matrix @ np.asarray(vector, dtype=np.float32)
+        top = np.argsort(-scores)[:top_k]
+        matches = []
+        for i in top:
+            match = {"id": ids[i], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = metadata[i]
+            if include_values:
+                match["values"] = matrix[i].tolist()
+            matches.append(match)
+        return FakeQueryResponse(matches, namespace)
+
+    def describe_index_stats(self):
+        with self._lock:
+            return {"namespaces": {name: {"vector_count": len(store["ids"])} for name, store in self._namespaces.items()}}
+
+
+class FakePinecone:
+    def __init__(self, latency=0.0):
+        """
+        Pinecone client stand-in handing out FakeIndex instances
+
+        Args:
+            latency (float, optional): Simulated latency of every index call
+        """
+        self.latency = latency
+        self._indexes = {}
+
+    def list_indexes(self):
+        return SimpleNamespace(names=lambda: list(self._indexes))
+
+    def create_index(self, name, **kwargs):
+        self._indexes.setdefault(name, FakeIndex(latency=self.latency))
+
+    def Index(self, name):
+        return self._indexes.setdefault(name, FakeIndex(latency=self.latency))
+
+
+class FakeGitLabServer:
+    def __init__(self, latency=0.05, file_size=2048):
+        """
+        Local HTTP server standing in for the GitLab raw file endpoint
+
+        Args:
+            latency (float, optional): Simulated seconds per request
+            file_size (int, optional): Size in bytes of every served file
+        """
+        latency_seconds = latency
+        body = ("/* synthetic exploit */\n" + "int main(void) { return 0; }\n" * (file_size // 29 + 1))[:file_size].encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(latency_seconds)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+_GROUPS = ["APT28", "APT29", "Lazarus Group", "FIN7", "Turla", "Sandworm Team", "Kimsuky", "OilRig", "Wizard Spider", "Carbanak"]
+_TECHNIQUES = ["Spearphishing Attachment", "Credential Dumping", "PowerShell", "Scheduled Task", "Process Injection",
+               "Pass the Hash", "DLL Side-Loading", "Registry Run Keys", "Data Encrypted for Impact", "Exploit Public-Facing Application",
+               "Remote Desktop Protocol", "Web Shell", "Command and Scripting Interpreter", "Masquerading", "Ingress Tool Transfer"]
+_MALWARE = ["Mimikatz", "Cobalt Strike", "Emotet", "TrickBot", "Ryuk", "PlugX", "Industroyer", "BlackEnergy", "Conti", "QakBot"]
+_PRODUCTS = ["Apache Struts", "WordPress Plugin", "Microsoft Exchange", "OpenSSH", "Linux Kernel", "Windows SMB",
+             "Joomla", "vBulletin", "Cisco IOS", "Oracle WebLogic", "PHP", "Drupal", "Jenkins", "ProFTPD", "Nginx"]
+_VULNS = ["Remote Code Execution", "SQL Injection", "Local Privilege Escalation", "Buffer Overflow", "Cross-Site Scripting",
+          "Directory Traversal", "Denial of Service", "Authentication Bypass", "Arbitrary File Upload", "Command Injection"]
+_PLATFORMS = {"linux": "c", "windows": "py", "php": "php", "multiple": "rb", "linux_x86": "c", "hardware": "txt", "java": "java"}
+_MITRE_TYPES = ["intrusion-set", "malware", "tool", "course-of-action", "x-mitre-tactic", "campaign"]
+
+
+def generate_corpus(n_mitre=1000, n_exploits=1000, seed=0):
+    """
+    Generate a synthetic corpus shaped like the filtered MITRE ATT&CK and ExploitDB data
+
+    Args:
+        n_mitre (int, optional): Number of MITRE records
+        n_exploits (int, optional): Number of ExploitDB records
+        seed (int, optional): Random seed, the corpus is deterministic for a given seed
+
+    Returns:
+        dict: Namespace ("mitre_stix", "exploit_db") to list of records
+    """
+    rng = random.Random(seed)
+    mitre = []
+    for i in range(n_mitre):
+        group, technique, malware = rng.choice(_GROUPS), rng.choice(_TECHNIQUES), rng.choice(_MALWARE)
+        record_type = rng.choice(_MITRE_TYPES)
+        mitre.append({
+            "id": f"{record_type}--{rng.getrandbits(128):032x}",
+            "name": f"{group} {technique}" if record_type != "malware" else malware,
+            "description": (
+                f"{group} has used {technique} to gain access to victim networks, deploying {malware} "
+                f"for persistence and lateral movement. Observed in {rng.randint(2010, 2024)} campaigns "
+                f"against {rng.choice(['government', 'energy', 'finance', 'healthcare', 'telecom'])} targets."
+            ),
+            "type": record_type,
+            "created": f"{rng.randint(2017, 2023)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00.000Z",
+            "modified": f"{rng.randint(2023, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T00:00:00.000Z",
+        })
+    exploits = []
+    for i in range(n_exploits):
+        exploit_id = 10000 + i
+        platform = rng.choice(list(_PLATFORMS))
+        product = rng.choice(_PRODUCTS)
+        exploits.append({
+            "id": str(exploit_id),
+            "file": f"exploits/{platform}/{exploit_id}.{_PLATFORMS[platform]}",
+            "description": f"{product} {rng.randint(1, 9)}.{rng.randint(0, 9)} - {rng.choice(_VULNS)}",
+            "date_published": f"{rng.randint(2000, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "author": f"researcher{rng.randint(1, 500)}",
+            "type": rng.choice(["remote", "local", "webapps", "dos"]),
+            "platform": platform,
+            "port": str(rng.choice([0, 21, 22, 80, 443, 445, 3389, 8080])),
+        })
+    return {"mitre_stix": mitre, "exploit_db": exploits}
+
+
+def sample_labeled_queries(corpus, n, seed=1):
+    """
+    Build user-style questions about random records of the corpus, with the record they ask about
+
+    Returns:
+        list: n tuples (query, namespace, record ID)
+    """
+    rng = random.Random(seed)
+    templates = ["What is {}?", "Explain how {} works and how to detect it", "Give details about {}", "Is there an exploit for {}?"]
+    records = [(namespace, record) for namespace, records in corpus.items() for record in records]
+    queries = []
+    for _ in range(n):
+        namespace, record = rng.choice(records)
+        queries.append((rng.choice(templates).format(record.get("name") or record["description"]), namespace, record["id"]))
+    return queries
+
+
+def sample_queries(corpus, n, seed=1):
+    """
+    Build user-style questions about random records of the corpus
+
+    Returns:
+        list: n query strings
+    """
+    return [query for query, _, _ in sample_labeled_queries(corpus, n, seed)]
+
+
+def build_local_rag_model(NameSpaces=None, min_score=None, corpus_size=None, encoder_latency=None,
+                          index_latency=None, llm_first_token_latency=None, llm_tokens=None,
+                          llm_token_interval=None, encoder=None, **rag_kwargs):
+    """
+    Build a RagModel wired to the local stand-ins and loaded with a synthetic corpus
+
+    Unset arguments are read from the environment when called (MIN_SCORE, STANDIN_* variables), so
+    main.py picks up whatever the benchmark or load test exported. GitLab fetches go to
+    EXPLOITDB_RAW_BASE (or the exploit_raw_base keyword), point it at a running FakeGitLabServer.
+
+    Args:
+        NameSpaces (list, optional): Namespaces to search, defaults to every corpus namespace
+        min_score (float, optional): Minimum similarity score of a match
+        corpus_size (int, optional): Records generated per namespace
+        encoder_latency (float, optional): Simulated seconds per encode call
+        index_latency (float, optional): Simulated seconds per index call
+        llm_first_token_latency (float, optional): Simulated seconds before the first token
+        llm_tokens (int, optional): Tokens per generated answer
+        llm_token_interval (float, optional): Seconds between streamed tokens
+        encoder (optional): Real encoder to use instead of FakeEncoder
+        **rag_kwargs: Passed on to RagModel, e.g. llm to use a real LLM provider
+
+    Returns:
+        RagModel: Model backed entirely by local stand-ins
+    """
+    # imported here so the stand-ins above stay importable without the vector store dependencies
+    from docstore import DocStore
+    from llm import LocalProvider
+    from pineconedb import PineconeDB
+    from ragroute import RagModel
+    from rewrite import terms_from_records
+    from routing import NamespaceRouter, build_centroids
+
+    def setting(value, name, default, cast=float):
+        return value if value is not None else cast(os.getenv(name, default))
+
+    corpus = generate_corpus(
+        n_mitre=setting(corpus_size, "STANDIN_CORPUS_SIZE", 2000, int),
+        n_exploits=setting(corpus_size, "STANDIN_CORPUS_SIZE", 2000, int)
+    )
+    doc_store_path = rag_kwargs.setdefault("doc_store_path", os.getenv("DOC_STORE_PATH"))
+    pinecone_db = PineconeDB(
+        None, "bench-index",
+        doc_store=DocStore(doc_store_path) if doc_store_path else None,
+        pinecone_client=FakePinecone(latency=setting(index_latency, "STANDIN_INDEX_LATENCY", 0.02)),
+        model=encoder or FakeEncoder(latency=setting(encoder_latency, "STANDIN_ENCODER_LATENCY", 0.0))
+    )
+    for namespace, records in corpus.items():
+        pinecone_db.upsert_items(records, [record["id"] for record in records], namespace)
+    rag_model = RagModel(
+        None, None,
+        NameSpaces=NameSpaces or list(corpus),
+        Index_Name="bench-index",
+        min_score=setting(min_score, "MIN_SCORE", 0.2),
+        llm=rag_kwargs.pop("llm", None) or LocalProvider(
+            setting(llm_first_token_latency, "STANDIN_LLM_FIRST_TOKEN", 0.3),
+            setting(llm_tokens, "STANDIN_LLM_TOKENS", 200, int),
+            setting(llm_token_interval, "STANDIN_LLM_TOKEN_INTERVAL", 0.005)
+        ),
+        pinecone_db=pinecone_db,
+        **rag_kwargs
+    )
+    if rag_model.Router is not None and not rag_model.Router._centroid_names:
+        # stands in for the ROUTER_CENTROIDS_PATH centroids built from the real data
+        rag_model.Router = NamespaceRouter(
+            rag_model.Name_Spaces, centroids=build_centroids(pinecone_db.model, corpus), top_k=rag_model.Router.top_k)
+    if rag_model.Rewriter is not None:
+        # stands in for the REWRITE_TERMS_PATH dictionary built from the real data
+        rag_model.Rewriter.add_terms(terms_from_records(record for records in corpus.values() for record in records))
+    return rag_model
@@ -0,0 +1,272 @@
+"""
+Offline benchmark of the RAG pipeline against the local stand-ins in bench_fakes
+
+    python bench_rag.py --scenario all --queries 200 --concurrency 8
+    python bench_rag.py --scenario e2e --llm-first-token 0.5 --json results.json
+
+Every scenario reports p50/p95/p99 latency and throughput. The e2e scenario drives `/query` on
+the FastAPI app in-process (main.py started with USE_LOCAL_STANDINS=true).
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bench_fakes import FakeGitLabServer, generate_corpus, sample_queries, sample_labeled_queries
+
+
+def percentile(sorted_values, pct):
+    # nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(name, latencies, wall_time, errors=0):
+    """
+    Reduce per-call latencies to the reported statistics
+
+    Returns:
+        dict: Percentiles in milliseconds and throughput in calls per second
+    """
+    latencies = sorted(latencies)
+    return {
+        "scenario": name,
+        "calls": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "throughput_per_s": round(len(latencies) / wall_time, 2) if wall_time else 0.0,
+    }
+
+
+def run_concurrently(name, fn, inputs, concurrency):
+    """
+    Call fn on every input from a pool of `concurrency` threads and time each call
+    """
+    errors = 0
+
+    def timed_call(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    latencies = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(timed_call, item) for item in inputs]:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors += 1
+                print(f"{name} call failed: {e}")
+    return summarize(name, latencies, time.perf_counter() - start, errors)
+
+
+def bench_encode(rag_model, queries, args):
+    return run_concurrently("encode", rag_model.Pinecone_DB.create_embedding, queries, args.concurrency)
+
+
+def bench_retrieve(rag_model, queries, args):
+    # rewrite + vector search + doc store hydration, as done before context assembly
+    def retrieve(query):
+        return rag_model._hydrate_records(rag_model._retrieve_matches(query))
+    return run_concurrently("retrieve", retrieve, queries, args.concurrency)
+
+
+def bench_assemble(rag_model, queries, args):
+    # retrieval results are computed up front, only context assembly (incl. GitLab fetches) is timed
+    results = []
+    for query in queries:
+        query_matches = rag_model._search(query)
+        results.append(rag_model._with_vector_ids(query_matches, rag_model._hydrate_records(query_matches)))
+    rag_model._gitlab_cache.clear()
+    return run_concurrently("assemble", rag_model._assemble_context, results, args.concurrency)
+
+
+async def _bench_e2e(queries, args):
+    import httpx
+    import main
+
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def one(query):
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/query", params={"query": query})
+                    if response.status_code != 200:
+                        errors += 1
+                        return
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(query) for query in queries))
+            wall_time = time.perf_counter() - start
+    return summarize("e2e", latencies, wall_time, errors)
+
+
+def bench_e2e(rag_model, queries, args):
+    return asyncio.run(_bench_e2e(queries, args))
+
+
+def bench_rewrite_quality(rag_model, queries, args):
+    """
+    Compare the LLM and the local keyword rewrite on rewrite latency and retrieval quality
+
+    recall_at_k is the share of questions whose source record is among the matches of its
+    namespace, overlap_with_llm the mean Jaccard overlap with the matches of the LLM rewrite.
+    """
+    from ragroute import REWRITE_TEMPLATE
+    from rewrite import KeywordRewriter, terms_from_records
+
+    corpus = generate_corpus(n_mitre=args.corpus_size, n_exploits=args.corpus_size)
+    labeled = sample_labeled_queries(corpus, len(queries))
+    local_rewriter = KeywordRewriter(terms_from_records(record for records in corpus.values() for record in records))
+    rewriters = {
+        "llm": lambda query: rag_model.LLM.generate(
+            rag_model.Rewrite_Model, REWRITE_TEMPLATE.format(raw_query=query), timeout=rag_model.Rewrite_Timeout),
+        "local": local_rewriter.rewrite,
+    }
+    matched_ids = {}
+    results = []
+    for mode, rewriter in rewriters.items():
+        latencies, hits, ids = [], 0, []
+        start = time.perf_counter()
+        for query, namespace, record_id in labeled:
+            rewrite_start = time.perf_counter()
+            rewritten = rewriter(query)
+            latencies.append(time.perf_counter() - rewrite_start)
+            matches = rag_model._search(rewritten)
+            hits += record_id in {vector_id for vector_id, _ in matches.get(namespace, [])}
+            ids.append({vector_id for namespace_matches in matches.values() for vector_id, _ in namespace_matches})
+        matched_ids[mode] = ids
+        result = summarize(f"rewrite_{mode}", latencies, time.perf_counter() - start)
+        result["recall_at_k"] = round(hits / len(labeled), 4) if labeled else 0.0
+        results.append(result)
+    for result, mode in zip(results, rewriters):
+        overlaps = [len(a & b) / len(a | b) if a | b else 1.0 for a, b in zip(matched_ids[mode], matched_ids["llm"])]
+        result["overlap_with_llm"] = round(sum(overlaps) / len(overlaps), 4) if overlaps else 0.0
+    return results
+
+
+SCENARIOS = {
+    "encode": bench_encode,
+    "retrieve": bench_retrieve,
+    "assemble": bench_assemble,
+    "e2e": bench_e2e,
+    "rewrite_quality": bench_rewrite_quality,
+}
+
+
+def add_standin_arguments(parser):
+    """
+    Add the stand-in latency and corpus options shared with the load test
+    """
+    parser.add_argument("--corpus-size", type=int, default=2000, help="Records per namespace")
+    parser.add_argument("--min-score", type=float, default=0.2)
+    parser.add_argument("--encoder-latency", type=float, default=0.0, help="Seconds per encode call of the fake encoder")
+    parser.add_argument("--index-latency", type=float, default=0.02, help="Seconds per Pinecone call")
+    parser.add_argument("--gitlab-latency", type=float, default=0.05, help="Seconds per GitLab raw file request")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="Seconds before the LLM's first token")
+    parser.add_argument("--llm-tokens", type=int, default=200)
+    parser.add_argument("--llm-token-interval", type=float, default=0.005)
+    parser.add_argument("--speculative", action="store_true", help="Enable speculative retrieval")
+    parser.add_argument("--routing", action="store_true", help="Enable namespace routing")
+    parser.add_argument("--rewrite-mode", choices=["llm", "local"], default="llm", help="Query rewrite of the pipeline")
+    parser.add_argument("--doc-store", action="store_true", help="Hydrate records from a local doc store")
+
+
+def configure_standins(args, gitlab_base, workdir):
+    """
+    Export the stand-in settings read by bench_fakes.build_local_rag_model and main.py
+    """
+    os.environ.update({
+        "USE_LOCAL_STANDINS": "true",
+        "EXPLOITDB_RAW_BASE": gitlab_base,
+        "MIN_SCORE": str(args.min_score),
+        "REWRITE_MODE": args.rewrite_mode,
+        "NAMESPACES": "mitre_stix,exploit_db",
+        "STANDIN_CORPUS_SIZE": str(args.corpus_size),
+        "STANDIN_ENCODER_LATENCY": str(args.encoder_latency),
+        "STANDIN_INDEX_LATENCY": str(args.index_latency),
+        "STANDIN_LLM_FIRST_TOKEN": str(args.llm_first_token),
+        "STANDIN_LLM_TOKENS": str(args.llm_tokens),
+        "STANDIN_LLM_TOKEN_INTERVAL": str(args.llm_token_interval),
+        # main.py side effects stay inside the temporary directory
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": os.path.join(workdir, "bench.sqlite3"),
+        "LOG_QUEUE_DIR": os.path.join(workdir, "log_queue"),
+        "RATE_LIMIT_PER_MINUTE": "1000000000",
+        "RATE_LIMIT_BURST": "1000000000",
+    })
+    if args.doc_store:
+        os.environ["DOC_STORE_PATH"] = os.path.join(workdir, "docstore.sqlite3")
+    if args.speculative:
+        os.environ["SPECULATIVE_RETRIEVAL"] = "true"
+    if args.routing:
+        os.environ["NAMESPACE_ROUTING"] = "true"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline against local stand-ins")
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--real-encoder", default=None, help="Sentence Transformer model to use instead of the fake encoder (not used by e2e)")
+    parser.add_argument("--llm-provider", choices=["local", "gemini"], default="local",
+                        help="LLM used outside e2e, gemini needs GENAI_API_KEY")
+    add_standin_arguments(parser)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    queries = sample_queries(generate_corpus(n_mitre=args.corpus_size, n_exploits=args.corpus_size), args.queries)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir, FakeGitLabServer(latency=args.gitlab_latency) as gitlab:
+        configure_standins(args, gitlab.base_url, workdir)
+        # every query is measured, none may be shed by admission control
+        os.environ.update({"RAG_MAX_QUEUE": str(max(args.queries, 32)), "RAG_QUEUE_TIMEOUT": "600"})
+        # settings above are read at import time
+        from bench_fakes import build_local_rag_model
+        from llm import create_provider
+        encoder = None
+        if args.real_encoder:
+            from sentence_transformers import SentenceTransformer
+            encoder = SentenceTransformer(args.real_encoder, device="cpu")
+        # the local stand-in by default, a real provider makes rewrite_quality meaningful
+        llm = None if args.llm_provider == "local" else create_provider(os.getenv("GENAI_API_KEY"), args.llm_provider)
+        rag_model = None
+        for name in scenarios:
+            if name != "e2e" and rag_model is None:
+                rag_model = build_local_rag_model(
+                    min_score=args.min_score, corpus_size=args.corpus_size,
+                    encoder_latency=args.encoder_latency, index_latency=args.index_latency,
+                    llm_first_token_latency=args.llm_first_token, llm_tokens=args.llm_tokens,
+                    llm_token_interval=args.llm_token_interval, encoder=encoder,
+                    exploit_raw_base=gitlab.base_url, llm=llm,
+                )
+            outcome = SCENARIOS[name](rag_model, queries, args)
+            for result in outcome if isinstance(outcome, list) else [outcome]:
+                results.append(result)
+                quality = "".join(f" {key}={result[key]}" for key in ("recall_at_k", "overlap_with_llm") if key in result)
+                print(f"{result['scenario']:<15} calls={result['calls']:<5} errors={result['errors']:<3} "
+                      f"p50={result['p50_ms']:>9.2f}ms p95={result['p95_ms']:>9.2f}ms "
+                      f"p99={result['p99_ms']:>9.2f}ms throughput={result['throughput_per_s']:>8.2f}/s{quality}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
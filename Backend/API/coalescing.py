@@ -0,0 +1,142 @@
+import asyncio
+from starlette.concurrency import run_in_threadpool
+
+
+def normalize_query(query: str):
+    """
+    Normalize a user query into a coalescing key (case and whitespace insensitive)
+
+    Args:
+        query (str): Raw user query
+
+    Returns:
+        str: Normalized query
+    """
+    return " ".join(query.lower().split())
+
+
+class _Broadcast:
+    def __init__(self):
+        """
+        Replayable fan-out of one async stream to any number of subscribers
+        """
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._waiter = asyncio.Event()
+
+    def _notify(self):
+        # wake everyone waiting on the current event, later waits use a fresh one
+        self._waiter.set()
+        self._waiter = asyncio.Event()
+
+    async def pump(self, source):
+        """
+        Drain the source stream into the shared chunk buffer
+        """
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+
+    async def subscribe(self):
+        """
+        Yield every chunk from the start of the stream, then follow it live
+        """
+        index = 0
+        while True:
+            waiter = self._waiter
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            await waiter.wait()
+
+
+class QueryCoalescer:
+    def __init__(self):
+        """
+        Single-flight coalescing of identical in-flight requests
+
+        Concurrent callers using the same key share one execution; the entry is dropped as soon
+        as it completes, so later callers start a fresh one.
+        """
+        self._calls = {}
+        self._streams = {}
+
+    def in_flight_call(self, key):
+        """
+        Check whether a run() with this key is running and can be joined
+        """
+        return key in self._calls
+
+    def in_flight_stream(self, key):
+        """
+        Check whether a stream() with this key is running and can be joined
+        """
+        return key in self._streams
+
+    async def run(self, key, func, *args, **kwargs):
+        """
+        Run a blocking function in the threadpool, or join the identical call already running
+
+        Args:
+            key (str): Coalescing key
+            func (callable): Blocking function to execute
+            *args, **kwargs: Arguments for func
+
+        Returns:
+            Any: The (shared) result of func
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(func, *args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # a waiter going away must not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    async def stream(self, key, source_factory):
+        """
+        Subscribe to a shared stream, starting it if no identical stream is in flight
+
+        Subscribers joining late replay the chunks produced so far. The source is cancelled once
+        its last subscriber goes away.
+
+        Args:
+            key (str): Coalescing key
+            source_factory (callable): Returns the async iterator to share
+
+        Yields:
+            Any: Chunks produced by the shared source
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.ensure_future(broadcast.pump(source_factory()))
+            broadcast.task.add_done_callback(lambda _: self._forget_stream(key, broadcast))
+        broadcast.subscribers += 1
+        try:
+            async for chunk in broadcast.subscribe():
+                yield chunk
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.finished:
+                # nobody is listening anymore, stop the retrieval and generation work
+                self._forget_stream(key, broadcast)
+                broadcast.task.cancel()
+
+    def _forget_stream(self, key, broadcast):
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
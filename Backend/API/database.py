@@ -1,29 +1,379 @@
+import asyncio
 import os
+import sqlite3
+import threading
+from contextlib import asynccontextmanager
 from fastapi import HTTPException  # Import HTTPException to handle API errors
 from starlette import status  # Import HTTP status codes for consistent error handling
 from dotenv import load_dotenv  # Import to load environment variables from .env file
-from mysql.connector import pooling, Error  # Import MySQL pooling and error handling
 from models import CreateUserDatabase  # Import a model for user data
 
 # Load environment variables from the .env file
 load_dotenv(dotenv_path='API.env')
 
-# Create a connection pool for MySQL to efficiently manage multiple connections
-connection_pool = pooling.MySQLConnectionPool(
-    pool_name="mypool",  # Name for the connection pool, can be customized
-    pool_size=5,  # Number of connections in the pool, can be adjusted based on load
-    pool_reset_session=True,  # Resets the session state when a connection is reused
-    host=os.getenv('MYSQL_HOST'),  # Hostname of the MySQL database from .env file
-    database=os.getenv('MYSQL_DATABASE'),  # Database name from .env file
-    user=os.getenv('MYSQL_USER'),  # MySQL user from .env file
-    password=os.getenv('MYSQL_PASSWORD')  # MySQL password from .env file
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').lower()  # 'mysql' in production, 'sqlite' for local testing
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))  # Maximum number of pooled connections
+DB_ACQUIRE_TIMEOUT = float(os.getenv('DB_ACQUIRE_TIMEOUT', 5.0))  # Seconds to wait for a free connection
+
+# Schema created by the migration (python database.py), not by the API: its user needs no DDL
+# privileges. Registration relies on the UNIQUE keys of Users, the API refuses to start without them.
+MYSQL_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS Users ("
+    "id INT AUTO_INCREMENT PRIMARY KEY, "
+    "email VARCHAR(255) NOT NULL, "
+    "username VARCHAR(255) NOT NULL, "
+    "hashed_password VARCHAR(255) NOT NULL, "
+    "wallet_address VARCHAR(255), "
+    "name VARCHAR(255) NOT NULL, "
+    "UNIQUE KEY uq_users_username (username), "
+    "UNIQUE KEY uq_users_email (email))",
+    "CREATE TABLE IF NOT EXISTS LogReports ("
+    "id CHAR(36) PRIMARY KEY, "
+    "owner VARCHAR(255) NOT NULL, "
+    "content TEXT NOT NULL, "
+    "token_address VARCHAR(255) NOT NULL, "
+    "reward VARCHAR(255) NOT NULL, "
+    "submitted_at DOUBLE NOT NULL, "
+    "duplicate_of CHAR(36) NULL)",
+)
+# UNIQUE keys added to a Users table created before registration relied on them
+MYSQL_USERS_UNIQUE_KEYS = {"username": "uq_users_username", "email": "uq_users_email"}
+
+
+class MySQLBackend:
+    def __init__(self, pool_size=DB_POOL_SIZE, acquire_timeout=DB_ACQUIRE_TIMEOUT):
+        """
+        Async MySQL access through an aiomysql connection pool
+
+        Args:
+            pool_size (int, optional): Maximum number of connections in the pool
+            acquire_timeout (float, optional): Seconds to wait for a free connection
+        """
+        import aiomysql  # only needed for the MySQL backend
+        self._aiomysql = aiomysql
+        self.errors = (aiomysql.Error,)
+        self.integrity_errors = (aiomysql.IntegrityError,)
+        self.insert_ignore = "INSERT IGNORE"
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+        self.waiting = 0
+        self.acquire_timeouts = 0
+
+    async def _get_pool(self):
+        # The pool is bound to the running event loop, so it is created on first use
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    pool = await self._aiomysql.create_pool(
+                        host=os.getenv('MYSQL_HOST'),  # Hostname of the MySQL database from .env file
+                        port=int(os.getenv('MYSQL_PORT', 3306)),
+                        db=os.getenv('MYSQL_DATABASE'),  # Database name from .env file
+                        user=os.getenv('MYSQL_USER'),  # MySQL user from .env file
+                        password=os.getenv('MYSQL_PASSWORD'),  # MySQL password from .env file
+                        minsize=1,
+                        maxsize=self.pool_size,
+                        pool_recycle=3600,  # Reconnect connections idle for an hour
+                        # reads and single statements end their own transaction, a connection left
+                        # inside one would be closed by pool.release() instead of going back to the pool
+                        autocommit=True
+                    )
+                    self._pool = pool
+        return self._pool
+
+    async def fetchall(self, query: str, params: tuple = ()):
+        async with self.connection() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params)
+                return await cursor.fetchall()
+
+    async def _unique_columns(self):
+        # columns carrying a single-column UNIQUE key (or the primary key) of Users
+        rows = await self.fetchall(
+            "SELECT index_name, GROUP_CONCAT(column_name ORDER BY seq_in_index) FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'Users' AND non_unique = 0 GROUP BY index_name"
+        )
+        return {columns.lower() for _, columns in rows if "," not in columns}
+
+    async def check_schema(self):
+        """
+        Check that the tables and the UNIQUE keys registration relies on exist
+
+        Raises:
+            RuntimeError: If any is missing, run the migration (python database.py) first
+        """
+        tables = {row[0].lower() for row in await self.fetchall(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE()")}
+        missing = [f"table {table}" for table in ("Users", "LogReports") if table.lower() not in tables]
+        if not missing:
+            unique_columns = await self._unique_columns()
+            missing = [f"UNIQUE key on Users.{column}" for column in MYSQL_USERS_UNIQUE_KEYS if column not in unique_columns]
+        if missing:
+            raise RuntimeError(f"Database schema is missing {', '.join(missing)}, run python database.py to migrate it")
+
+    async def migrate(self):
+        """
+        Create the missing tables and add the UNIQUE keys to a Users table created without them
+
+        Raises:
+            aiomysql.Error: E.g. if existing duplicate usernames or emails prevent a UNIQUE key
+        """
+        async with self.connection() as connection:
+            async with connection.cursor() as cursor:
+                for statement in MYSQL_SCHEMA:
+                    await cursor.execute(statement)
+        unique_columns = await self._unique_columns()
+        for column, key_name in MYSQL_USERS_UNIQUE_KEYS.items():
+            if column not in unique_columns:
+                print(f"Adding UNIQUE key {key_name} on Users.{column}")
+                await self.execute(f"ALTER TABLE Users ADD UNIQUE KEY {key_name} ({column})", ())
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Borrow a connection from the pool
+
+        Raises:
+            RuntimeError: If no connection frees up within the acquire timeout
+        """
+        pool = await self._get_pool()
+        self.waiting += 1
+        try:
+            connection = await asyncio.wait_for(pool.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise RuntimeError("Database error: timed out waiting for a pooled connection")
+        finally:
+            self.waiting -= 1
+        try:
+            yield connection
+        finally:
+            pool.release(connection)
+
+    async def fetchone(self, query: str, params: tuple):
+        async with self.connection() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params)
+                return await cursor.fetchone()
+
+    async def execute(self, query: str, params: tuple):
+        async with self.connection() as connection:
+            async with connection.cursor() as cursor:
+                # a single statement, committed by autocommit
+                await cursor.execute(query, params)
+                return cursor.rowcount
+
+    async def executemany(self, query: str, rows: list):
+        async with self.connection() as connection:
+            async with connection.cursor() as cursor:
+                # explicit transaction, other statements than INSERT ... VALUES run one by one
+                await connection.begin()
+                try:
+                    # aiomysql folds INSERT ... VALUES batches into multi-row statements
+                    await cursor.executemany(query, rows)
+                    await connection.commit()
+                except Exception:
+                    await connection.rollback()
+                    raise
+                return cursor.rowcount
+
+    @staticmethod
+    def is_duplicate(error):
+        # ER_DUP_ENTRY, raised when a UNIQUE constraint rejects the row
+        return bool(error.args) and error.args[0] == 1062
+
+    def stats(self):
+        """
+        Snapshot of the pool utilization
+
+        Returns:
+            dict: Pool size, connections in use and idle, waiters and acquire timeouts
+        """
+        size = self._pool.size if self._pool else 0
+        free = self._pool.freesize if self._pool else 0
+        return {
+            "backend": "mysql",
+            "max_size": self.pool_size,
+            "size": size,
+            "in_use": size - free,
+            "idle": free,
+            "waiting": self.waiting,
+            "acquire_timeouts": self.acquire_timeouts,
+        }
+
+
+class SQLiteBackend:
+    def __init__(self, db_path=os.getenv('SQLITE_PATH', 'datin.sqlite3'),
+                 pool_size=DB_POOL_SIZE, acquire_timeout=DB_ACQUIRE_TIMEOUT):
+        """
+        SQLite stand-in for local testing, with the same interface and limits as MySQLBackend
+
+        Args:
+            db_path (str, optional): Path of the SQLite database file
+            pool_size (int, optional): Maximum number of concurrent connections
+            acquire_timeout (float, optional): Seconds to wait for a free connection
+        """
+        self.errors = (sqlite3.Error,)
+        self.integrity_errors = (sqlite3.IntegrityError,)
+        self.insert_ignore = "INSERT OR IGNORE"
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self._slots = asyncio.Semaphore(pool_size)
+        self.in_use = 0
+        self.waiting = 0
+        self.acquire_timeouts = 0
+        # one connection per worker thread, so sqlite3's prepared statement cache is reused
+        self._local = threading.local()
+        connection = sqlite3.connect(self.db_path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS Users ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "email TEXT NOT NULL UNIQUE, "
+                "username TEXT NOT NULL UNIQUE, "
+                "hashed_password TEXT NOT NULL, "
+                "wallet_address TEXT, "
+                "name TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS LogReports ("
+                "id TEXT PRIMARY KEY, "
+                "owner TEXT NOT NULL, "
+                "content TEXT NOT NULL, "
+                "token_address TEXT NOT NULL, "
+                "reward TEXT NOT NULL, "
+                "submitted_at REAL NOT NULL, "
+                "duplicate_of TEXT)"
+            )
+            connection.commit()
+        finally:
+            connection.close()
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Reserve a connection slot
+
+        Raises:
+            RuntimeError: If no slot frees up within the acquire timeout
+        """
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise RuntimeError("Database error: timed out waiting for a pooled connection")
+        finally:
+            self.waiting -= 1
+        self.in_use += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._slots.release()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=self.acquire_timeout, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def _run(self, query: str, params: tuple, fetch: bool):
+        # MySQL style placeholders, so the queries in Database work on both backends
+        connection = self._connection()
+        with connection:  # commits on success, rolls back on error
+            cursor = connection.execute(query.replace('%s', '?'), params)
+            return cursor.fetchone() if fetch else cursor.rowcount
+
+    @staticmethod
+    def is_duplicate(error):
+        return isinstance(error, sqlite3.IntegrityError) and "UNIQUE" in str(error)
+
+    def _run_all(self, query: str, params: tuple):
+        connection = self._connection()
+        with connection:
+            return connection.execute(query.replace('%s', '?'), params).fetchall()
+
+    def _run_many(self, query: str, rows: list):
+        connection = self._connection()
+        with connection:
+            return connection.executemany(query.replace('%s', '?'), rows).rowcount
+
+    async def fetchone(self, query: str, params: tuple):
+        async with self.connection():
+            return await asyncio.to_thread(self._run, query, params, True)
+
+    async def fetchall(self, query: str, params: tuple = ()):
+        async with self.connection():
+            return await asyncio.to_thread(self._run_all, query, params)
+
+    async def executemany(self, query: str, rows: list):
+        async with self.connection():
+            return await asyncio.to_thread(self._run_many, query, rows)
+
+    async def execute(self, query: str, params: tuple):
+        async with self.connection():
+            return await asyncio.to_thread(self._run, query, params, False)
+
+    async def check_schema(self):
+        # the stand-in creates its tables, UNIQUE constraints included, when it opens the file
+        pass
+
+    async def migrate(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {
+            "backend": "sqlite",
+            "max_size": self.pool_size,
+            "size": self.in_use,
+            "in_use": self.in_use,
+            "idle": 0,
+            "waiting": self.waiting,
+            "acquire_timeouts": self.acquire_timeouts,
+        }
+
+
+def _create_backend():
+    if DB_BACKEND == 'sqlite':
+        return SQLiteBackend()
+    if DB_BACKEND == 'mysql':
+        return MySQLBackend()
+    raise ValueError(f"Unknown DB_BACKEND: {DB_BACKEND}. Valid options are: mysql, sqlite")
+
+
+# Shared async backend used by every Database call
+backend = _create_backend()
+
+# Statements are built once; registration relies on UNIQUE constraints on Users.username and
+# Users.email, created with the tables (MYSQL_SCHEMA, SQLiteBackend)
+_USER_FIELDS = tuple(CreateUserDatabase.model_fields.keys())
+INSERT_USER_QUERY = f"INSERT INTO Users ({', '.join(_USER_FIELDS)}) VALUES ({', '.join(['%s'] * len(_USER_FIELDS))})"
+SELECT_USER_PASS_QUERY = "SELECT hashed_password FROM Users WHERE username = %s"
+# ignoring duplicate ids keeps replays from the ingestion journal idempotent
+INSERT_LOG_REPORTS_QUERY = (
+    f"{backend.insert_ignore} INTO LogReports (id, owner, content, token_address, reward, submitted_at, duplicate_of) "
+    "VALUES (%s, %s, %s, %s, %s, %s, %s)"
 )
 
 
 class Database:
 
     @staticmethod
-    def check_user(username: str, usr_email: str):
+    async def check_user(username: str, usr_email: str):
         """
         Check if a user exists in the database by username or email.
 
@@ -35,28 +385,14 @@ class Database:
             tuple or None: Returns a tuple if the user is found, otherwise None.
         """
         try:
-            # Get a connection from the pool
-            connection = connection_pool.get_connection()
-
-            # Check if the connection is successfully established
-            if connection.is_connected():
-                cursor = connection.cursor(buffered=True)  # Create a buffered cursor to handle results efficiently
-                # Execute SQL query to check if the username or email exists
-                cursor.execute(f"SELECT username FROM Users WHERE username = '{username}' or email='{usr_email}'")
-                value = cursor.fetchone()  # Fetch one result from the query
-                return value
-
-        except Error as e:
+            # Execute SQL query to check if the username or email exists
+            return await backend.fetchone("SELECT username FROM Users WHERE username = %s or email = %s", (username, usr_email))
+        except backend.errors as e:
             # Raise a runtime error if any database error occurs
             raise RuntimeError(f"Database error: {e}")
-        finally:
-            # Always close the cursor and connection to prevent resource leaks
-            if connection.is_connected():
-                cursor.close()
-                connection.close()
 
     @staticmethod
-    def create_user(user_data: CreateUserDatabase):
+    async def create_user(user_data: CreateUserDatabase):
         """
         Create a new user in the database.
 
@@ -70,101 +406,138 @@ class Database:
         Returns:
             int: Number of rows affected (should be 1 if user is successfully created).
         """
-        # Check if the user already exists based on username or email
-        user_exists = Database.check_user(user_data.username, user_data.email)
-
-        if user_exists:
-            # Raise an HTTP exception if the username or email is already taken
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Username already exists')
-
-        # Convert user data into a dictionary format for query parameters
-        user_data = user_data.model_dump()
-
-        # Create SQL query to insert user data into the Users table
-        query = f"INSERT INTO Users ({', '.join(user_data.keys())}) values (%s, %s, %s, %s, %s)"
-        params = tuple(user_data.values())  # Convert user data values into a tuple
+        # Single INSERT, the UNIQUE constraints reject taken usernames or emails atomically
+        params = tuple(getattr(user_data, field) for field in _USER_FIELDS)
 
         try:
-            # Get a connection from the pool
-            connection = connection_pool.get_connection()
+            # Execute the insert query with parameters, committed on success
+            rowcount = await backend.execute(INSERT_USER_QUERY, params)
+        except backend.integrity_errors as e:
+            if backend.is_duplicate(e):
+                # Raise an HTTP exception if the username or email is already taken
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Username already exists')
+            raise RuntimeError(f"Database error: {e}")
+        except backend.errors as e:
+            # Raise a runtime error if any database error occurs
+            raise RuntimeError(f"Database error: {e}")
 
-            # Check if the connection is successfully established
-            if connection.is_connected():
-                cursor = connection.cursor(buffered=True)  # Create a buffered cursor to handle the query
+        if rowcount != 1:
+            raise RuntimeError("Database error")
+        # Return the number of rows affected
+        return rowcount
 
-                # Execute the insert query with parameters
-                cursor.execute(query, params)
+    @staticmethod
+    async def get_user_pass(username: str):
+        """
+        Retrieve the hashed password of a user from the database based on the username.
 
-                # If exactly one row was affected, commit the transaction
-                if cursor.rowcount == 1:
-                    connection.commit()
-                else:
-                    raise Exception("Database error")
+        Args:
+            username (str): Username whose password is to be retrieved.
 
-                # Return the number of rows affected
-                return cursor.rowcount
+        Returns:
+            str or None: Returns the hashed password if the user is found, otherwise None.
 
-        except Error as e:
+        Raises:
+            RuntimeError: If a database error occurs.
+        """
+        try:
+            # Execute SQL query to retrieve the hashed password for the given username
+            value = await backend.fetchone(SELECT_USER_PASS_QUERY, (username,))
+        except backend.errors as e:
             # Raise a runtime error if any database error occurs
             raise RuntimeError(f"Database error: {e}")
+        return value[0] if value else None
 
-        finally:
-            # Always close the cursor and connection to prevent resource leaks
-            if connection.is_connected():
-                cursor.close()
-                connection.close()
+    @staticmethod
+    async def del_user(username:str, user_email:str):
+        try:
+            return await backend.execute("DELETE FROM Users WHERE username = %s AND email = %s", (username, user_email))
+        except backend.errors as e:
+            # Raise a runtime error if any database error occurs
+            raise RuntimeError(f"Database error: {e}")
 
     @staticmethod
-    def get_user_pass(username: str):
+    async def insert_log_reports(reports: list):
         """
-        Retrieve the hashed password of a user from the database based on the username.
+        Insert a batch of submitted log reports in one statement.
 
         Args:
-            username (str): Username whose password is to be retrieved.
+            reports (list): Report dicts with id, owner, content, tokenAddress, reward, submitted_at
+                and optionally duplicate_of (ID of the report it was clustered with).
 
         Returns:
-            str: Returns the hashed password if the user is found.
+            int: Number of rows inserted, reports already stored are skipped.
 
         Raises:
             RuntimeError: If a database error occurs.
         """
+        rows = [
+            (report['id'], report['owner'], report['content'], report['tokenAddress'], report['reward'],
+             report['submitted_at'], report.get('duplicate_of'))
+            for report in reports
+        ]
         try:
-            # Get a connection from the pool
-            connection = connection_pool.get_connection()
-
-            # Check if the connection is successfully established
-            if connection.is_connected():
-                cursor = connection.cursor()  # Create a cursor to execute the query
-                # Execute SQL query to retrieve the hashed password for the given username
-                cursor.execute(f"SELECT hashed_password FROM Users WHERE username = '{username}'")
-                value = cursor.fetchone()[0]  # Fetch one result from the query and get the first column value
-                return value
-
-        except Error as e:
+            return await backend.executemany(INSERT_LOG_REPORTS_QUERY, rows)
+        except backend.errors as e:
             # Raise a runtime error if any database error occurs
             raise RuntimeError(f"Database error: {e}")
 
-        finally:
-            # Always close the cursor and connection to prevent resource leaks
-            if connection.is_connected():
-                cursor.close()
-                connection.close()
-    
     @staticmethod
-    def del_user(username:str, user_email:str):
+    async def recent_log_reports(limit: int):
+        """
+        Fetch the most recently submitted log reports.
+
+        Args:
+            limit (int): Maximum number of reports returned.
+
+        Returns:
+            list: (id, content) tuples, oldest first.
+
+        Raises:
+            RuntimeError: If a database error occurs.
+        """
         try:
-            # Get a connection from the pool
-            connection = connection_pool.get_connection()
-
-            # Check if the connection is successfully established
-            if connection.is_connected():
-                cursor = connection.cursor()  # Create a cursor to execute the query
-                cursor.execute(f"DELETE FROM Users WHERE username = '{username}' AND email='{user_email}'")
-        except Error as e:
+            rows = await backend.fetchall(
+                "SELECT id, content FROM LogReports ORDER BY submitted_at DESC LIMIT %s", (limit,))
+        except backend.errors as e:
             # Raise a runtime error if any database error occurs
             raise RuntimeError(f"Database error: {e}")
-        finally:
-            # Always close the cursor and connection to prevent resource leaks
-            if connection.is_connected():
-                cursor.close()
-                connection.close()
\ No newline at end of file
+        return list(reversed(rows))
+
+    @staticmethod
+    async def check_schema():
+        """
+        Refuse to run against a database lacking the tables or UNIQUE keys the API relies on.
+
+        Raises:
+            RuntimeError: If the schema is missing anything, see MySQLBackend.check_schema.
+        """
+        await backend.check_schema()
+
+    @staticmethod
+    def pool_stats():
+        """
+        Connection pool utilization of the active backend.
+
+        Returns:
+            dict: Pool metrics, see MySQLBackend.stats.
+        """
+        return backend.stats()
+
+
+async def _migrate():
+    try:
+        await backend.migrate()
+        await backend.check_schema()
+    finally:
+        await backend.close()
+
+
+def main():
+    # one-off, run with a user allowed to create and alter tables: python database.py
+    asyncio.run(_migrate())
+    print("Database schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
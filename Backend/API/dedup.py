@@ -0,0 +1,188 @@
+import os
+import re
+import zlib
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv("API.env")
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = 3):
+    """
+    Split a text into word shingles (overlapping n-grams of normalized tokens)
+
+    Args:
+        text (str): Text to split
+        size (int, optional): Number of words per shingle
+
+    Returns:
+        set: Distinct shingles, a single shingle for texts shorter than size
+    """
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    if len(tokens) <= size:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+class MinHashLSH:
+    def __init__(self, num_perm=int(os.getenv("DEDUP_NUM_PERM", 64)),
+                 bands=int(os.getenv("DEDUP_BANDS", 8)),
+                 threshold=float(os.getenv("DEDUP_THRESHOLD", 0.8)),
+                 max_entries=int(os.getenv("DEDUP_MAX_ENTRIES", 200000)), seed=1):
+        """
+        Near-duplicate index over report contents using MinHash signatures and LSH banding
+
+        Args:
+            num_perm (int, optional): Number of hash permutations per signature
+            bands (int, optional): LSH bands, num_perm must be divisible by it. More bands catch
+                less similar pairs as candidates
+            threshold (float, optional): Estimated Jaccard similarity at which a report is a duplicate
+            max_entries (int, optional): Signatures kept in memory, the oldest ones are dropped
+            seed (int, optional): Seed of the permutation parameters
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_entries = max_entries
+        generator = np.random.default_rng(seed)
+        self._a = generator.integers(1, _MERSENNE_PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = generator.integers(0, _MERSENNE_PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._signatures = OrderedDict()  # key -> signature
+        self._buckets = [{} for _ in range(bands)]  # per band: band bytes -> set of keys
+
+    def signature(self, text: str):
+        """
+        Compute the MinHash signature of a text
+
+        Returns:
+            numpy.ndarray: uint64 array of length num_perm
+        """
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode()) for shingle in shingles(text)), dtype=np.uint64
+        )
+        # (a * h + b) mod p, truncated to 32 bits; wraparound in uint64 is part of the hash family
+        permuted = ((self._a * hashes + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, signature):
+        """
+        Find the most similar indexed entry at or above the threshold
+
+        Returns:
+            tuple: (key, estimated Jaccard similarity), or (None, 0.0) if there is no duplicate
+        """
+        candidates = set()
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(band.get(band_key, ()))
+        best_key, best_similarity = None, 0.0
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+        if best_similarity >= self.threshold:
+            return best_key, best_similarity
+        return None, 0.0
+
+    def add(self, key, signature):
+        """
+        Index a signature under a key, evicting the oldest entry once full
+        """
+        self._signatures[key] = signature
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(band_key, set()).add(key)
+        if len(self._signatures) > self.max_entries:
+            self._remove(*self._signatures.popitem(last=False))
+
+    def discard(self, key):
+        """
+        Remove the signature indexed under a key, if any
+        """
+        signature = self._signatures.pop(key, None)
+        if signature is not None:
+            self._remove(key, signature)
+
+    def _remove(self, key, signature):
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            keys = band.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del band[band_key]
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+class EmbeddingDeduper:
+    def __init__(self, threshold=float(os.getenv("DEDUP_EMBED_THRESHOLD", 0.95)),
+                 capacity=int(os.getenv("DEDUP_EMBED_CAPACITY", 50000))):
+        """
+        Cluster reports whose (normalized) embeddings are nearly identical to a recent report
+
+        Keeps a ring buffer of recent embeddings in a float32 matrix, so a batch is checked with
+        one matrix product instead of a vector index query per report.
+
+        Args:
+            threshold (float, optional): Cosine similarity at which a report joins a cluster
+            capacity (int, optional): Number of recent embeddings kept
+        """
+        self.threshold = threshold
+        self.capacity = capacity
+        self._vectors = None
+        self._ids = [None] * capacity
+        self._size = 0
+        self._next = 0
+
+    def find_duplicates(self, ids, embeddings):
+        """
+        Find, for each report of a batch, the earlier report it duplicates
+
+        Args:
+            ids (list): Report IDs of the batch
+            embeddings (numpy.ndarray): Normalized embeddings of the batch, one row per report
+
+        Returns:
+            list: ID of the duplicated report, or None, for each report
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        duplicates = [None] * len(ids)
+        if self._size:
+            similarities = embeddings @ self._vectors[:self._size].T
+            best = similarities.argmax(axis=1)
+            for i, j in enumerate(best):
+                if similarities[i, j] >= self.threshold and self._ids[j] != ids[i]:
+                    duplicates[i] = self._ids[j]
+        # duplicates inside the batch point at the first report of their cluster
+        within_batch = embeddings @ embeddings.T
+        for i in range(len(ids)):
+            if duplicates[i] is not None:
+                continue
+            for j in np.nonzero(within_batch[i, :i] >= self.threshold)[0]:
+                if duplicates[j] is None:
+                    duplicates[i] = ids[j]
+                    break
+        return duplicates
+
+    def add(self, ids, embeddings):
+        """
+        Remember the embeddings of stored (non duplicate) reports
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.capacity, embeddings.shape[1]), dtype=np.float32)
+        for report_id, embedding in zip(ids, embeddings):
+            self._vectors[self._next] = embedding
+            self._ids[self._next] = report_id
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
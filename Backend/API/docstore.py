@@ -0,0 +1,111 @@
+import json
+import os
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv('API.env')
+
+# SQLite caps the number of host parameters per statement, keep IN (...) lists below it
+_MAX_PARAMS = 900
+
+
+class DocStore:
+    def __init__(self, db_path=os.getenv('DOC_STORE_PATH', 'docstore.sqlite3')):
+        """
+        Initialize a local, read-optimized store of full record bodies keyed by vector ID
+
+        Args:
+            db_path (str, optional): Path of the SQLite database file
+        """
+        self.db_path = db_path
+        # sqlite3 connections can't be shared across threads, keep one per thread
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "id TEXT PRIMARY KEY, namespace TEXT NOT NULL, body TEXT NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        connection.commit()
+
+    def _connection(self):
+        """
+        Get (or open) the SQLite connection for the calling thread
+
+        Returns:
+            sqlite3.Connection: Connection configured for concurrent reads
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            # WAL lets readers run alongside the ingestion writer without blocking
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # Serve reads straight from the page cache via mmap (256 MiB)
+            connection.execute("PRAGMA mmap_size=268435456")
+            self._local.connection = connection
+        return connection
+
+    def put_many(self, records, namespace=""):
+        """
+        Insert or replace a batch of records
+
+        Args:
+            records (list): List of tuples (id, record dict)
+            namespace (str, optional): Pinecone namespace the records were upserted to
+        """
+        connection = self._connection()
+        connection.executemany(
+            "INSERT OR REPLACE INTO docs (id, namespace, body) VALUES (?, ?, ?)",
+            [(vector_id, namespace, json.dumps(record, ensure_ascii=False)) for vector_id, record in records]
+        )
+        connection.commit()
+
+    def get_many(self, ids):
+        """
+        Fetch the full record bodies for a batch of vector IDs
+
+        Args:
+            ids (list): Vector IDs to look up
+
+        Returns:
+            dict: Mapping of vector ID to record dict, IDs not in the store are omitted
+        """
+        ids = list(dict.fromkeys(ids))  # drop duplicates, keep order
+        connection = self._connection()
+        records = {}
+        for start in range(0, len(ids), _MAX_PARAMS):
+            chunk = ids[start:start + _MAX_PARAMS]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = connection.execute(f"SELECT id, body FROM docs WHERE id IN ({placeholders})", chunk)
+            for vector_id, body in rows:
+                records[vector_id] = json.loads(body)
+        return records
+
+    def iter_records(self, namespace=None):
+        """
+        Iterate over the stored record bodies
+
+        Args:
+            namespace (str, optional): Only yield the records of this namespace
+
+        Yields:
+            dict: Record bodies
+        """
+        connection = self._connection()
+        if namespace is None:
+            rows = connection.execute("SELECT body FROM docs")
+        else:
+            rows = connection.execute("SELECT body FROM docs WHERE namespace = ?", (namespace,))
+        for (body,) in rows:
+            yield json.loads(body)
+
+    def close(self):
+        """
+        Close the connection opened by the calling thread
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,223 @@
+"""
+Embedding export: the vectors computed at ingestion, persisted with their IDs and metadata so a
+new index (other region, other SIMILARITY) can be filled without running the encoder again
+
+An export is a directory holding
+    vectors.npy     float32 matrix, one row per vector, memory-mapped when read
+    records.jsonl   one {"id", "namespace", "metadata"} line per row, in row order
+    manifest.json   row count, dimension, the model the vectors come from and whether the
+                    export is complete, written last
+
+Ingestion writes one when EMBEDDING_EXPORT_DIR is set, the bulk load pushes it into an index:
+
+    python embedding_export.py --export exports/mitre_stix --index-name new-index --workers 8
+"""
+import argparse
+import json
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv("API.env")
+
+EMBEDDING_EXPORT_DIR = os.getenv("EMBEDDING_EXPORT_DIR")
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.jsonl"
+MANIFEST_FILE = "manifest.json"
+# .npy header reserved up front and written once the row count is known
+_HEADER_SIZE = 128
+
+
+def _npy_header(shape):
+    # version 1.0 .npy header: magic, header length, dict literal padded with spaces to _HEADER_SIZE
+    header = repr({"descr": "<f4", "fortran_order": False, "shape": shape})
+    header = header.ljust(_HEADER_SIZE - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class EmbeddingExportWriter:
+    def __init__(self, directory, model=None):
+        """
+        Stream vectors, IDs and metadata to an export directory
+
+        Rows are appended to vectors.npy as they come, its header gets the final shape on close().
+        The manifest of a previous export is removed first, so an interrupted export is never
+        mistaken for the old one.
+
+        Args:
+            directory (str): Export directory, created if missing, an existing export is replaced
+            model (str, optional): Encoder the vectors come from, recorded in the manifest
+        """
+        os.makedirs(directory, exist_ok=True)
+        try:
+            os.remove(os.path.join(directory, MANIFEST_FILE))
+        except FileNotFoundError:
+            pass
+        self.directory = directory
+        self.model = model
+        self.count = 0
+        self.dimension = None
+        self._vectors = open(os.path.join(directory, VECTORS_FILE), "wb")
+        self._vectors.write(b"\0" * _HEADER_SIZE)
+        self._records = open(os.path.join(directory, RECORDS_FILE), "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def append(self, ids, embeddings, metadata, namespace):
+        """
+        Append a batch of vectors
+
+        Args:
+            ids (list): Vector IDs
+            embeddings (array-like): One embedding per ID
+            metadata (list): Metadata upserted with each vector
+            namespace (str): Namespace the vectors belong to
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+        if embeddings.ndim != 2 or len(embeddings) != len(ids):
+            raise ValueError("Expected one embedding per ID")
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = embeddings.shape[1]
+            elif embeddings.shape[1] != self.dimension:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} doesn't match the export's {self.dimension}")
+            self._vectors.write(embeddings.tobytes())
+            self._records.writelines(
+                json.dumps({"id": vector_id, "namespace": namespace, "metadata": item}, ensure_ascii=False) + "\n"
+                for vector_id, item in zip(ids, metadata)
+            )
+            self.count += len(ids)
+
+    def close(self, complete=True):
+        """
+        Finish the export, an incomplete one (e.g. the upload failed) is marked as such in the manifest
+        """
+        with self._lock:
+            if self._vectors.closed:
+                return
+            self._vectors.seek(0)
+            self._vectors.write(_npy_header((self.count, self.dimension or 0)))
+            self._vectors.close()
+            self._records.close()
+            with open(os.path.join(self.directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump({"count": self.count, "dimension": self.dimension, "dtype": "float32",
+                           "normalized": True, "model": self.model, "complete": complete}, f, indent=2)
+        print(f"Exported {self.count} vectors to {self.directory}" + ("" if complete else " (incomplete)"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close(complete=exc_type is None)
+
+
+class EmbeddingExport:
+    def __init__(self, directory):
+        """
+        Read an export, the vectors are memory-mapped rather than loaded
+
+        Args:
+            directory (str): Export directory written by EmbeddingExportWriter
+
+        Raises:
+            ValueError: If the export has no manifest or is marked incomplete
+        """
+        self.directory = directory
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"{directory} has no manifest, the export was interrupted or is still being written")
+        if not self.manifest.get("complete", True):
+            raise ValueError(f"{directory} is an incomplete export, its upload failed")
+        self.vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        self.dimension = self.vectors.shape[1]
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def batches(self, batch_size=200):
+        """
+        Read the export in row order as batches of a single namespace
+
+        Yields:
+            tuple: (namespace, ids, vectors, metadata), vectors being a view of the memory map
+        """
+        start, namespace, ids, metadata = 0, None, [], []
+        with open(os.path.join(self.directory, RECORDS_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if ids and (record["namespace"] != namespace or len(ids) >= batch_size):
+                    yield namespace, ids, self.vectors[start:start + len(ids)], metadata
+                    start, ids, metadata = start + len(ids), [], []
+                namespace = record["namespace"]
+                ids.append(record["id"])
+                metadata.append(record["metadata"])
+        if ids:
+            yield namespace, ids, self.vectors[start:start + len(ids)], metadata
+
+
+def bulk_load(export, index, batch_size=200, workers=4, namespace_map=None):
+    """
+    Upsert an export into an index, several batches in flight at once
+
+    Args:
+        export (EmbeddingExport): Export to load
+        index: Pinecone compatible index
+        batch_size (int, optional): Vectors per upsert call
+        workers (int, optional): Concurrent upsert calls
+        namespace_map (dict, optional): Namespace of the export to namespace of the index
+
+    Returns:
+        int: Vectors upserted
+    """
+    namespace_map = namespace_map or {}
+    loaded = 0
+
+    def upsert(namespace, ids, vectors, metadata):
+        index.upsert(vectors=list(zip(ids, vectors.tolist(), metadata)), namespace=namespace_map.get(namespace, namespace))
+        return len(ids)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for batch_no, batch in enumerate(export.batches(batch_size), start=1):
+            pending.append(pool.submit(upsert, *batch))
+            # bounded read-ahead, the memory map is only paged in as batches go out
+            if len(pending) >= 2 * workers:
+                loaded += pending.pop(0).result()
+            if batch_no % 50 == 0:
+                print(f"Loaded {loaded}/{len(export)} vectors")
+        for future in pending:
+            loaded += future.result()
+    print(f"Bulk load completed: {loaded} vectors")
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load precomputed embeddings into an index without the encoder")
+    parser.add_argument("--export", required=True, help="Export directory written during ingestion")
+    parser.add_argument("--index-name", default=os.getenv("INDEX_NAME"), help="Target index, created if missing")
+    parser.add_argument("--namespace", action="append", default=[], help="Rename a namespace: export_name=index_name")
+    parser.add_argument("--batch-size", type=int, default=200, help="Vectors per upsert call")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent upsert calls")
+    args = parser.parse_args()
+
+    PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+    if not PINECONE_API_KEY:
+        raise ValueError("PINECONE_API_KEY environment variable is not set")
+    if not args.index_name:
+        raise ValueError("--index-name or INDEX_NAME is required")
+
+    from pineconedb import PineconeDB
+
+    export = EmbeddingExport(args.export)
+    # the encoder is loaded lazily, a bulk load never touches it
+    pinecone_db = PineconeDB(PINECONE_API_KEY, args.index_name, dimension=export.dimension)
+    namespace_map = dict(spec.split("=", 1) for spec in args.namespace)
+    bulk_load(export, pinecone_db.index, batch_size=args.batch_size, workers=args.workers, namespace_map=namespace_map)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from fastapi import HTTPException
+from starlette import status
+from dotenv import load_dotenv
+from database import Database
+from dedup import MinHashLSH, EmbeddingDeduper
+from models import LogReport
+
+load_dotenv("API.env")
+
+# Pinecone metadata is size limited, the full report lives in MySQL (and the doc store if configured)
+_METADATA_CONTENT_LIMIT = 2000
+# next to this module by default, not in whatever directory the server happens to be started from
+LOG_QUEUE_DIR = os.getenv("LOG_QUEUE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "log_queue"))
+
+
+class ReportJournal:
+    def __init__(self, directory):
+        """
+        Durable append-only queue of submitted reports on local disk
+
+        Reports are appended as JSON lines to `journal.log`; the consumer's position is kept in
+        `journal.offset` and the log is truncated once everything in it has been consumed.
+
+        Args:
+            directory (str): Directory holding the journal files
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "journal.log")
+        self.offset_path = os.path.join(directory, "journal.offset")
+        self._file = open(self.path, "ab")
+        self._lock = threading.Lock()
+
+    def append(self, lines):
+        """
+        Append a batch of encoded records and fsync once for the whole batch
+
+        Args:
+            lines (list): Newline terminated records as bytes
+        """
+        with self._lock:
+            self._file.write(b"".join(lines))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def read(self, offset, max_records):
+        """
+        Read up to max_records complete records starting at a byte offset
+
+        Lines that don't decode (e.g. a record torn by a crash mid-write) are logged and skipped.
+
+        Returns:
+            tuple: (list of record dicts, offset after the last record read)
+        """
+        records = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while len(records) < max_records:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # end of file, or a record still being written
+                try:
+                    records.append(json.loads(line))
+                except ValueError as e:
+                    print(f"Skipping corrupt log report journal record at offset {offset}: {e}")
+                offset += len(line)
+        return records, offset
+
+    def committed_offset(self):
+        """
+        Consumer position to resume from, 0 if the persisted one lies past the end of the log
+        """
+        try:
+            with open(self.offset_path, "r") as f:
+                offset = int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError as e:
+            print(f"Unreadable log report journal offset, replaying the journal: {e}")
+            return 0
+        if offset > os.path.getsize(self.path):
+            # the log was truncated without the offset being reset, replays are harmless
+            print(f"Log report journal offset {offset} is past the end of the log, replaying the journal")
+            return 0
+        return offset
+
+    def _write_offset(self, offset):
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.offset_path)
+
+    def commit(self, offset):
+        """
+        Persist the consumer position, truncating the log once it is fully consumed
+
+        Returns:
+            int: The offset to continue reading from
+        """
+        with self._lock:
+            if offset < os.path.getsize(self.path):
+                self._write_offset(offset)
+                return offset
+            # offset 0 is durable before the log is emptied, a crash in between replays it
+            self._write_offset(0)
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+        return 0
+
+    def close(self):
+        self._file.close()
+
+
+class LogReportIngestor:
+    def __init__(self, pinecone_db, namespace=os.getenv("NAMESPACE_LOGS", "log_reports"),
+                 queue_dir=LOG_QUEUE_DIR,
+                 batch_size=int(os.getenv("LOG_BATCH_SIZE", 256)),
+                 flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", 0.5))):
+        """
+        Ingestion pipeline for submitted log reports
+
+        Submissions are group-committed to the local journal (one fsync per batch of concurrent
+        submissions) and acknowledged; a background consumer then writes them to MySQL and embeds
+        them into their own namespace in batches. Delivery is at-least-once, both sinks are keyed
+        by the report ID so replays after a crash are harmless.
+
+        Args:
+            pinecone_db (PineconeDB): Vector store (and encoder) the reports are embedded into
+            namespace (str, optional): Namespace receiving the report vectors, add it to NAMESPACES
+                to make submitted reports retrievable by the RAG pipeline
+            queue_dir (str, optional): Directory of the local journal
+            batch_size (int, optional): Reports written to MySQL and embedded per batch
+            flush_interval (float, optional): Seconds the consumer waits for new reports, and
+                before retrying a failed batch
+        """
+        self.pinecone_db = pinecone_db
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal = ReportJournal(queue_dir)
+        # near-duplicate text is rejected at submission, near-identical embeddings are clustered
+        self.minhash = MinHashLSH()
+        self.embedding_deduper = EmbeddingDeduper()
+        self._pending = []  # (encoded record, future) waiting for the next group commit
+        self._has_pending = asyncio.Event()
+        self._has_new_data = asyncio.Event()
+        self._tasks = []
+        self.accepted = 0
+        self.ingested = 0
+        self.rejected_duplicates = 0
+        self.clustered_duplicates = 0
+
+    async def start(self):
+        await self._seed_minhash()
+        self._tasks = [
+            asyncio.create_task(self._journal_writer()),
+            asyncio.create_task(self._consumer()),
+        ]
+
+    def _journal_reports(self):
+        # reports acknowledged but not ingested yet, from the committed offset to the end of the journal
+        reports, offset = [], self.journal.committed_offset()
+        while True:
+            records, offset = self.journal.read(offset, self.batch_size)
+            if not records:
+                return reports
+            reports.extend(records)
+
+    async def _seed_minhash(self):
+        """
+        Rebuild the in-memory near-duplicate index from the latest stored reports and those still
+        in the journal, so reports submitted before a restart are still rejected when resubmitted
+
+        Signatures take ~0.1ms each, a full index (DEDUP_MAX_ENTRIES) delays the startup by seconds.
+        """
+        stored = await Database.recent_log_reports(self.minhash.max_entries)
+        queued = await asyncio.to_thread(self._journal_reports)
+
+        def index():
+            # oldest first, so the index keeps the newest reports once full
+            for report_id, content in [*stored, *((report["id"], report["content"]) for report in queued)]:
+                self.minhash.add(report_id, self.minhash.signature(content))
+        await asyncio.to_thread(index)
+        print(f"Near-duplicate index seeded with {len(self.minhash)} log reports")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.journal.close()
+
+    async def submit(self, report: LogReport):
+        """
+        Durably queue a report for ingestion
+
+        Args:
+            report (LogReport): The submitted report
+
+        Returns:
+            str: ID assigned to the report
+
+        Raises:
+            HTTPException: 409 if the content is a near duplicate of an earlier report
+        """
+        signature = self.minhash.signature(report.content)
+        duplicate_of, similarity = self.minhash.query(signature)
+        if duplicate_of is not None:
+            self.rejected_duplicates += 1
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Report is a near duplicate ({similarity:.0%}) of report {duplicate_of}"
+            )
+        report_id = str(uuid.uuid4())
+        # indexed right away so a near duplicate submitted during the group commit is rejected too
+        self.minhash.add(report_id, signature)
+        record = {"id": report_id, **report.model_dump(), "submitted_at": time.time()}
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((json.dumps(record, ensure_ascii=False) + "\n").encode(), future))
+        self._has_pending.set()
+        try:
+            # resolved once the record is fsynced to the journal
+            await future
+        except Exception:
+            # the journal write failed, a resubmission must not be rejected against this report
+            self.minhash.discard(report_id)
+            raise
+        self.accepted += 1
+        return report_id
+
+    async def _journal_writer(self):
+        while True:
+            await self._has_pending.wait()
+            self._has_pending.clear()
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+            try:
+                await asyncio.to_thread(self.journal.append, [line for line, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"Log report queue error: {e}"))
+                continue
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+            self._has_new_data.set()
+
+    @staticmethod
+    def _vector_metadata(report):
+        return {
+            "owner": report["owner"],
+            "content": report["content"][:_METADATA_CONTENT_LIMIT],
+            "tokenAddress": report["tokenAddress"],
+            "reward": report["reward"],
+            "submitted_at": report["submitted_at"],
+        }
+
+    async def _consumer(self):
+        offset = self.journal.committed_offset()
+        while True:
+            try:
+                reports, next_offset = await asyncio.to_thread(self.journal.read, offset, self.batch_size)
+            except Exception as e:
+                print(f"Reading the log report journal failed, retrying: {e}")
+                await asyncio.sleep(self.flush_interval)
+                continue
+            if not reports:
+                if next_offset != offset:
+                    # only corrupt records were read, move past them
+                    offset = await asyncio.to_thread(self.journal.commit, next_offset)
+                    continue
+                try:
+                    await asyncio.wait_for(self._has_new_data.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._has_new_data.clear()
+                continue
+            try:
+                ids = [report["id"] for report in reports]
+                embeddings = await asyncio.to_thread(self.pinecone_db.encode_items, reports, ["content"])
+                duplicates = self.embedding_deduper.find_duplicates(ids, embeddings)
+                for report, duplicate_of in zip(reports, duplicates):
+                    report["duplicate_of"] = duplicate_of
+                await Database.insert_log_reports(reports)
+                # clustered reports stay in MySQL but don't grow the vector index
+                unique = [i for i, duplicate_of in enumerate(duplicates) if duplicate_of is None]
+                await asyncio.to_thread(
+                    self.pinecone_db.upsert_items,
+                    [reports[i] for i in unique],
+                    [ids[i] for i in unique],
+                    self.namespace,
+                    metadata_fn=self._vector_metadata,
+                    embeddings=embeddings[unique]
+                )
+            except Exception as e:
+                print(f"Log report batch of {len(reports)} failed, retrying: {e}")
+                await asyncio.sleep(self.flush_interval)
+                continue
+            self.embedding_deduper.add([ids[i] for i in unique], embeddings[unique])
+            self.clustered_duplicates += len(reports) - len(unique)
+            offset = await asyncio.to_thread(self.journal.commit, next_offset)
+            self.ingested += len(reports)
+
+    def stats(self):
+        return {
+            "accepted": self.accepted,
+            "ingested": self.ingested,
+            "rejected_duplicates": self.rejected_duplicates,
+            "clustered_duplicates": self.clustered_duplicates,
+            "pending_commit": len(self._pending),
+        }
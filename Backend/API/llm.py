@@ -0,0 +1,210 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+
+load_dotenv("API.env")
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+# cheap model for query rewriting, stronger one for answers
+REWRITE_MODEL = os.getenv("REWRITE_MODEL", "gemini-2.0-flash")
+ANSWER_MODEL = os.getenv("ANSWER_MODEL", "gemini-2.0-flash")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class LLMTimeoutError(TimeoutError):
+    pass
+
+
+class LLMProvider(ABC):
+    """
+    Text generation backend used by RagModel
+
+    Every method takes the model name, the prompt and optionally a system instruction,
+    a temperature and a timeout in seconds (the provider default when None). stream()
+    yields the answer as text chunks, the async variants run on the event loop.
+    """
+
+    @abstractmethod
+    def generate(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        ...
+
+    @abstractmethod
+    def stream(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        ...
+
+    async def agenerate(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        return await asyncio.to_thread(self.generate, model, prompt, system_instruction, temperature, timeout)
+
+    async def astream(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        chunks = self.stream(model, prompt, system_instruction, temperature, timeout)
+        end = object()
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, end)
+                if chunk is end:
+                    break
+                yield chunk
+        finally:
+            chunks.close()
+
+
+class GeminiProvider(LLMProvider):
+    def __init__(self, api_key, timeout=LLM_TIMEOUT):
+        """
+        Gemini backend keeping its clients, and with them their HTTP connection pools, for the
+        lifetime of the process
+
+        Args:
+            api_key (str): Gemini API key
+            timeout (float, optional): Default per-call timeout in seconds
+        """
+        from google import genai
+        from google.genai import types
+        self._genai = genai
+        self._types = types
+        self.api_key = api_key
+        self.timeout = timeout
+        self._clients = {}  # timeout in ms -> genai.Client, the HTTP timeout is set per client
+        self._configs = {}  # (model, system instruction, temperature) -> GenerateContentConfig
+        self._lock = threading.Lock()
+
+    def _client(self, timeout):
+        timeout_ms = int((timeout or self.timeout) * 1000)
+        client = self._clients.get(timeout_ms)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(timeout_ms)
+                if client is None:
+                    client = self._clients[timeout_ms] = self._genai.Client(
+                        api_key=self.api_key,
+                        http_options=self._types.HttpOptions(timeout=timeout_ms)
+                    )
+        return client
+
+    def _config(self, model, system_instruction, temperature):
+        # built once per prompt setup instead of on every call; the stable prompt prefix is left
+        # to Gemini's implicit caching, explicit cached contents need far larger prefixes
+        if system_instruction is None and temperature is None:
+            return None
+        key = (model, system_instruction, temperature)
+        config = self._configs.get(key)
+        if config is None:
+            config = self._configs[key] = self._types.GenerateContentConfig(
+                system_instruction=system_instruction, temperature=temperature)
+        return config
+
+    def generate(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        return self._client(timeout).models.generate_content(
+            model=model, contents=prompt, config=self._config(model, system_instruction, temperature)
+        ).text
+
+    def stream(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        response = self._client(timeout).models.generate_content_stream(
+            model=model, contents=prompt, config=self._config(model, system_instruction, temperature))
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    async def agenerate(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        response = await self._client(timeout).aio.models.generate_content(
+            model=model, contents=prompt, config=self._config(model, system_instruction, temperature))
+        return response.text
+
+    async def astream(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        response = await self._client(timeout).aio.models.generate_content_stream(
+            model=model, contents=prompt, config=self._config(model, system_instruction, temperature))
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class LocalProvider(LLMProvider):
+    def __init__(self, first_token_latency=float(os.getenv("LOCAL_LLM_FIRST_TOKEN", 0.3)),
+                 tokens=int(os.getenv("LOCAL_LLM_TOKENS", 200)),
+                 token_interval=float(os.getenv("LOCAL_LLM_TOKEN_INTERVAL", 0.005)),
+                 timeout=LLM_TIMEOUT):
+        """
+        Deterministic offline stand-in with configurable latency and answer length
+
+        Rewrite prompts are answered with the quoted question, other prompts with words taken
+        from the end of the prompt, so retrieval and generation behave sensibly in benchmarks.
+
+        Args:
+            first_token_latency (float, optional): Seconds before the first token
+            tokens (int, optional): Tokens per answer
+            token_interval (float, optional): Seconds between streamed tokens
+            timeout (float, optional): Default per-call timeout in seconds
+        """
+        self.first_token_latency = first_token_latency
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.timeout = timeout
+
+    @staticmethod
+    def _is_rewrite(prompt):
+        return "vector searcher" in prompt
+
+    def _words(self, prompt):
+        quoted = re.search(r"'(.*?)'", prompt, re.S)
+        if self._is_rewrite(prompt) and quoted:
+            return quoted.group(1).split()
+        return _TOKEN_PATTERN.findall(prompt)[-50:] or ["answer"]
+
+    def _check_deadline(self, deadline):
+        if time.monotonic() > deadline:
+            raise LLMTimeoutError("Local model call timed out")
+
+    def _sleep(self, seconds, deadline):
+        # never sleep past the deadline, fail like a timed out HTTP call
+        remaining = deadline - time.monotonic()
+        time.sleep(max(0.0, min(seconds, remaining)))
+        self._check_deadline(deadline)
+
+    def generate(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        words = self._words(prompt)
+        self._sleep(self.first_token_latency + self.tokens * self.token_interval, deadline)
+        if self._is_rewrite(prompt):
+            return " ".join(words)
+        return " ".join(words[i % len(words)] for i in range(self.tokens))
+
+    def stream(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        words = self._words(prompt)
+        self._sleep(self.first_token_latency, deadline)
+        for i in range(self.tokens):
+            if i:
+                self._sleep(self.token_interval, deadline)
+            yield words[i % len(words)] + " "
+
+    async def agenerate(self, model, prompt, system_instruction=None, temperature=None, timeout=None):
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(self.generate, model, prompt, system_instruction, temperature, None),
+                timeout or self.timeout)
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError("Local model call timed out")
+
+
+def create_provider(api_key=None, provider=LLM_PROVIDER):
+    """
+    Create the configured LLM backend
+
+    Args:
+        api_key (str, optional): API key of the remote provider
+        provider (str, optional): "gemini" or "local", defaults to LLM_PROVIDER
+
+    Returns:
+        LLMProvider: The backend
+    """
+    if provider == "gemini":
+        return GeminiProvider(api_key)
+    if provider == "local":
+        return LocalProvider()
+    raise ValueError(f"Unknown LLM provider: {provider}")
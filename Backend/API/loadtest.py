@@ -0,0 +1,352 @@
+"""
+Load test of the FastAPI app against local stand-ins for MySQL, Pinecone, Gemini and GitLab
+
+    python loadtest.py --stages 10:5,60:20,10:0 --mix query=2,stream=2,sse=1,login=1,verify=2 --out run.json
+    python loadtest.py --concurrency 16 --duration 60 --mix stream=1 --compare run.json
+
+With --stages the load is open-loop: requests start at the given rate whatever the latency,
+each stage `seconds:rps` ramping linearly from the previous rate. Without it, --concurrency
+virtual users send requests back to back for --duration seconds. By default the app is started
+with uvicorn in a subprocess (USE_LOCAL_STANDINS=true, DB_BACKEND=sqlite); --target points the
+load at an already running server instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import httpx
+from bench_fakes import FakeGitLabServer, generate_corpus, sample_queries
+from bench_rag import add_standin_arguments, configure_standins, percentile
+
+SCENARIOS = ("query", "stream", "sse", "register", "login", "verify")
+
+
+def parse_mix(text):
+    """
+    Parse a scenario mix like "query=2,stream=1" into scenario weights
+    """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r}, valid ones are {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def parse_stages(text):
+    """
+    Parse a ramp profile like "10:5,60:20" into (seconds, target rps) tuples
+    """
+    stages = []
+    for part in text.split(","):
+        seconds, _, rps = part.partition(":")
+        stages.append((float(seconds), float(rps)))
+    return stages
+
+
+def rate_at(stages, elapsed):
+    # linear ramp from the previous stage's rate (0 before the first stage)
+    previous = 0.0
+    for seconds, rps in stages:
+        if elapsed < seconds:
+            return previous + (rps - previous) * elapsed / seconds
+        elapsed -= seconds
+        previous = rps
+    return None  # profile finished
+
+
+class Recorder:
+    def __init__(self):
+        """
+        Collects per-request outcomes and reduces them to the report
+        """
+        self.samples = {}  # scenario -> list of (start offset, latency, ttfb, status)
+        self.dropped = 0
+        self.started = time.perf_counter()
+
+    def record(self, scenario, start, latency, ttfb, status):
+        self.samples.setdefault(scenario, []).append((start - self.started, latency, ttfb, status))
+
+    def summary(self, wall_time):
+        report = {}
+        for scenario, samples in sorted(self.samples.items()):
+            statuses = {}
+            for *_, status in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            ok = [sample for sample in samples if isinstance(sample[3], int) and sample[3] < 400]
+            latencies = sorted(latency for _, latency, _, _ in ok)
+            ttfbs = sorted(ttfb for _, _, ttfb, _ in ok if ttfb is not None)
+            entry = {
+                "requests": len(samples),
+                "errors": len(samples) - len(ok),
+                "error_rate": round((len(samples) - len(ok)) / len(samples), 4),
+                "status_codes": statuses,
+                "throughput_per_s": round(len(ok) / wall_time, 2) if wall_time else 0.0,
+            }
+            for name, values in (("latency", latencies), ("ttfb", ttfbs)):
+                if values:
+                    entry.update({
+                        f"{name}_p50_ms": round(percentile(values, 50) * 1000, 2),
+                        f"{name}_p95_ms": round(percentile(values, 95) * 1000, 2),
+                        f"{name}_p99_ms": round(percentile(values, 99) * 1000, 2),
+                        f"{name}_max_ms": round(values[-1] * 1000, 2),
+                    })
+            report[scenario] = entry
+        return report
+
+    def timeline(self):
+        # requests started and errors per second of the run
+        seconds = {}
+        for samples in self.samples.values():
+            for offset, _, _, status in samples:
+                second = seconds.setdefault(int(offset), {"started": 0, "errors": 0})
+                second["started"] += 1
+                if not (isinstance(status, int) and status < 400):
+                    second["errors"] += 1
+        return [{"second": second, **counts} for second, counts in sorted(seconds.items())]
+
+
+class LoadTest:
+    def __init__(self, args, client, queries):
+        self.args = args
+        self.client = client
+        self.queries = queries
+        self.recorder = Recorder()
+        self.users = []  # (username, password, token) registered during setup
+        self.rng = random.Random(args.seed)
+        names = list(args.mix)
+        self._names, self._weights = names, [args.mix[name] for name in names]
+
+    def _new_user(self):
+        suffix = uuid.uuid4().hex[:12]
+        return {
+            "username": f"load_{suffix}",
+            "password": f"pw-{suffix}",
+            "email": f"load_{suffix}@example.com",
+            "name": "Load Test",
+            "wallet_address": "0x0000000000000000000000000000000000000000",
+        }
+
+    async def setup(self):
+        """
+        Register and log in the users the login, verify and authenticated query requests use
+        """
+        for _ in range(self.args.users):
+            user = self._new_user()
+            response = await self.client.post("/authenticate/register", json=user)
+            response.raise_for_status()
+            response = await self.client.post("/authenticate/login", data={
+                "username": user["username"], "password": user["password"]})
+            response.raise_for_status()
+            self.users.append((user["username"], user["password"], response.json()["access_token"]))
+
+    def _auth_headers(self):
+        if self.users and self.rng.random() < self.args.authenticated:
+            return {"Authorization": f"Bearer {self.rng.choice(self.users)[2]}"}
+        return {}
+
+    async def _stream(self, params, headers, sse):
+        """
+        Send a streaming query
+
+        Returns:
+            tuple: (status, seconds to the first byte, or for SSE to the first token event)
+        """
+        start = time.perf_counter()
+        ttfb = None
+        async with self.client.stream("POST", "/query-stream", params={**params, "sse": sse}, headers=headers) as response:
+            async for chunk in response.aiter_text():
+                if ttfb is None and chunk and (not sse or "event: token" in chunk):
+                    ttfb = time.perf_counter() - start
+            return response.status_code, ttfb
+
+    async def request(self, scenario):
+        """
+        Send one request of a scenario and record its outcome
+        """
+        headers = self._auth_headers()
+        start = time.perf_counter()
+        ttfb = None
+        try:
+            if scenario == "query":
+                response = await self.client.post("/query", params={"query": self.rng.choice(self.queries)}, headers=headers)
+                status = response.status_code
+            elif scenario in ("stream", "sse"):
+                status, ttfb = await self._stream({"query": self.rng.choice(self.queries)}, headers, scenario == "sse")
+            elif scenario == "register":
+                response = await self.client.post("/authenticate/register", json=self._new_user())
+                status = response.status_code
+            elif scenario == "login":
+                username, password, _ = self.rng.choice(self.users)
+                response = await self.client.post("/authenticate/login", data={"username": username, "password": password})
+                status = response.status_code
+            else:
+                response = await self.client.get("/authenticate/verify-token", headers={
+                    "Authorization": f"Bearer {self.rng.choice(self.users)[2]}"})
+                status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.recorder.record(scenario, start, time.perf_counter() - start, ttfb, status)
+
+    def pick(self):
+        return self.rng.choices(self._names, self._weights)[0]
+
+    async def run_open_loop(self, stages, tick=0.005):
+        in_flight = set()
+        begin = last = time.perf_counter()
+        credit = 0.0  # requests due but not started yet
+        while True:
+            await asyncio.sleep(tick)
+            now = time.perf_counter()
+            rate = rate_at(stages, now - begin)
+            if rate is None:
+                break
+            credit += rate * (now - last)
+            last = now
+            while credit >= 1:
+                credit -= 1
+                if len(in_flight) >= self.args.concurrency:
+                    # never wait for a free slot, that would hide the latency from the schedule
+                    self.recorder.dropped += 1
+                    continue
+                task = asyncio.create_task(self.request(self.pick()))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+    async def run_closed_loop(self, duration):
+        deadline = time.perf_counter() + duration
+
+        async def virtual_user():
+            while time.perf_counter() < deadline:
+                await self.request(self.pick())
+
+        await asyncio.gather(*(virtual_user() for _ in range(self.args.concurrency)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, timeout=120):
+    """
+    Start the app with uvicorn in a subprocess and wait until it answers
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=os.environ.copy()
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Server did not start in time")
+
+
+def compare(report, baseline_path):
+    """
+    Print the change of the main figures against an earlier report
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    for scenario, entry in report.items():
+        before = baseline.get(scenario)
+        if before is None:
+            continue
+        changes = []
+        for key in ("latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "ttfb_p95_ms", "error_rate", "throughput_per_s"):
+            if key in entry and key in before:
+                changes.append(f"{key}={before[key]}->{entry[key]}")
+        print(f"{scenario:<9} " + " ".join(changes))
+
+
+async def run(args, base_url, queries):
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=None, max_keepalive_connections=None)) as client:
+        load_test = LoadTest(args, client, queries)
+        await load_test.setup()
+        started = time.perf_counter()
+        load_test.recorder.started = started
+        if args.stages:
+            await load_test.run_open_loop(args.stages)
+        else:
+            await load_test.run_closed_loop(args.duration)
+        wall_time = time.perf_counter() - started
+        return {
+            "config": {key: value for key, value in vars(args).items() if key not in ("out", "compare")},
+            "wall_time_s": round(wall_time, 2),
+            "dropped": load_test.recorder.dropped,
+            "scenarios": load_test.recorder.summary(wall_time),
+            "timeline": load_test.recorder.timeline(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API against local stand-ins")
+    parser.add_argument("--target", default=None, help="Base URL of a running server, default starts one with the stand-ins")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("query=2,stream=2,sse=1,login=1,verify=2"),
+                        help=f"Scenario weights, scenarios: {', '.join(SCENARIOS)}")
+    parser.add_argument("--stages", type=parse_stages, default=None, help="Open-loop ramp profile seconds:rps,...")
+    parser.add_argument("--concurrency", type=int, default=16, help="Virtual users, or the in-flight cap with --stages")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of closed-loop load")
+    parser.add_argument("--users", type=int, default=10, help="Users registered before the run")
+    parser.add_argument("--authenticated", type=float, default=0.5, help="Share of queries sent with a token")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    add_standin_arguments(parser)
+    parser.add_argument("--out", default=None, help="Write the JSON report to this file")
+    parser.add_argument("--compare", default=None, help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+    if args.users < 1 and {"login", "verify"} & set(args.mix):
+        parser.error("login and verify need --users of at least 1")
+
+    queries = sample_queries(generate_corpus(n_mitre=args.corpus_size, n_exploits=args.corpus_size), 500, seed=args.seed)
+    with tempfile.TemporaryDirectory() as workdir, FakeGitLabServer(latency=args.gitlab_latency) as gitlab:
+        server = None
+        base_url = args.target
+        if base_url is None:
+            configure_standins(args, gitlab.base_url, workdir)
+            port = free_port()
+            server = start_server(port)
+            base_url = f"http://127.0.0.1:{port}"
+        try:
+            report = asyncio.run(run(args, base_url, queries))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    for scenario, entry in report["scenarios"].items():
+        print(f"{scenario:<9} requests={entry['requests']:<6} error_rate={entry['error_rate']:<7} "
+              f"p50={entry.get('latency_p50_ms', 0):>9.2f}ms p95={entry.get('latency_p95_ms', 0):>9.2f}ms "
+              f"p99={entry.get('latency_p99_ms', 0):>9.2f}ms ttfb_p95={entry.get('ttfb_p95_ms', 0):>9.2f}ms")
+    if report["dropped"]:
+        print(f"{report['dropped']} scheduled requests dropped at the concurrency cap")
+    if args.compare:
+        compare(report["scenarios"], args.compare)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,40 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Depends, Query
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+import json
 import os
+import threading
+from typing import Optional
 import auth
-from models import RagResponse
+from models import RagResponse, LogReport, LogReportReceipt, ChatRequest, ChatResponse, BatchQueryRequest
 from ragroute import RagModel
+from coalescing import QueryCoalescer, normalize_query
+from admission import AdmissionController, TokenBucketLimiter, SlotStreamingResponse
+from ingestion import LogReportIngestor
+from database import Database
+from sessions import ConversationStore
+import metrics
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global log_ingestor
+    # fails the startup if the UNIQUE keys registration relies on are missing
+    await Database.check_schema()
+    # background journal writer and batch consumer for /submit-logreport, the journal is opened
+    # by the running server rather than by importing this module
+    log_ingestor = LogReportIngestor(Rag_Model.Pinecone_DB)
+    await log_ingestor.start()
+    yield
+    await log_ingestor.stop()
+    log_ingestor = None
+    # bcrypt worker processes don't outlive the server
+    auth.password_hasher.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(auth.router)
 load_dotenv("API.env")
 INDEX_NAME = os.getenv("INDEX_NAME")
@@ -17,7 +43,31 @@ GENAI_API_KEY = os.getenv("GENAI_API_KEY")
 
 namespaces = os.getenv("NAMESPACES","")
 namespaces = [item.strip() for item in namespaces.split(',') if item]
-Rag_Model = RagModel(PINECONE_API_KEY, GENAI_API_KEY, NameSpaces=namespaces, Index_Name=INDEX_NAME, min_score=0.75)
+MIN_SCORE = float(os.getenv("MIN_SCORE", 0.75))
+if os.getenv("USE_LOCAL_STANDINS", "false").lower() == "true":
+    # offline mode for benchmarks and load tests: local Pinecone, encoder and Gemini stand-ins
+    from bench_fakes import build_local_rag_model
+    Rag_Model = build_local_rag_model(NameSpaces=namespaces, min_score=MIN_SCORE)
+else:
+    Rag_Model = RagModel(PINECONE_API_KEY, GENAI_API_KEY, NameSpaces=namespaces, Index_Name=INDEX_NAME, min_score=MIN_SCORE)
+COALESCE_QUERIES = os.getenv("COALESCE_QUERIES", "true").lower() == "true"
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", 5000))
+coalescer = QueryCoalescer()
+admission = AdmissionController()
+rate_limiter = TokenBucketLimiter()
+log_ingestor = None  # created by lifespan
+conversations = ConversationStore()
+
+# queue and pool state exposed next to the stage histograms on /metrics
+metrics.register_gauge("rag_admission", "RAG admission control slots and queue", lambda: {
+    "active": admission.active, "waiting": admission.waiting, "shed_total": admission.shed})
+metrics.register_gauge("password_hasher", "bcrypt worker pool queue", auth.password_hasher.stats)
+metrics.register_gauge("db_pool", "Database connection pool utilization", Database.pool_stats)
+metrics.register_gauge("log_ingestion", "Log report ingestion pipeline",
+                       lambda: log_ingestor.stats() if log_ingestor else {})
+metrics.register_gauge("chat_sessions", "Chat conversation store", conversations.stats)
+if Rag_Model.Router is not None:
+    metrics.register_gauge("namespace_routing", "Namespaces searched and skipped by the router", Rag_Model.Router.stats)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +77,13 @@ app.add_middleware(
     allow_headers=["*"], # Allows all headers
 )
 
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.ServerTimingMiddleware)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get('/', status_code = status.HTTP_200_OK)
 async def root():
     return{"Status": "Server is up!"}
@@ -35,16 +92,173 @@ async def root():
 async def say_hello(name: str):
     return {"message": f"Hello {name}"}
 
-@app.post("/query")
+def rate_limit(request: Request, payload: Optional[dict] = Depends(auth.optional_token_verifier)):
+    """
+    Apply the per-user token bucket, anonymous requests are limited per client address
+    """
+    key = f"user:{payload['username']}" if payload else f"ip:{request.client.host if request.client else 'unknown'}"
+    rate_limiter.acquire(key)
+
+def needs_slot(query: str, stream: bool = False):
+    """
+    Check whether a request has to take an admission slot
+
+    Joining an identical in-flight query adds no retrieval or generation work, but /query only
+    joins calls and /query-stream only joins streams, so each checks its own registry.
+    """
+    if not COALESCE_QUERIES:
+        return True
+    key = normalize_query(query)
+    return not (coalescer.in_flight_stream(key) if stream else coalescer.in_flight_call(key))
+
+@app.post("/query", dependencies=[Depends(rate_limit)])
 async def rag_query(query: str):
-    Rag_Resp = Rag_Model.Rag_Generator_caller(user_query=query)
+    # no await between the check and coalescer.run() registering or joining the call
+    if not needs_slot(query):
+        Rag_Resp = await coalescer.run(normalize_query(query), Rag_Model.Rag_Generator_caller, user_query=query)
+        return {"message": RagResponse(query_resp=Rag_Resp)}
+    async with admission.slot():
+        if COALESCE_QUERIES:
+            # identical questions asked while this one is in flight share its retrieval and generation
+            Rag_Resp = await coalescer.run(normalize_query(query), Rag_Model.Rag_Generator_caller, user_query=query)
+        else:
+            Rag_Resp = await run_in_threadpool(Rag_Model.Rag_Generator_caller, user_query=query)
     return {"message": RagResponse(query_resp=Rag_Resp)}
-        
-@app.post("/query-stream")
-async def stream_rag_query(query: str):
-    Rag_resp = Rag_Model.Rag_Generator_stream_caller
-    return StreamingResponse(Rag_resp(user_query=query), media_type="text/plain")
-
-@app.post("/submit-logreport")
-async def create_log_entry():
-    pass
\ No newline at end of file
+
+_END_OF_EVENTS = object()
+
+async def pipeline_events(user_query: str):
+    """
+    Run the RAG pipeline off the event loop and yield its (event, data) tuples
+
+    Closing or cancelling this generator stops the pipeline at its next stage boundary.
+    """
+    cancelled = threading.Event()
+    events = Rag_Model.Rag_Generator_event_stream(user_query=user_query, cancelled=cancelled)
+    try:
+        while True:
+            # each pipeline step blocks (network, encoder), run it off the event loop
+            item = await run_in_threadpool(next, events, _END_OF_EVENTS)
+            if item is _END_OF_EVENTS:
+                break
+            yield item
+    except Exception as e:
+        yield "error", {"detail": str(e)}
+    finally:
+        # also reached on cancellation, the worker thread stops at its next check
+        cancelled.set()
+
+async def client_stream(request: Request, user_query: str, sse: bool, joining: bool = False):
+    """
+    Format the pipeline events for one client, stopping once the client disconnects
+
+    If joining is set the route took no admission slot to join an in-flight stream; should that
+    stream have finished before the body starts, a slot is taken here and released at the end.
+    """
+    holds_slot = False
+    if joining and needs_slot(user_query, stream=True):
+        # the stream the route meant to join finished before the body started, this one starts its own
+        await admission.acquire()
+        holds_slot = True
+    if COALESCE_QUERIES:
+        events = coalescer.stream(normalize_query(user_query), lambda: pipeline_events(user_query))
+    else:
+        events = pipeline_events(user_query)
+    try:
+        async for event, data in events:
+            if await request.is_disconnected():
+                break
+            if sse:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            elif event == "token" and data["text"]:
+                yield data["text"]
+            elif event == "error":
+                # the 200 status is already sent, the body says the answer is incomplete
+                yield f"\n\nError: {data['detail']}\n"
+    finally:
+        await events.aclose()
+        if holds_slot:
+            admission.release()
+
+@app.post("/query-stream", dependencies=[Depends(rate_limit)])
+async def stream_rag_query(request: Request, query: str, sse: bool = False):
+    holds_slot = needs_slot(query, stream=True)
+    if holds_slot:
+        # taken before the response starts so an overloaded server can still answer 429
+        await admission.acquire()
+    stream = client_stream(request, user_query=query, sse=sse, joining=not holds_slot)
+    # the response releases the slot, the body generator may never start
+    release = admission.release if holds_slot else None
+    if sse:
+        return SlotStreamingResponse(
+            stream,
+            release,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    return SlotStreamingResponse(stream, release, media_type="text/plain")
+
+@app.get("/search", dependencies=[Depends(rate_limit)])
+async def search(query: str, namespaces: Optional[str] = None, top_k: int = Query(10, ge=1, le=100),
+                 min_score: Optional[float] = Query(None, ge=0.1, le=0.9), fields: Optional[str] = None,
+                 offset: int = Query(0, ge=0)):
+    # comma separated like NAMESPACES, no generation so no admission slot either
+    try:
+        return await run_in_threadpool(
+            Rag_Model.Rag_Search, query,
+            namespaces=[item.strip() for item in namespaces.split(',') if item.strip()] if namespaces else None,
+            top_k=top_k, min_score=min_score,
+            fields=[item.strip() for item in fields.split(',') if item.strip()] if fields else None,
+            offset=offset
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+async def batch_results(queries: list, retrieval_only: bool):
+    """
+    Run a query batch off the event loop and yield its results as NDJSON lines
+
+    The batch holds one admission slot, taken by the route and released by its response.
+    """
+    cancelled = threading.Event()
+    results = Rag_Model.Rag_Batch_caller(queries, retrieval_only=retrieval_only, cancelled=cancelled)
+    try:
+        while True:
+            item = await run_in_threadpool(next, results, _END_OF_EVENTS)
+            if item is _END_OF_EVENTS:
+                break
+            yield json.dumps(item) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+    finally:
+        # also reached when the client disconnects, the batch stops after its current result
+        cancelled.set()
+
+@app.post("/query-batch", dependencies=[Depends(rate_limit)])
+async def rag_query_batch(request: BatchQueryRequest):
+    if len(request.queries) > QUERY_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {QUERY_BATCH_MAX} queries per batch")
+    await admission.acquire()
+    return SlotStreamingResponse(batch_results(request.queries, request.retrieval_only), admission.release,
+                                 media_type="application/x-ndjson")
+
+@app.post("/submit-logreport", response_model=LogReportReceipt, status_code=status.HTTP_202_ACCEPTED)
+async def create_log_entry(report: LogReport):
+    # acknowledged once durably queued, MySQL and the vector index are written in batches
+    report_id = await log_ingestor.submit(report)
+    return {"report_id": report_id, "status": "queued"}
+
+@app.post("/chat", response_model=ChatResponse, dependencies=[Depends(rate_limit)])
+async def chat(request: ChatRequest, payload: dict = Depends(auth.token_verifier)):
+    # conversations are looked up under the caller's username, other users' IDs start a new one
+    conversation = conversations.get_or_create(payload["username"], request.conversation_id)
+    async with admission.slot():
+        answer, retrieved = await run_in_threadpool(Rag_Model.Rag_Chat_caller, conversation, request.message)
+    return {"conversation_id": conversation.id, "answer": answer, "retrieved_documents": retrieved}
+
+@app.delete("/chat/{conversation_id}")
+async def delete_chat(conversation_id: str, payload: dict = Depends(auth.token_verifier)):
+    if not conversations.delete(payload["username"], conversation_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
+    return {"message": "conversation deleted"}
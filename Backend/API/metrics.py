@@ -0,0 +1,174 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import nullcontext
+from dotenv import load_dotenv
+
+load_dotenv("API.env")
+
+# Off by default, timed() is then a shared no-op context manager
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage durations of the current request, read by the Server-Timing middleware
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label="stage", buckets=DEFAULT_BUCKETS):
+        """
+        Prometheus style histogram with a single label
+
+        Args:
+            name (str): Metric name
+            help_text (str): Metric description
+            label (str, optional): Name of the label distinguishing the series
+            buckets (tuple, optional): Upper bounds of the buckets in seconds
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                labels = f'{self.label}="{label_value}"'
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-1]}')
+                lines.append(f"{self.name}_sum{{{labels}}} {series[-2]}")
+                lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+
+stage_seconds = Histogram("rag_stage_duration_seconds", "Duration of RAG pipeline stages in seconds")
+_gauges = []  # (name, help, label, callable returning {label value: number})
+
+
+class _StageTimer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stage_seconds.observe(self.stage, elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            # stages repeated within a request (e.g. several GitLab files) add up
+            timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+        return False
+
+
+_NOOP_TIMER = nullcontext()
+
+
+def timed(stage: str):
+    """
+    Time a pipeline stage
+
+    Args:
+        stage (str): Stage name, used as histogram label and Server-Timing metric name
+
+    Returns:
+        ContextManager: Records the duration of the block when metrics are enabled
+    """
+    if METRICS_ENABLED:
+        return _StageTimer(stage)
+    return _NOOP_TIMER
+
+
+def register_gauge(name: str, help_text: str, collect, label: str = "state"):
+    """
+    Expose a stats snapshot as a gauge on /metrics
+
+    Args:
+        name (str): Metric name
+        help_text (str): Metric description
+        collect (callable): Returns a dict of label value to number, non numeric values are skipped
+        label (str, optional): Label name for the dict keys
+    """
+    _gauges.append((name, help_text, label, collect))
+
+
+def start_request_timings():
+    """
+    Start collecting stage timings for the current request
+
+    Returns:
+        dict: Stage name to accumulated seconds, filled in as the request runs
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: dict):
+    """
+    Format stage timings as a Server-Timing header value (durations in milliseconds)
+    """
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app):
+        """
+        ASGI middleware attaching the request's stage timings as a Server-Timing header
+
+        The header goes out with the response start, so streamed responses only carry the
+        stages finished before their first byte.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = start_request_timings()
+
+        async def send_with_timings(message):
+            if message["type"] == "http.response.start" and timings:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_timings)
+
+
+def render_prometheus():
+    """
+    Render every metric in the Prometheus text exposition format
+
+    Returns:
+        str: Exposition text
+    """
+    lines = stage_seconds.render()
+    for name, help_text, label, collect in _gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for label_value, value in collect().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'{name}{{{label}="{label_value}"}} {value}')
+    return "\n".join(lines) + "\n"
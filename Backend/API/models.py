@@ -51,6 +51,10 @@ class GoogleAuthRequest(BaseModel):
 class RagResponse(BaseModel):
     query_resp : str
 
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, description="Queries, e.g. IOCs or log lines")
+    retrieval_only: bool = Field(False, description="Return the matched records without generating answers")
+
 class ReportLog(BaseModel):
     title: str
     severity: int = Field(..., ge=1, le=5, description="Severity level between 1 to 5")
@@ -59,4 +63,17 @@ class LogReport(BaseModel):
     owner: str
     content: str
     tokenAddress: str
-    reward: str
\ No newline at end of file
+    reward: str
+
+class LogReportReceipt(BaseModel):
+    report_id: str
+    status: str
+
+class ChatRequest(BaseModel):
+    message: str
+    conversation_id: Optional[str] = Field(None, description="Omit to start a new conversation")
+
+class ChatResponse(BaseModel):
+    conversation_id: str
+    answer: str
+    retrieved_documents: int
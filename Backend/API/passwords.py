@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+
+load_dotenv("API.env")
+
+# Initialize a password hashing context using bcrypt
+bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+
+
+# Module level so the process pool workers can pickle them by reference
+def _hash_password(password: str):
+    return bcrypt_context.hash(password)
+
+def _verify_password(password: str, hashed_password: str):
+    return bcrypt_context.verify(password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, workers=int(os.getenv("BCRYPT_WORKERS", os.cpu_count() or 1)),
+                 max_concurrent=int(os.getenv("BCRYPT_MAX_CONCURRENT", 0)) or None,
+                 executor=os.getenv("BCRYPT_EXECUTOR", "process")):
+        """
+        Run bcrypt hashing and verification on a bounded worker pool instead of the event loop
+
+        Args:
+            workers (int, optional): Number of worker processes (or threads)
+            max_concurrent (int, optional): Hash operations submitted to the pool at once,
+                callers beyond it wait in the queue. Defaults to twice the number of workers
+            executor (str, optional): "process" for true parallelism, "thread" for a thread pool
+        """
+        self.workers = workers
+        self.max_concurrent = max_concurrent or workers * 2
+        self.executor_kind = executor
+        self._executor = None
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        # queue metrics
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _get_executor(self):
+        # created lazily so importing the module doesn't start any worker
+        if self._executor is None:
+            if self.executor_kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            else:
+                # spawn keeps the workers clear of the server's threads and loaded models
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._executor
+
+    async def _run(self, func, *args):
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        started_at = time.perf_counter()
+        self.wait_seconds += started_at - queued_at
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.run_seconds += time.perf_counter() - started_at
+            self._slots.release()
+
+    async def hash(self, password: str):
+        """
+        Hash a password with bcrypt
+
+        Args:
+            password (str): Plain text password
+
+        Returns:
+            str: The bcrypt hash
+        """
+        return await self._run(_hash_password, password)
+
+    async def verify(self, password: str, hashed_password: str):
+        """
+        Verify a password against its bcrypt hash
+
+        Args:
+            password (str): Plain text password
+            hashed_password (str): Stored bcrypt hash
+
+        Returns:
+            bool: True if the password matches
+        """
+        return await self._run(_verify_password, password, hashed_password)
+
+    def stats(self):
+        """
+        Snapshot of the pool's queue metrics
+
+        Returns:
+            dict: Current and cumulative counters
+        """
+        return {
+            "workers": self.workers,
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "wait_seconds_total": self.wait_seconds,
+            "run_seconds_total": self.run_seconds,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
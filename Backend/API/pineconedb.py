@@ -1,17 +1,96 @@
+import contextvars
 import json
 import csv
+import multiprocessing
 import os
+import threading
+import time
 import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from pinecone import Pinecone, ServerlessSpec
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
+from docstore import DocStore
+from embedding_export import EmbeddingExportWriter, EMBEDDING_EXPORT_DIR
+import numpy as np
+from metrics import timed
 
 load_dotenv('API.env')
 
+# recently encoded query texts, repeated queries skip the encoder
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 1024))
+# ingestion processes for the uploaders, objects per shard sent to a process and torch threads
+# per process (by default the cores divided by the processes)
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 1))
+INGEST_SHARD_SIZE = int(os.getenv('INGEST_SHARD_SIZE', 256))
+INGEST_TORCH_THREADS = int(os.getenv('INGEST_TORCH_THREADS', 0))
+
+def text_to_embed(item, fields=None):
+    """
+    Build the text to embed for a JSON object, the selected fields or the whole object as JSON
+    """
+    text = ""
+    if fields:
+        text = " ".join(str(item.get(field, "")) for field in fields).strip()
+    if not text:
+        try:
+            text = json.dumps(item, ensure_ascii=False)
+        except Exception as e:
+            print(f"Error converting item to JSON: {e}")
+            text = str(item)
+    return text
+
+
+class NamespaceMatches:
+    """
+    Matches of one namespace query, best first: the vector IDs, their scores as a float32 array
+    and the metadata objects of the response, referenced rather than copied
+
+    Iterates as tuples (id, metadata) like the lists it replaces.
+    """
+    __slots__ = ("namespace", "ids", "scores", "metadata")
+
+    def __init__(self, namespace, ids, scores, metadata):
+        self.namespace = namespace
+        self.ids = ids
+        self.scores = scores
+        self.metadata = metadata
+
+    @classmethod
+    def empty(cls, namespace):
+        return cls(namespace, [], np.empty(0, dtype=np.float32), [])
+
+    @classmethod
+    def from_response(cls, namespace, response, min_score):
+        """
+        Read a Pinecone query response through its match objects, without converting it with to_dict()
+        """
+        matches = [match for match in response.matches or () if (match.score or 0.0) > min_score]
+        return cls(
+            namespace,
+            [match.id for match in matches],
+            np.array([match.score for match in matches], dtype=np.float32),
+            [match.metadata or {} for match in matches]
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return zip(self.ids, self.metadata)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return NamespaceMatches(self.namespace, self.ids[index], self.scores[index], self.metadata[index])
+        return self.ids[index], self.metadata[index]
+
+
 class PineconeDB:
     def __init__(self, pinecone_api_key, index_name, user_namespace="",
                  embedding_model=os.getenv('MODEL'), batch_size=127, 
-                 embedding_fields=None):
+                 embedding_fields=None, doc_store=None, pinecone_client=None, model=None,
+                 dimension=int(os.getenv('DIMENSION', 1024)), embedding_export=None):
         """
         Initialize the PineconeDB with Pinecone and embedding configurations
         
@@ -22,23 +101,45 @@ class PineconeDB:
             embedding_model (str, optional): Sentence Transformer model for embeddings
             batch_size (int, optional): Size of batches for upsert operations
             embedding_fields (list, optional): Specific fields to use for creating embeddings
+            doc_store (DocStore, optional): Local store receiving the full record bodies on upload
+            pinecone_client (optional): Pinecone compatible client to use instead of creating one,
+                e.g. a local stand-in for benchmarks
+            model (optional): Encoder to use instead of loading the Sentence Transformer model
+            dimension (int, optional): Dimension of the index if it has to be created
+            embedding_export (EmbeddingExportWriter, optional): Receives every upserted vector
+                with its ID and metadata, for reuse by embedding_export.py
         """
         # Initialize Pinecone client
-        self.pinecone = Pinecone(api_key=pinecone_api_key)
+        self.pinecone = pinecone_client or Pinecone(api_key=pinecone_api_key)
         self.user_namespace = user_namespace
-        self.index = self._create_index(index_name)  # Connect to the index
-        # Initialize embedding model
-        self.model = SentenceTransformer(embedding_model, device='cpu') 
-        # change device field to 'cuda' for activating gpu acceleration in production
+        self.index = self._create_index(index_name, dimension)  # Connect to the index
+        # embedding model, loaded on first use so bulk loads of precomputed vectors never load it
+        self.embedding_model = embedding_model
+        self._model = model
+        self._model_lock = threading.Lock()
+        self.embedding_export = embedding_export
         self.fields = embedding_fields
         self.batch_size = batch_size
+        self.doc_store = doc_store
+        self._query_embeddings = OrderedDict()  # query text -> embedding
+        self._query_embeddings_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    # change device field to 'cuda' for activating gpu acceleration in production
+                    self._model = SentenceTransformer(self.embedding_model, device='cpu')
+        return self._model
 
-    def _create_index(self, index_name):
+    def _create_index(self, index_name, dimension=1024):
         """
         Create a Pinecone index if it doesn't exist, or connect to it if it does
         
         Args:
             index_name (str): Name of the index to create or connect to
+            dimension (int, optional): Dimension of the index, the encoder's output size
             
         Returns:
             pinecone.Index: Pinecone index object
@@ -47,7 +148,7 @@ class PineconeDB:
         if index_name not in existing_indexes:
             self.pinecone.create_index(
                 name=index_name,
-                dimension=1024,  # Adjust according to model's output
+                dimension=dimension,
                 metric=os.getenv('SIMILARITY', 'cosine'),
                 spec=ServerlessSpec(
                     cloud=os.getenv('CLOUD', 'aws'),
@@ -66,16 +167,65 @@ class PineconeDB:
         Returns:
             list: List of embedding values
         """
-        text_to_embed = ""
-        if self.fields:
-            text_to_embed = " ".join(str(item.get(field, "")) for field in self.fields).strip()
-        if not text_to_embed:
-            try:
-                text_to_embed = json.dumps(item, ensure_ascii=False)
-            except Exception as e:
-                print(f"Error converting item to JSON: {e}")
-                text_to_embed = str(item)
-        return self.model.encode(text_to_embed, normalize_embeddings=True).tolist()
+        return self.model.encode(self._text_to_embed(item), normalize_embeddings=True).tolist()
+
+    def _text_to_embed(self, item, fields=None):
+        """
+        Build the text to embed for a JSON object
+
+        Args:
+            item (dict): JSON object to create embedding for
+            fields (list, optional): Fields to embed, defaults to the configured embedding fields
+
+        Returns:
+            str: The selected fields, or the whole object as JSON
+        """
+        return text_to_embed(item, fields or self.fields)
+
+    def encode_items(self, items, fields=None):
+        """
+        Embed a batch of JSON objects in one encoder call
+
+        Args:
+            items (list): JSON objects to embed
+            fields (list, optional): Fields to embed, defaults to the configured embedding fields
+
+        Returns:
+            numpy.ndarray: Normalized embeddings, one row per object
+        """
+        return self.model.encode(
+            [self._text_to_embed(item, fields) for item in items],
+            normalize_embeddings=True
+        )
+
+    def upsert_items(self, items, ids, namespace, fields=None, metadata_fn=None, embeddings=None):
+        """
+        Embed a batch of JSON objects in one encoder call and upsert them
+
+        Args:
+            items (list): JSON objects to embed
+            ids (list): Vector ID of each object
+            namespace (str): Namespace to upsert to
+            fields (list, optional): Fields to embed, defaults to the configured embedding fields
+            metadata_fn (callable, optional): Builds the Pinecone metadata of an object,
+                defaults to the object itself
+            embeddings (numpy.ndarray, optional): Precomputed embeddings from encode_items
+        """
+        if not items:
+            return
+        if embeddings is None:
+            embeddings = self.encode_items(items, fields)
+        metadata_fn = metadata_fn or dict
+        vectors = [
+            (vector_id, embedding.tolist(), metadata_fn(item))
+            for vector_id, embedding, item in zip(ids, embeddings, items)
+        ]
+        for start in range(0, len(vectors), self.batch_size):
+            self.index.upsert(vectors=vectors[start:start + self.batch_size], namespace=namespace)
+        if self.embedding_export is not None:
+            self.embedding_export.append(ids, embeddings, [metadata for _, _, metadata in vectors], namespace)
+        if self.doc_store is not None:
+            self.doc_store.put_many(list(zip(ids, items)), namespace=namespace)
 
     def upsert_index(self, batch_vectors):
         """
@@ -85,6 +235,23 @@ class PineconeDB:
             batch_vectors (list): List of tuples (id, vector, metadata)
         """
         self.index.upsert(vectors=batch_vectors, namespace=self.user_namespace)
+        if self.embedding_export is not None:
+            self.embedding_export.append(
+                [vector_id for vector_id, _, _ in batch_vectors],
+                [embedding for _, embedding, _ in batch_vectors],
+                [metadata for _, _, metadata in batch_vectors],
+                self.user_namespace
+            )
+
+    def _store_records(self, batch_records):
+        """
+        Write a batch of full record bodies to the local doc store, if one is configured
+
+        Args:
+            batch_records (list): List of tuples (id, record)
+        """
+        if self.doc_store is not None and batch_records:
+            self.doc_store.put_many(batch_records, namespace=self.user_namespace)
 
     def query_vectors(self, query_text, top_k=5):
         """
@@ -111,80 +278,306 @@ class PineconeDB:
         
         return results
     
-    def query_vector_multiple(self, query_text, NameSpaces = ['default'], min_score = 0.7):
+    def query_vector_matches(self, query_text, NameSpaces = ['default'], min_score = 0.7, top_k = 4):
+        """
+        Query several namespaces and keep the vector IDs alongside the metadata
+
+        Args:
+            query_text (str): Text to query
+            NameSpaces (list, optional): Namespaces to search
+            min_score (float, optional): Minimum similarity score for a match to be kept
+            top_k (int or dict, optional): Matches per namespace, or a mapping of namespace to
+                matches where namespaces mapped to 0 are not queried
+
+        Returns:
+            dict: Mapping of namespace to NamespaceMatches, iterating as tuples (id, metadata)
+        """
         if min_score < 0.1 or min_score > 0.9: raise ValueError("Min Score value is not betwwen range 0.1 to 0.9")
 
-        query_embedding = self.model.encode(
-            query_text,
-            normalize_embeddings=True
-        ).tolist()
+        # converted once for every namespace, the client only takes plain lists
+        query_vector = self.encode_query(query_text).tolist()
         results = {}
         for name_space in NameSpaces:
-            result = self.index.query(
-                vector= query_embedding,
-                top_k=4,
+            namespace_top_k = top_k.get(name_space, 0) if isinstance(top_k, dict) else top_k
+            if namespace_top_k:
+                results[name_space] = self._namespace_matches(query_vector, name_space, min_score, namespace_top_k)
+            else:
+                results[name_space] = NamespaceMatches.empty(name_space)
+        return results
+
+    def encode_query(self, query_text):
+        """
+        Embed a query text, the last QUERY_EMBEDDING_CACHE_SIZE distinct texts are served from memory
+
+        Args:
+            query_text (str): Text to query
+
+        Returns:
+            numpy.ndarray: Normalized float32 embedding, read-only since it is shared
+        """
+        with self._query_embeddings_lock:
+            query_embedding = self._query_embeddings.get(query_text)
+            if query_embedding is not None:
+                self._query_embeddings.move_to_end(query_text)
+                return query_embedding
+        with timed("encode"):
+            query_embedding = np.asarray(self.model.encode(
+                query_text,
+                normalize_embeddings=True
+            ), dtype=np.float32)
+        query_embedding.setflags(write=False)
+        with self._query_embeddings_lock:
+            self._query_embeddings[query_text] = query_embedding
+            if len(self._query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embeddings.popitem(last=False)
+        return query_embedding
+
+    def _namespace_matches(self, query_vector, name_space, min_score, top_k=4):
+        """
+        Search one namespace and keep the matches above min_score
+        """
+        with timed(f"pinecone.{name_space}"):
+            response = self.index.query(
+                vector= query_vector,
+                top_k=top_k,
                 include_metadata=True,
                 namespace=name_space
-            ).to_dict()
-            filtered_metadata = [
-                match["metadata"]
-                for match in result.get("matches", [])
-                if match.get("score", 0) > min_score]
-            results[name_space] = filtered_metadata
+            )
+        return NamespaceMatches.from_response(name_space, response, min_score)
+
+    def search_matches(self, query_text, NameSpaces = ['default'], top_k = 10, min_score = 0.7):
+        """
+        Query several namespaces and keep the vector IDs and scores alongside the metadata
+
+        Args:
+            query_text (str): Text to query
+            NameSpaces (list, optional): Namespaces to search
+            top_k (int, optional): Matches requested from each namespace
+            min_score (float, optional): Minimum similarity score for a match to be kept
+
+        Returns:
+            dict: Mapping of namespace to NamespaceMatches, best first
+        """
+        return self.query_vector_matches(query_text, NameSpaces=NameSpaces, min_score=min_score, top_k=top_k)
+
+    def query_batch_matches(self, query_texts, NameSpaces = ['default'], min_score = 0.7, executor=None):
+        """
+        Query several namespaces for many texts, all texts are embedded in one encoder call
+
+        Args:
+            query_texts (list): Texts to query
+            NameSpaces (list, optional): Namespaces to search
+            min_score (float, optional): Minimum similarity score for a match to be kept
+            executor (concurrent.futures.Executor, optional): Runs the searches concurrently,
+                without it they run one after the other
+
+        Returns:
+            list: Mapping of namespace to NamespaceMatches, one per text in input order
+        """
+        if min_score < 0.1 or min_score > 0.9: raise ValueError("Min Score value is not betwwen range 0.1 to 0.9")
+        if not query_texts:
+            return []
 
+        with timed("encode_batch"):
+            query_embeddings = self.model.encode(list(query_texts), normalize_embeddings=True)
+        searches = [
+            (position, name_space, query_embedding.tolist())
+            for position, query_embedding in enumerate(query_embeddings)
+            for name_space in NameSpaces
+        ]
+        if executor is None:
+            matches = [self._namespace_matches(embedding, name_space, min_score) for _, name_space, embedding in searches]
+        else:
+            # each search runs in a copy of the caller's context so its timing reaches the request
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._namespace_matches, embedding, name_space, min_score)
+                for _, name_space, embedding in searches
+            ]
+            matches = [future.result() for future in futures]
+        results = [{} for _ in query_texts]
+        for (position, name_space, _), namespace_matches in zip(searches, matches):
+            results[position][name_space] = namespace_matches
         return results
 
+    def query_vector_multiple(self, query_text, NameSpaces = ['default'], min_score = 0.7):
+        matches = self.query_vector_matches(query_text, NameSpaces=NameSpaces, min_score=min_score)
+        return {name_space: [metadata for _, metadata in ns_matches] for name_space, ns_matches in matches.items()}
+
+
+    @staticmethod
+    def _read_json_file(json_directory, filename):
+        """
+        Load a JSON file as a list of objects
+
+        Returns:
+            list: The objects, None if the file isn't valid JSON
+        """
+        with open(os.path.join(json_directory, filename), 'r', encoding='utf-8') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON in {filename}: {e}")
+                return None
+        return data if isinstance(data, list) else [data]
+
+    @staticmethod
+    def _vector_metadata(item, filename):
+        # Create metadata based on item content
+        metadata = {k: v for k, v in item.items() if k != "external_references"} 
+        metadata['_source_file'] = filename
+        return metadata
 
-    def upload_json_files(self, json_directory):
+    def upload_json_files(self, json_directory, workers=1, model_factory=None):
         """
         Upload JSON files from a directory to Pinecone
         
         Args:
             json_directory (str): Directory containing JSON files
+            workers (int, optional): Encoder processes, more than 1 shards the files across
+                processes (see _upload_json_files_sharded)
+            model_factory (callable, optional): Builds the encoder in each worker process instead
+                of loading the Sentence Transformer model, must be picklable
         """
+        if workers > 1:
+            return self._upload_json_files_sharded(json_directory, workers, model_factory)
         batch_vectors = []
+        batch_records = []
         file_count = 0
         item_count = 0
         batch_no = 1
         
-        for filename in os.listdir(json_directory):
+        for filename in sorted(os.listdir(json_directory)):
             if filename.endswith('.json'):
-                file_path = os.path.join(json_directory, filename)
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    try:
-                        data = json.load(f)
-                    except json.JSONDecodeError as e:
-                        print(f"Error decoding JSON in {filename}: {e}")
-                        continue
-                
-                if not isinstance(data, list):
-                    data = [data]
+                data = self._read_json_file(json_directory, filename)
+                if data is None:
+                    continue
                 
                 for item in data:
                     embedding = self.create_embedding(item)
                     vector_id = str(uuid.uuid4())
-                    # Create metadata based on item content
-                    metadata = {k: v for k, v in item.items() if k != "external_references"} 
-                    metadata['_source_file'] = filename
+                    metadata = self._vector_metadata(item, filename)
                     
                     batch_vectors.append((vector_id, embedding, metadata))
+                    if self.doc_store is not None:
+                        # Keep the full body locally, metadata is trimmed to fit Pinecone's limits
+                        batch_records.append((vector_id, {**item, '_source_file': filename}))
                     item_count += 1
                     
                     if len(batch_vectors) >= self.batch_size:
                         self.upsert_index(batch_vectors)
+                        self._store_records(batch_records)
                         print(f"Uploaded Batch Number : {batch_no}")
                         batch_no += 1
                         batch_vectors = []
+                        batch_records = []
                 
                 file_count += 1
                 print(f"Processed file: {filename}")
         
         if batch_vectors:
             self.upsert_index(batch_vectors)
+            self._store_records(batch_records)
         
         print(f"Upload completed: {file_count} files and {item_count} items processed.")
 
+    def _json_shards(self, json_directory, filenames):
+        # fixed-size slices of every file, in file then item order
+        for filename in filenames:
+            data = self._read_json_file(json_directory, filename)
+            if data is None:
+                continue
+            if not data:
+                # nothing to embed, still counted as processed like in the single process upload
+                yield filename, data, True
+            for start in range(0, len(data), INGEST_SHARD_SIZE):
+                yield filename, data[start:start + INGEST_SHARD_SIZE], start + INGEST_SHARD_SIZE >= len(data)
+
+    def _upload_json_files_sharded(self, json_directory, workers, model_factory=None):
+        """
+        Upload JSON files with the embedding spread over several processes
+
+        The files are cut into shards of INGEST_SHARD_SIZE objects, embedded by `workers` spawned
+        processes, each with its own encoder and torch limited to its share of the CPU cores
+        (INGEST_TORCH_THREADS). This process upserts the results in file and object order, so
+        the upsert stream is the same as with a single process, and reports the overall progress.
+        """
+        filenames = sorted(filename for filename in os.listdir(json_directory) if filename.endswith('.json'))
+        torch_threads = INGEST_TORCH_THREADS or max(1, (os.cpu_count() or 1) // workers)
+        print(f"Embedding {len(filenames)} files with {workers} processes of {torch_threads} threads")
+        file_count = 0
+        item_count = 0
+        start_time = time.perf_counter()
+        pending = deque()
+
+        def upsert_next():
+            nonlocal file_count, item_count
+            filename, items, last_shard, future = pending.popleft()
+            if future is not None:
+                embeddings = future.result()
+                vector_ids = [str(uuid.uuid4()) for _ in items]
+                batch_vectors = [
+                    (vector_id, embedding, self._vector_metadata(item, filename))
+                    for vector_id, embedding, item in zip(vector_ids, embeddings.tolist(), items)
+                ]
+                for start in range(0, len(batch_vectors), self.batch_size):
+                    self.upsert_index(batch_vectors[start:start + self.batch_size])
+                if self.doc_store is not None:
+                    # Keep the full body locally, metadata is trimmed to fit Pinecone's limits
+                    self._store_records([(vector_id, {**item, '_source_file': filename}) for vector_id, item in zip(vector_ids, items)])
+                item_count += len(items)
+            if last_shard:
+                file_count += 1
+                print(f"Processed file: {filename}")
+            elapsed = time.perf_counter() - start_time
+            print(f"Uploaded {item_count} items from {file_count}/{len(filenames)} files ({item_count / elapsed:.0f} items/s)")
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_embedding_worker,
+            initargs=(self.embedding_model, self.fields, torch_threads, model_factory)
+        ) as pool:
+            for filename, items, last_shard in self._json_shards(json_directory, filenames):
+                pending.append((filename, items, last_shard, pool.submit(_embed_shard, items) if items else None))
+                # a couple of shards queued per worker keeps them busy without loading every file at once
+                if len(pending) >= 2 * workers:
+                    upsert_next()
+            while pending:
+                upsert_next()
+
+        print(f"Upload completed: {file_count} files and {item_count} items processed.")
+
+
+# encoder of an ingestion worker process, set by _init_embedding_worker
+_worker_model = None
+_worker_fields = None
+
+
+def _init_embedding_worker(embedding_model, fields, torch_threads, model_factory=None):
+    global _worker_model, _worker_fields
+    try:
+        import torch
+        # every worker gets its share of the cores instead of all of them
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    _worker_model = model_factory() if model_factory else SentenceTransformer(embedding_model, device='cpu')
+    _worker_fields = fields
+
+
+def _embed_shard(items):
+    texts = [text_to_embed(item, _worker_fields) for item in items]
+    return np.asarray(_worker_model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+
+def _embedding_export_writer(namespace):
+    """
+    Export writer for an upload when EMBEDDING_EXPORT_DIR is set, one export directory per namespace
+    """
+    if not EMBEDDING_EXPORT_DIR:
+        return None
+    return EmbeddingExportWriter(os.path.join(EMBEDDING_EXPORT_DIR, namespace or "default"), model=os.getenv('MODEL'))
+
 
 class MitreVectorUploader:
     def __init__(self, json_directory=os.getenv('DATA_DIR_MITRE')):
@@ -210,19 +603,30 @@ class MitreVectorUploader:
         # Convert embed field to list if it's a string
         embedding_fields = [EMBD_FIELD] if EMBD_FIELD else None
     
+        DOC_STORE_PATH = os.getenv('DOC_STORE_PATH')
+    
         # Initialize uploader
         self.uploader = PineconeDB(
             PINECONE_API_KEY, 
             INDEX_NAME,
             embedding_fields=embedding_fields,
-            user_namespace=NAMESPACE
+            user_namespace=NAMESPACE,
+            doc_store=DocStore(DOC_STORE_PATH) if DOC_STORE_PATH else None,
+            embedding_export=_embedding_export_writer(NAMESPACE)
         )
        
     def upload_files(self):
         """
         Upload MITRE JSON files to Pinecone
         """
-        self.uploader.upload_json_files(self.json_directory)
+        completed = False
+        try:
+            self.uploader.upload_json_files(self.json_directory, workers=INGEST_WORKERS)
+            completed = True
+        finally:
+            # a failed upload leaves an export marked incomplete, never a half-written one
+            if self.uploader.embedding_export is not None:
+                self.uploader.embedding_export.close(complete=completed)
     
 
 class CsvVectorUploader:
@@ -249,12 +653,16 @@ class CsvVectorUploader:
         # Convert embed field to list if it's a string
         embedding_fields = EMBD_FIELD.split(',') if EMBD_FIELD else None
     
+        DOC_STORE_PATH = os.getenv('DOC_STORE_PATH')
+    
         # Initialize uploader
         self.uploader = PineconeDB(
             PINECONE_API_KEY, 
             INDEX_NAME,
             embedding_fields=embedding_fields,
-            user_namespace=NAMESPACE
+            user_namespace=NAMESPACE,
+            doc_store=DocStore(DOC_STORE_PATH) if DOC_STORE_PATH else None,
+            embedding_export=_embedding_export_writer(NAMESPACE)
         )
         
         # Convert CSV to JSON
@@ -290,7 +698,14 @@ class CsvVectorUploader:
         """
         Upload the converted JSON files to Pinecone
         """
-        self.uploader.upload_json_files(self.directory)
+        completed = False
+        try:
+            self.uploader.upload_json_files(self.directory, workers=INGEST_WORKERS)
+            completed = True
+        finally:
+            # a failed upload leaves an export marked incomplete, never a half-written one
+            if self.uploader.embedding_export is not None:
+                self.uploader.embedding_export.close(complete=completed)
 
 
 def main():
@@ -1,17 +1,95 @@
+import contextvars
 import json
 import requests
 import os
-from google import genai
-from google.genai import types
-from pineconedb import PineconeDB
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from requests.adapters import HTTPAdapter
+import numpy as np
+from pineconedb import PineconeDB, NamespaceMatches
+from docstore import DocStore
+from metrics import timed
+from llm import create_provider, REWRITE_MODEL, ANSWER_MODEL
+from rewrite import KeywordRewriter, terms_from_records, load_terms, REWRITE_TERMS_PATH
+from routing import NamespaceRouter, load_centroids, ROUTER_CENTROIDS_PATH
+
+# Matches kept per namespace, same as the top_k used by PineconeDB.query_vector_matches
+MAX_MATCHES_PER_NAMESPACE = 4
+RAG_WORKERS = int(os.getenv('RAG_WORKERS', 8))
+GITLAB_TIMEOUT = float(os.getenv('GITLAB_TIMEOUT', 10))
+# queries embedded per encoder call and answers generated concurrently by Rag_Batch_caller
+QUERY_BATCH_CHUNK = int(os.getenv('QUERY_BATCH_CHUNK', 64))
+QUERY_BATCH_WORKERS = int(os.getenv('QUERY_BATCH_WORKERS', 4))
+# deepest result page served by Rag_Search, per namespace
+SEARCH_MAX_DEPTH = int(os.getenv('SEARCH_MAX_DEPTH', 100))
+
+SYSTEM_INSTRUCTION = "Your name is Neko Chan. You are A CYBERSECURITY EXPERT AI ASSISTANT.Directly ANSWER THE QUERY WITHOUT MENTIONING ANYTHING ABOUT YOURSELF. Do not answer any question which is not your DOMAIN."
+ANSWER_TEMPERATURE = 0.8
+REWRITE_TEMPLATE = """Convert the following question to a text query for vector searcher & keep only its keywords and avoid unnecessary words:
+            '{raw_query}'.\nRephrase whole to a very refined query avoid writing that we need info """
+# prompt order is system instruction -> static preamble -> documents -> query, so the longest
+# possible prefix stays identical across requests for provider-side prompt caching
+ANSWER_PREAMBLE = """\n
+        following is the context:\n
+        ---\n"""
+ANSWER_TEMPLATE = ANSWER_PREAMBLE + """{full_context}\n
+        Now answer the following user query by giving a DETAILED DESCRIPTION : \n "{user_query}".
+        """
+# documents stay ahead of the (changing) history so follow-up turns share the prompt prefix
+CHAT_TEMPLATE = ANSWER_PREAMBLE + """{full_context}\n
+        Conversation so far:\n{history}\n
+        Now answer the user's latest message by giving a DETAILED DESCRIPTION : \n "{user_query}".
+        """
 
 class RagModel:
-    def __init__(self, PineconeAPIKey, GenAIKey, NameSpaces: list, Index_Name, min_score):
-        self.GenAI_Client = genai.Client(api_key = GenAIKey)
+    def __init__(self, PineconeAPIKey, GenAIKey, NameSpaces: list, Index_Name, min_score,
+                 doc_store_path=os.getenv('DOC_STORE_PATH'),
+                 speculative=os.getenv('SPECULATIVE_RETRIEVAL', 'false').lower() == 'true',
+                 rewrite_timeout=float(os.getenv('REWRITE_TIMEOUT', 2.0)),
+                 exploit_raw_base=os.getenv('EXPLOITDB_RAW_BASE', 'https://gitlab.com/exploit-database/exploitdb/-/raw/main'),
+                 rewrite_model=REWRITE_MODEL, answer_model=ANSWER_MODEL,
+                 answer_timeout=float(os.getenv('ANSWER_TIMEOUT', 60)),
+                 rewrite_mode=os.getenv('REWRITE_MODE', 'llm').lower(),
+                 namespace_routing=os.getenv('NAMESPACE_ROUTING', 'false').lower() == 'true',
+                 llm=None, pinecone_db=None):
+        # llm / pinecone_db let benchmarks plug in local stand-ins, LLM_PROVIDER=local does the same for the LLM
+        self.LLM = llm or create_provider(GenAIKey)
+        self.Rewrite_Model = rewrite_model
+        self.Answer_Model = answer_model
+        self.Answer_Timeout = answer_timeout
         self.Name_Spaces = NameSpaces
-        self.Pinecone_DB = PineconeDB(pinecone_api_key=PineconeAPIKey, index_name=Index_Name) 
+        # local copy of the full records, without it the (trimmed) Pinecone metadata is used
+        self.Doc_Store = DocStore(doc_store_path) if doc_store_path else None
+        self.Pinecone_DB = pinecone_db or PineconeDB(pinecone_api_key=PineconeAPIKey, index_name=Index_Name, doc_store=self.Doc_Store) 
+        self.Exploit_Raw_Base = exploit_raw_base.rstrip('/')
         # can add more fields for more robust framework
         self.Min_Score = min_score
+        # speculative mode searches with the raw query while the rewrite is still in flight
+        self.Speculative = speculative
+        self.Rewrite_Timeout = rewrite_timeout
+        # "local" rewrites with keyword extraction instead of an LLM round-trip
+        self.Rewrite_Mode = rewrite_mode
+        self.Rewriter = self._build_rewriter() if rewrite_mode == 'local' else None
+        # keyword extraction for chat turns, built on first use when the rewrite uses the LLM
+        self._chat_rewriter = self.Rewriter
+        self._chat_rewriter_lock = threading.Lock()
+        # searches only the namespaces a question is about, and fewer matches from the less likely ones
+        self.Router = self._build_router() if namespace_routing else None
+        self.Executor = ThreadPoolExecutor(max_workers=RAG_WORKERS)
+        # batch generation gets its own pool so a bulk job can't starve interactive queries
+        self.Batch_Executor = ThreadPoolExecutor(max_workers=QUERY_BATCH_WORKERS)
+        # pooled keep-alive connections for the GitLab fetches, one per worker
+        self.Http_Session = requests.Session()
+        self.Http_Session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=RAG_WORKERS))
+        self.Http_Session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=RAG_WORKERS))
+        # exploit files on GitLab never change, keep the recently rendered ones around
+        self._gitlab_cache = OrderedDict()
+        self._gitlab_cache_size = int(os.getenv('GITLAB_CACHE_SIZE', 256))
+        self._gitlab_cache_lock = threading.Lock()
+        self._render_cache = OrderedDict()
+        self._render_cache_size = int(os.getenv('RENDER_CACHE_SIZE', 2048))
+        self._render_cache_lock = threading.Lock()
     
     @staticmethod
     def _detect_language_from_url(url):
@@ -45,102 +123,490 @@ class RagModel:
             return url.replace("/-/blob/", "/-/raw/")
         return url  # Already raw or invalid
 
-    @staticmethod
-    def  _unpack_dict_list_default(dict_list: list):
-        output = []
-        for item in dict_list:
-            lines = []
-            for key, value in item.items():
-                # Convert non-string values to JSON-formatted string if needed
-                if not isinstance(value, str):
-                    value = json.dumps(value, indent=2)
-                lines.append(f"{key}: {value}")
-            output.append("\n".join(lines))
-        return "\n\n---\n\n".join(output)
-    
-    def  _unpack_dict_list_ExploitDB(self, dict_list: list):
-        output = []
-        for item in dict_list:
-            lines = []
-            for key, value in item.items():
-                # Convert non-string values to JSON-formatted string if needed
-                if not isinstance(value, str):
-                    value = json.dumps(value, indent=2)
-                lines.append(f"{key}: {value}")
-                if key=="file":
-                    lines.append(self.gitlab_file_to_markdown(f"https://gitlab.com/exploit-database/exploitdb/-/raw/main/{value}"))
-            output.append("\n".join(lines))
-        return "\n\n---\n\n".join(output)
+    def _render_record(self, name, vector_id, item):
+        """
+        Render one record as "key: value" lines, ExploitDB records with their exploit file
+
+        Rendered records are cached by namespace and vector ID, hot records are served without
+        being serialized again. Record IDs can't be used, MITRE IDs repeat across ATT&CK versions.
+        """
+        cache_key = (name, vector_id)
+        with self._render_cache_lock:
+            if cache_key in self._render_cache:
+                self._render_cache.move_to_end(cache_key)
+                return self._render_cache[cache_key]
+        lines = []
+        cacheable = True
+        for key, value in item.items():
+            # Convert non-string values to JSON-formatted string if needed
+            if not isinstance(value, str):
+                value = json.dumps(value, indent=2)
+            lines.append(f"{key}: {value}")
+            if name == "exploit_db" and key == "file":
+                markdown = self.gitlab_file_to_markdown(self._exploit_file_url(value))
+                # a failed fetch is retried next time instead of being cached
+                cacheable = bool(markdown)
+                lines.append(markdown)
+        text = "\n".join(lines)
+        if cacheable:
+            with self._render_cache_lock:
+                self._render_cache[cache_key] = text
+                if len(self._render_cache) > self._render_cache_size:
+                    self._render_cache.popitem(last=False)
+        return text
+
+    def _unpack_records(self, name, records):
+        # sorted by ID so the same records always produce the same prompt text
+        records = sorted(records or [], key=lambda pair: (str(pair[1].get("id", "")), pair[0]))
+        return "\n\n---\n\n".join(self._render_record(name, vector_id, item) for vector_id, item in records)
     
+    def _exploit_file_url(self, file_path):
+        return f"{self.Exploit_Raw_Base}/{file_path}"
+
     def gitlab_file_to_markdown(self, url):
         raw_url = self._convert_gitlab_url_to_raw(url)
+        with self._gitlab_cache_lock:
+            if raw_url in self._gitlab_cache:
+                self._gitlab_cache.move_to_end(raw_url)
+                return self._gitlab_cache[raw_url]
         language = self._detect_language_from_url(raw_url)
 
-        response = requests.get(raw_url)
+        try:
+            with timed("gitlab_fetch"):
+                response = self.Http_Session.get(raw_url, timeout=GITLAB_TIMEOUT)
+        except requests.RequestException as e:
+            # the record is still rendered without its file, and the fetch isn't cached
+            print(f"Fetching {raw_url} failed: {e}")
+            return ""
         if response.status_code != 200:
             return ""
 
         code = response.text
         markdown = f"```{language}\n{code}\n```"
+        with self._gitlab_cache_lock:
+            self._gitlab_cache[raw_url] = markdown
+            if len(self._gitlab_cache) > self._gitlab_cache_size:
+                self._gitlab_cache.popitem(last=False)
         return markdown
     
+    def _build_rewriter(self):
+        """
+        Build the local rewriter, its dictionary comes from REWRITE_TERMS_PATH and the doc store
+        """
+        rewriter = KeywordRewriter()
+        if REWRITE_TERMS_PATH and os.path.exists(REWRITE_TERMS_PATH):
+            rewriter.add_terms(load_terms(REWRITE_TERMS_PATH))
+        if self.Doc_Store is not None:
+            rewriter.add_terms(terms_from_records(self.Doc_Store.iter_records()))
+        print(f"Local query rewrite with {len(rewriter)} dictionary phrases")
+        return rewriter
+
+    def _build_router(self):
+        """
+        Build the namespace router, with the centroids from ROUTER_CENTROIDS_PATH if it exists
+        """
+        centroids = None
+        if ROUTER_CENTROIDS_PATH and os.path.exists(ROUTER_CENTROIDS_PATH):
+            centroids = load_centroids(ROUTER_CENTROIDS_PATH)
+        router = NamespaceRouter(self.Name_Spaces, centroids=centroids, top_k=MAX_MATCHES_PER_NAMESPACE)
+        print(f"Namespace routing with {'centroids and ' if centroids else ''}keyword rules")
+        return router
+
+    def _keyword_rewriter(self):
+        if self._chat_rewriter is None:
+            with self._chat_rewriter_lock:
+                if self._chat_rewriter is None:
+                    self._chat_rewriter = self._build_rewriter()
+        return self._chat_rewriter
+
     def _vector_query_generator(self, raw_query):
-        new_query = self.GenAI_Client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=f"""Convert the following question to a text query for vector searcher & keep only its keywords and avoid unnecessary words:
-        '{raw_query}'.\nRephrase whole to a very refined query avoid writing that we need info """).text
+        if self.Rewriter is not None:
+            with timed("rewrite"):
+                return self.Rewriter.rewrite(raw_query)
+        with timed("rewrite"):
+            new_query = self.LLM.generate(
+                self.Rewrite_Model, REWRITE_TEMPLATE.format(raw_query=raw_query), timeout=self.Rewrite_Timeout)
         return new_query
 
-    def _vector_data_retriever(self, query):
+    def _submit(self, fn, *args):
+        # run in the caller's context so stage timings reach the request that triggered them
+        return self.Executor.submit(contextvars.copy_context().run, fn, *args)
+
+    def _hydrate_records(self, query_matches):
+        """
+        Replace the Pinecone metadata of each match with the full record from the local doc store
+        """
+        if self.Doc_Store is None:
+            return {name: [metadata for _, metadata in matches] for name, matches in query_matches.items()}
+        # one local batch lookup for every namespace, no network round-trip
+        with timed("hydrate"):
+            records = self.Doc_Store.get_many([vector_id for matches in query_matches.values() for vector_id, _ in matches])
+        return {
+            name: [records.get(vector_id, metadata) for vector_id, metadata in matches]
+            for name, matches in query_matches.items()
+        }
+
+    @staticmethod
+    def _with_vector_ids(query_matches, query_results):
+        """
+        Pair each hydrated record with the vector ID of its match, as taken by _assemble_context
+        """
+        return {
+            name: [(vector_id, record) for (vector_id, _), record in zip(matches, query_results.get(name, []))]
+            for name, matches in query_matches.items()
+        }
+
+    def _hydrate_batch(self, batch_matches):
+        """
+        _hydrate_records for the results of several queries with a single doc store lookup
+        """
+        if self.Doc_Store is None:
+            return [self._hydrate_records(query_matches) for query_matches in batch_matches]
+        with timed("hydrate"):
+            records = self.Doc_Store.get_many(list({
+                vector_id for query_matches in batch_matches
+                for matches in query_matches.values() for vector_id, _ in matches}))
+        return [
+            {name: [records.get(vector_id, metadata) for vector_id, metadata in matches] for name, matches in query_matches.items()}
+            for query_matches in batch_matches
+        ]
+
+    def _search(self, query):
+        top_k = MAX_MATCHES_PER_NAMESPACE
+        if self.Router is not None:
+            # the query embedding is cached, routing doesn't add an encoder call
+            with timed("route"):
+                top_k = self.Router.route(query, self.Pinecone_DB.encode_query)
+        return self.Pinecone_DB.query_vector_matches(query_text=query, NameSpaces=self.Name_Spaces, min_score=self.Min_Score, top_k=top_k)
+
+    def _prefetch_exploit_files(self, query_results):
+        """
+        Warm the GitLab cache for the ExploitDB records so context assembly doesn't wait on it
+        """
+        for item in query_results.get("exploit_db") or []:
+            if "file" in item:
+                self._submit(self.gitlab_file_to_markdown, self._exploit_file_url(item["file"]))
+
+    @staticmethod
+    def _merge_matches(primary, secondary):
+        """
+        Merge two retrieval results namespace by namespace, matches from primary come first
+        """
+        merged = {}
+        for name in primary.keys() | secondary.keys():
+            ids, scores, metadata = [], [], []
+            for matches in (primary.get(name), secondary.get(name)):
+                for vector_id, score, item in zip(matches.ids, matches.scores, matches.metadata) if matches else ():
+                    if vector_id not in ids and len(ids) < MAX_MATCHES_PER_NAMESPACE:
+                        ids.append(vector_id)
+                        scores.append(score)
+                        metadata.append(item)
+            merged[name] = NamespaceMatches(name, ids, np.asarray(scores, dtype=np.float32), metadata)
+        return merged
+
+    def _speculative_retrieve(self, raw_query):
+        """
+        Search with the raw user query while the rewrite runs, then fold in the rewritten results
+
+        If the rewrite fails or doesn't arrive within Rewrite_Timeout, the raw results are used as is.
+        """
+        rewrite_future = self._submit(self._vector_query_generator, raw_query)
+        raw_matches = self._search(raw_query)
+        self._prefetch_exploit_files(self._hydrate_records(raw_matches))
+        try:
+            query = rewrite_future.result(timeout=self.Rewrite_Timeout)
+        except FutureTimeoutError:
+            print(f"Query rewrite timed out after {self.Rewrite_Timeout}s, using raw query results")
+            return raw_matches
+        except Exception as e:
+            print(f"Query rewrite failed, using raw query results: {e}")
+            return raw_matches
+        if not query or query.strip().lower() == raw_query.strip().lower():
+            return raw_matches
+        return self._merge_matches(self._search(query), raw_matches)
+
+    def _retrieve_matches(self, query):
+        # a local rewrite costs no round-trip, there is nothing to overlap it with
+        if self.Speculative and self.Rewriter is None:
+            return self._speculative_retrieve(query)
         # send query to ai model to refine it for vector search then query -> new query
-        query = self._vector_query_generator(query)
+        try:
+            query = self._vector_query_generator(query) or query
+        except Exception as e:
+            # the rewrite only refines the search, a timed out or failed call falls back to the raw query
+            print(f"Query rewrite failed, searching with the raw query: {e}")
         # Execute query
-        query_results = self.Pinecone_DB.query_vector_multiple(query_text=query, NameSpaces=self.Name_Spaces, min_score=self.Min_Score)
-        # unpack results to text
+        return self._search(query)
+
+    def _assemble_context(self, query_results):
+        # unpack results to text, query_results maps each namespace to (vector ID, record) pairs
         full_context_data=""
-        for name in self.Name_Spaces:
-            cnxt = "\n"
-            if name == "exploit_db":
-                cnxt += self._unpack_dict_list_ExploitDB(query_results.get(name))
-            else:
-                cnxt += self._unpack_dict_list_default(query_results.get(name))
-            full_context_data += cnxt
+        with timed("assemble"):
+            # namespaces in configuration order, records sorted within them
+            for name in self.Name_Spaces:
+                full_context_data += "\n" + self._unpack_records(name, query_results.get(name))
         #with open('query1.txt', 'w') as f1:
             #f1.write(full_context_data) # debug2
         return full_context_data
+
+    def _vector_data_retriever(self, query):
+        query_matches = self._retrieve_matches(query)
+        return self._assemble_context(self._with_vector_ids(query_matches, self._hydrate_records(query_matches)))
     
     
     def Rag_Generator_caller(self, user_query):
         full_context = self._vector_data_retriever(query=user_query)
-        template = f"""\n
-        following is the context:\n
-        ---\n{full_context}\n
-        Now answer the following user query by giving a DETAILED DESCRIPTION : \n "{user_query}".
-        """
-        rag_response = self.GenAI_Client.models.generate_content(
-            model = "gemini-2.0-flash",
-            config=types.GenerateContentConfig(
-                system_instruction="Your name is Neko Chan. You are A CYBERSECURITY EXPERT AI ASSISTANT.Directly ANSWER THE QUERY WITHOUT MENTIONING ANYTHING ABOUT YOURSELF. Do not answer any question which is not your DOMAIN.",
-                temperature=0.8
-            ),
-            contents = template
-        ).text
+        return self._generate_answer(user_query, full_context)
+
+    def _generate_answer(self, user_query, full_context):
+        with timed("generate"):
+            rag_response = self.LLM.generate(
+                self.Answer_Model,
+                ANSWER_TEMPLATE.format(full_context=full_context, user_query=user_query),
+                system_instruction=SYSTEM_INSTRUCTION,
+                temperature=ANSWER_TEMPERATURE,
+                timeout=self.Answer_Timeout
+            )
         return rag_response
+
+    def _generate_from_records(self, user_query, query_results):
+        return self._generate_answer(user_query, self._assemble_context(query_results))
     
-    def  Rag_Generator_stream_caller(self, user_query):
-        full_context = self._vector_data_retriever(query=user_query)
-        template = f"""\n
-        following is the context:\n
-        ---\n{full_context}\n
-        Now answer the following user query by giving a DETAILED DESCRIPTION : \n "{user_query}".
+    def Rag_Search(self, query, namespaces=None, top_k=10, min_score=None, fields=None, offset=0):
+        """
+        Retrieval only: rank the matching records of the selected namespaces by score
+
+        The query is searched as given, without rewrite or generation, so a repeated query
+        costs only the index lookups once its embedding is cached.
+
+        Args:
+            query (str): Text to search
+            namespaces (list, optional): Namespaces to search, defaults to all configured ones
+            top_k (int, optional): Results per page
+            min_score (float, optional): Minimum similarity score, defaults to Min_Score
+            fields (list, optional): Record fields to return, all fields when None
+            offset (int, optional): Results to skip, for pagination
+
+        Returns:
+            dict: "results" as dicts (namespace, id, score, record) best first, and "next_offset",
+                None on the last page
+
+        Raises:
+            ValueError: If a namespace isn't configured or min_score is out of range
         """
-        response = self.GenAI_Client.models.generate_content_stream(
-            model = "gemini-2.0-flash",
-            config=types.GenerateContentConfig(
-                system_instruction="Your name is Neko Chan. You are A CYBERSECURITY EXPERT AI ASSISTANT.Directly ANSWER THE QUERY WITHOUT MENTIONING ANYTHING ABOUT YOURSELF. Do not answer any question which is not your DOMAIN.",
-                temperature=0.8
+        namespaces = namespaces or self.Name_Spaces
+        unknown = [name for name in namespaces if name not in self.Name_Spaces]
+        if unknown:
+            raise ValueError(f"Unknown namespaces: {', '.join(unknown)}")
+        # every page is ranked from the top, each namespace has to return everything up to its end
+        depth = min(offset + top_k, SEARCH_MAX_DEPTH)
+        scored_matches = self.Pinecone_DB.search_matches(
+            query, NameSpaces=namespaces, top_k=depth, min_score=self.Min_Score if min_score is None else min_score)
+        ranked = sorted(
+            (
+                (score, name, vector_id, metadata)
+                for name, matches in scored_matches.items()
+                for vector_id, score, metadata in zip(matches.ids, matches.scores.tolist(), matches.metadata)
             ),
-            contents = template
+            key=lambda match: (-match[0], match[1], match[2])
+        )
+        page = ranked[offset:offset + top_k]
+        records = {}
+        if self.Doc_Store is not None and page:
+            with timed("hydrate"):
+                records = self.Doc_Store.get_many([vector_id for _, _, vector_id, _ in page])
+        results = []
+        for score, name, vector_id, metadata in page:
+            record = records.get(vector_id, metadata)
+            if fields:
+                record = {field: record[field] for field in fields if field in record}
+            results.append({"namespace": name, "id": vector_id, "score": score, "record": record})
+        # a namespace that filled its depth may have more matches past it
+        more = len(ranked) > offset + top_k or (
+            depth < SEARCH_MAX_DEPTH and any(len(matches) == depth for matches in scored_matches.values()))
+        return {"results": results, "next_offset": offset + top_k if more and offset + top_k < SEARCH_MAX_DEPTH else None}
+
+    def Rag_Batch_caller(self, queries, retrieval_only=False, chunk_size=QUERY_BATCH_CHUNK, cancelled=None):
+        """
+        Run many queries, yielding one result per query as soon as it is ready
+
+        Queries are processed chunk by chunk: a chunk is embedded in one encoder call, its
+        namespace searches run concurrently and its answers are generated on Batch_Executor.
+        Batch queries are searched as given (or with the local rewrite), an LLM rewrite per
+        query would cost more than the search itself.
+
+        Args:
+            queries (list): Queries, e.g. IOCs or log lines
+            retrieval_only (bool, optional): Return the matched records instead of generated answers
+            chunk_size (int, optional): Queries embedded per encoder call
+            cancelled (threading.Event, optional): Set by the caller to stop after the current result
+
+        Yields:
+            dict: "index" and "query" of the query, with "matches" (retrieval only), "answer" or "error".
+                Answers come in completion order within a chunk
+        """
+        def is_cancelled():
+            return cancelled is not None and cancelled.is_set()
+
+        for start in range(0, len(queries), chunk_size):
+            if is_cancelled():
+                return
+            chunk = queries[start:start + chunk_size]
+            search_texts = [self.Rewriter.rewrite(query) for query in chunk] if self.Rewriter is not None else chunk
+            try:
+                chunk_matches = self.Pinecone_DB.query_batch_matches(
+                    search_texts, NameSpaces=self.Name_Spaces, min_score=self.Min_Score, executor=self.Executor)
+                chunk_results = self._hydrate_batch(chunk_matches)
+            except Exception as e:
+                print(f"Batch retrieval failed for queries {start} to {start + len(chunk) - 1}: {e}")
+                for offset, query in enumerate(chunk):
+                    yield {"index": start + offset, "query": query, "error": str(e)}
+                continue
+
+            if retrieval_only:
+                for offset, (query, query_matches, query_results) in enumerate(zip(chunk, chunk_matches, chunk_results)):
+                    yield {"index": start + offset, "query": query, "matches": {
+                        name: [
+                            {"id": vector_id, "record": record}
+                            for (vector_id, _), record in zip(query_matches.get(name, []), query_results.get(name, []))
+                        ]
+                        for name in self.Name_Spaces
+                    }}
+                continue
+
+            futures = {
+                self.Batch_Executor.submit(
+                    contextvars.copy_context().run, self._generate_from_records, query,
+                    self._with_vector_ids(query_matches, query_results)
+                ): start + offset
+                for offset, (query, query_matches, query_results) in enumerate(zip(chunk, chunk_matches, chunk_results))
+            }
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        yield {"index": index, "query": queries[index], "answer": future.result()}
+                    except Exception as e:
+                        yield {"index": index, "query": queries[index], "error": str(e)}
+                    if is_cancelled():
+                        return
+            finally:
+                # answers nobody will read are not generated
+                for future in futures:
+                    future.cancel()
+
+    def Rag_Chat_caller(self, conversation, user_message):
+        """
+        Answer one turn of a conversation
+
+        Entities are extracted locally from the message (no rewrite call) and only those the
+        conversation has no documents for yet are searched, together with the previous turn's
+        keywords for context; a follow-up about known entities skips retrieval entirely. The
+        answer sees the conversation's documents, its rolling summary and the recent turns.
+
+        Args:
+            conversation (Conversation): Conversation state, updated with the turn
+            user_message (str): The user's message
+
+        Returns:
+            tuple: (answer, number of documents retrieved for this turn)
+        """
+        keywords = self._keyword_rewriter().keywords(user_message)
+        with conversation.lock:
+            new_entities = conversation.new_entities(keywords)
+            needs_retrieval = bool(new_entities) or not conversation.documents
+            context_keywords = conversation.turns[-1][2] if conversation.turns else []
+        retrieved = 0
+        if needs_retrieval:
+            # searched without the lock, the conversation's other messages aren't held up by it
+            query = " ".join(new_entities + [k for k in context_keywords if k not in new_entities]) or user_message
+            query_matches = self._search(query)
+            query_results = self._with_vector_ids(query_matches, self._hydrate_records(query_matches))
+            retrieved = sum(len(matches) for matches in query_matches.values())
+        with conversation.lock:
+            if needs_retrieval:
+                conversation.add_documents(query_results, new_entities)
+            documents = conversation.documents_by_namespace()
+            history = conversation.history()
+        full_context = self._assemble_context(documents)
+        with timed("generate"):
+            answer = self.LLM.generate(
+                self.Answer_Model,
+                CHAT_TEMPLATE.format(full_context=full_context, history=history or "(first message)",
+                                     user_query=user_message),
+                system_instruction=SYSTEM_INSTRUCTION,
+                temperature=ANSWER_TEMPERATURE,
+                timeout=self.Answer_Timeout
+            )
+        with conversation.lock:
+            conversation.add_turn(user_message, answer, keywords)
+        return answer, retrieved
+
+    def _generate_stream(self, user_query, full_context):
+        return self.LLM.stream(
+            self.Answer_Model,
+            ANSWER_TEMPLATE.format(full_context=full_context, user_query=user_query),
+            system_instruction=SYSTEM_INSTRUCTION,
+            temperature=ANSWER_TEMPERATURE,
+            timeout=self.Answer_Timeout
         )
-        for chunk in response : 
-            yield chunk.text
\ No newline at end of file
+
+    @staticmethod
+    def _timed_chunks(response):
+        # the time to the first chunk is what the user waits for, the rest streams
+        chunks = iter(response)
+        with timed("generate_first_token"):
+            first = next(chunks, None)
+        if first is None:
+            return
+        yield first
+        yield from chunks
+
+    def  Rag_Generator_stream_caller(self, user_query):
+        full_context = self._vector_data_retriever(query=user_query)
+        response = self._generate_stream(user_query, full_context)
+        for chunk in self._timed_chunks(response) : 
+            yield chunk
+
+    def Rag_Generator_event_stream(self, user_query, cancelled=None):
+        """
+        Run the RAG pipeline as a sequence of structured events for Server-Sent Events
+
+        Args:
+            user_query (str): Question asked by the user
+            cancelled (threading.Event, optional): Set by the caller to stop the pipeline
+                at the next stage boundary or generated chunk
+
+        Yields:
+            tuple: (event name, JSON-serializable payload), events are
+                retrieval_started, sources, generation_started, token and done
+        """
+        def is_cancelled():
+            return cancelled is not None and cancelled.is_set()
+
+        yield "retrieval_started", {"query": user_query}
+        query_matches = self._retrieve_matches(user_query)
+        if is_cancelled():
+            return
+        query_results = self._hydrate_records(query_matches)
+        yield "sources", {
+            name: [
+                {"id": vector_id, "name": record.get("name") or record.get("description", "")}
+                for (vector_id, _), record in zip(query_matches.get(name, []), query_results.get(name, []))
+            ]
+            for name in self.Name_Spaces
+        }
+        full_context = self._assemble_context(self._with_vector_ids(query_matches, query_results))
+        if is_cancelled():
+            return
+        yield "generation_started", {}
+        response = self._generate_stream(user_query, full_context)
+        try:
+            for chunk in self._timed_chunks(response):
+                if is_cancelled():
+                    return
+                yield "token", {"text": chunk}
+        finally:
+            # stop pulling from the LLM when the client went away
+            response.close()
+        yield "done", {}
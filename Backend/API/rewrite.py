@@ -0,0 +1,181 @@
+"""
+Local query rewriting: keyword extraction with stopword removal and a dictionary of security
+terms, used instead of the LLM rewrite when REWRITE_MODE=local
+
+The dictionary is built from the MITRE names and ExploitDB descriptions of the ingested data, so
+multi-word terms ("Pass the Hash", "Remote Code Execution") survive stopword removal intact.
+
+    python rewrite.py --mitre-dir ../data/Mitre_Strix/chunked-enterprise --exploit-csv ../data/ExploitDB/filtered_exploits.csv --out terms.txt
+"""
+import argparse
+import csv
+import json
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv("API.env")
+
+REWRITE_TERMS_PATH = os.getenv("REWRITE_TERMS_PATH")
+REWRITE_MAX_KEYWORDS = int(os.getenv("REWRITE_MAX_KEYWORDS", 16))
+# longest dictionary phrase matched, in words
+MAX_PHRASE_WORDS = 6
+
+# keeps identifiers like CVE-2021-44228, T1059.001 and version numbers in one token
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9._\-/]*[A-Za-z0-9]|[A-Za-z0-9]")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further had has
+have having he her here hers him his how i if in into is it its itself just me more most my no nor
+not now of off on once only or other our out over own same she should so some such than that the
+their them then there these they this those through to too under until up very was we were what
+when where which while who whom why will with would you your yours
+tell explain describe detail details give show list info information please know want need
+regarding related works work used using use does mean meaning example examples kind kinds
+else anything something another others besides additionally instead elaborate expand continue go
+again next previous mentioned one ones thing things ok okay yes yeah sure thanks thank let lets us
+s t d ll m re ve
+""".split())
+
+# common terms not necessarily present as names in the data
+BUILTIN_TERMS = (
+    "remote code execution", "sql injection", "cross-site scripting", "cross-site request forgery",
+    "privilege escalation", "buffer overflow", "denial of service", "directory traversal",
+    "path traversal", "command injection", "authentication bypass", "arbitrary file upload",
+    "lateral movement", "command and control", "credential dumping", "pass the hash",
+    "zero day", "proof of concept", "reverse shell", "use after free",
+)
+
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(text)
+
+
+def terms_from_records(records):
+    """
+    Extract dictionary terms from MITRE and ExploitDB shaped records
+
+    MITRE records contribute their name, ExploitDB records the product and vulnerability parts
+    of their description ("Apache Struts 2.3 - Remote Code Execution"), without version numbers.
+
+    Args:
+        records (iterable): Record dicts
+
+    Returns:
+        set: Terms
+    """
+    terms = set()
+    for record in records:
+        if record.get("name"):
+            terms.add(record["name"])
+        elif record.get("description") and record.get("file"):
+            for part in re.split(r" - |[&(),:]", record["description"]):
+                words = [word for word in tokenize(part) if not any(ch.isdigit() for ch in word)]
+                if words:
+                    terms.add(" ".join(words))
+    return terms
+
+
+class KeywordRewriter:
+    def __init__(self, terms=(), max_keywords=REWRITE_MAX_KEYWORDS):
+        """
+        Turn a question into a keyword query for the vector search without an LLM call
+
+        Args:
+            terms (iterable, optional): Security terms kept as phrases, on top of BUILTIN_TERMS
+            max_keywords (int, optional): Words kept in the rewritten query
+        """
+        self.max_keywords = max_keywords
+        self._phrases = {}  # first word -> set of phrases as lower-case word tuples
+        self.add_terms(BUILTIN_TERMS)
+        self.add_terms(terms)
+
+    def add_terms(self, terms):
+        for term in terms:
+            words = tuple(word.lower() for word in tokenize(term))
+            # single words survive stopword removal anyway unless they are stopwords
+            if 1 < len(words) <= MAX_PHRASE_WORDS or (len(words) == 1 and words[0] in STOPWORDS):
+                self._phrases.setdefault(words[0], set()).add(words)
+
+    def __len__(self):
+        return sum(len(phrases) for phrases in self._phrases.values())
+
+    def rewrite(self, query):
+        """
+        Rewrite a question into its keywords, dictionary phrases first
+
+        Returns:
+            str: The keyword query, the original query if no keyword is left
+        """
+        return " ".join(self.keywords(query)) or query
+
+    def keywords(self, query):
+        """
+        Extract the dictionary phrases and remaining keywords of a question
+
+        Returns:
+            list: Phrases then keywords, in order of appearance, at most max_keywords words
+        """
+        words = tokenize(query)
+        lowered = [word.lower() for word in words]
+        phrases, keywords, seen = [], [], set()
+        i = 0
+        while i < len(words):
+            match = 0
+            for phrase in self._phrases.get(lowered[i], ()):
+                if len(phrase) > match and tuple(lowered[i:i + len(phrase)]) == phrase:
+                    match = len(phrase)
+            if match:
+                phrase = " ".join(words[i:i + match])
+                if phrase.lower() not in seen:
+                    seen.add(phrase.lower())
+                    phrases.append(phrase)
+                i += match
+                continue
+            if lowered[i] not in STOPWORDS and lowered[i] not in seen:
+                seen.add(lowered[i])
+                keywords.append(words[i])
+            i += 1
+        kept, count = [], 0
+        for part in phrases + keywords:
+            count += len(part.split())
+            if count > self.max_keywords and kept:
+                break
+            kept.append(part)
+        return kept
+
+
+def load_terms(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _read_json_records(directory):
+    for filename in os.listdir(directory):
+        if filename.endswith(".json"):
+            with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            yield from (data if isinstance(data, list) else [data])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the security term dictionary of the local query rewrite")
+    parser.add_argument("--mitre-dir", action="append", default=[], help="Directory of filtered or chunked MITRE JSON files")
+    parser.add_argument("--exploit-csv", action="append", default=[], help="Filtered ExploitDB CSV file")
+    parser.add_argument("--out", required=True, help="Terms file, one term per line (REWRITE_TERMS_PATH)")
+    args = parser.parse_args()
+
+    terms = set()
+    for directory in args.mitre_dir:
+        terms |= terms_from_records(_read_json_records(directory))
+    for path in args.exploit_csv:
+        with open(path, "r", encoding="utf-8") as f:
+            terms |= terms_from_records(csv.DictReader(f))
+    with open(args.out, "w", encoding="utf-8") as f:
+        f.write("\n".join(sorted(terms)) + "\n")
+    print(f"Wrote {len(terms)} terms to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Namespace routing: pick the namespaces worth searching for a query, and how many matches to
+take from each, from keyword rules and the similarity of the query to per-namespace centroids
+
+The centroids are the normalized mean embeddings of each namespace's records, built once from
+the doc store with the same encoder as the index:
+
+    python routing.py --doc-store docs.sqlite3 --namespace mitre_stix=name,description --namespace exploit_db=description --out centroids.json
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv("API.env")
+
+ROUTER_CENTROIDS_PATH = os.getenv("ROUTER_CENTROIDS_PATH")
+# a namespace this far below the best one gets half the matches, twice as far none
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", 0.05))
+# added to the score of a namespace whose keyword rules match, enough to decide on its own
+ROUTER_KEYWORD_WEIGHT = float(os.getenv("ROUTER_KEYWORD_WEIGHT", 0.15))
+
+DEFAULT_RULES = {
+    "exploit_db": [
+        r"\bcve-\d{4}-\d+\b", r"\bedb-id\b", r"\bexploit(s|ed|able|ing)?\b", r"\bpoc\b", r"\bproof of concept\b",
+        r"\bvulnerab(le|ility|ilities)\b", r"\bvuln\b", r"\brce\b", r"\bremote code execution\b",
+        r"\bsql injection\b", r"\bsqli\b", r"\bxss\b", r"\bcross-site\b", r"\bbuffer overflow\b",
+        r"\bshellcode\b", r"\bmetasploit\b", r"\bpayload\b", r"\bv?\d+\.\d+(\.\d+)*\b",
+    ],
+    "mitre_stix": [
+        r"\bt\d{4}(\.\d{3})?\b", r"\b[gs]\d{4}\b", r"\bapt\s?\d*\b", r"\bthreat (group|actor)s?\b",
+        r"\bgroup\b", r"\bactor\b", r"\bcampaign\b", r"\btechniques?\b", r"\btactics?\b", r"\bttps?\b",
+        r"\bmitigations?\b", r"\bmalware\b", r"\bmitre\b", r"\batt&ck\b", r"\bpersistence\b",
+        r"\blateral movement\b", r"\bcommand and control\b", r"\binitial access\b", r"\bdefense evasion\b",
+        r"\bexfiltration\b", r"\bcredential (dumping|access)\b",
+    ],
+}
+
+
+def record_text(record, fields=None):
+    """
+    Text of a record as embedded at ingestion, the selected fields or the whole record as JSON
+    """
+    text = " ".join(str(record.get(field, "")) for field in fields).strip() if fields else ""
+    return text or json.dumps(record, ensure_ascii=False)
+
+
+def build_centroids(encoder, records_by_namespace, fields=None, batch_size=256):
+    """
+    Compute the normalized mean embedding of each namespace
+
+    Args:
+        encoder: SentenceTransformer compatible encoder
+        records_by_namespace (dict): Namespace to iterable of records
+        fields (dict, optional): Namespace to the fields embedded at ingestion
+        batch_size (int, optional): Records per encoder call
+
+    Returns:
+        dict: Namespace to centroid (list)
+    """
+    centroids = {}
+    for namespace, records in records_by_namespace.items():
+        texts = [record_text(record, (fields or {}).get(namespace)) for record in records]
+        if not texts:
+            continue
+        total = None
+        for start in range(0, len(texts), batch_size):
+            batch_sum = np.asarray(encoder.encode(texts[start:start + batch_size], normalize_embeddings=True)).sum(axis=0)
+            total = batch_sum if total is None else total + batch_sum
+        norm = np.linalg.norm(total)
+        centroids[namespace] = (total / norm if norm else total).tolist()
+    return centroids
+
+
+def load_centroids(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class NamespaceRouter:
+    def __init__(self, namespaces, centroids=None, rules=None, top_k=4, margin=ROUTER_MARGIN,
+                 keyword_weight=ROUTER_KEYWORD_WEIGHT):
+        """
+        Choose the namespaces to search for a query and the matches to take from each
+
+        Each namespace scores its centroid similarity to the query plus keyword_weight if one
+        of its rules matches. The best namespaces get top_k matches, those more than margin
+        below the best get half and those more than twice the margin below are skipped. A
+        query matching no rule, with no centroids loaded, searches every namespace.
+
+        Args:
+            namespaces (list): Configured namespaces
+            centroids (dict, optional): Namespace to normalized mean embedding
+            rules (dict, optional): Namespace to regular expressions, defaults to DEFAULT_RULES
+            top_k (int, optional): Matches taken from the best namespaces
+            margin (float, optional): Score gap to the best namespace before matches are cut
+            keyword_weight (float, optional): Score added by a matching keyword rule
+        """
+        self.namespaces = list(namespaces)
+        self.top_k = top_k
+        self.margin = margin
+        self.keyword_weight = keyword_weight
+        rules = DEFAULT_RULES if rules is None else rules
+        self._rules = {
+            namespace: re.compile("|".join(f"(?:{pattern})" for pattern in rules[namespace]), re.IGNORECASE)
+            for namespace in self.namespaces if rules.get(namespace)
+        }
+        centroids = {namespace: vector for namespace, vector in (centroids or {}).items() if namespace in self.namespaces}
+        self._centroid_names = list(centroids)
+        self._centroids = np.asarray([centroids[namespace] for namespace in self._centroid_names], dtype=np.float32)
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.searched = 0
+        self.skipped = 0
+
+    def scores(self, query, embed=None):
+        """
+        Score every namespace for a query
+
+        Args:
+            query (str): Query text
+            embed (callable, optional): Returns the query embedding, only called with centroids loaded
+
+        Returns:
+            dict: Namespace to score
+        """
+        scores = dict.fromkeys(self.namespaces, 0.0)
+        if len(self._centroid_names) and embed is not None:
+            similarities = self._centroids @ np.asarray(embed(query), dtype=np.float32)
+            for namespace, similarity in zip(self._centroid_names, similarities):
+                scores[namespace] = float(similarity)
+        for namespace, pattern in self._rules.items():
+            if pattern.search(query):
+                scores[namespace] += self.keyword_weight
+        return scores
+
+    def route(self, query, embed=None):
+        """
+        Matches to take from each namespace for a query
+
+        Returns:
+            dict: Namespace to number of matches, 0 for namespaces not worth searching
+        """
+        scores = self.scores(query, embed)
+        best = max(scores.values(), default=0.0)
+        routes = {}
+        for namespace, score in scores.items():
+            gap = best - score
+            if gap <= self.margin:
+                routes[namespace] = self.top_k
+            elif gap <= 2 * self.margin:
+                routes[namespace] = max(1, self.top_k // 2)
+            else:
+                routes[namespace] = 0
+        with self._lock:
+            self.routed += 1
+            self.searched += sum(1 for top_k in routes.values() if top_k)
+            self.skipped += sum(1 for top_k in routes.values() if not top_k)
+        return routes
+
+    def stats(self):
+        return {"queries": self.routed, "namespaces_searched": self.searched, "namespaces_skipped": self.skipped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the per-namespace centroids of the namespace router")
+    parser.add_argument("--doc-store", default=os.getenv("DOC_STORE_PATH"), help="Doc store holding the ingested records")
+    parser.add_argument("--namespace", action="append", required=True,
+                        help="Namespace to build, optionally with the fields embedded at ingestion: name=field1,field2")
+    parser.add_argument("--sample", type=int, default=5000, help="Records encoded per namespace")
+    parser.add_argument("--model", default=os.getenv("MODEL"), help="Sentence Transformer model used by the index")
+    parser.add_argument("--out", required=True, help="Centroids file (ROUTER_CENTROIDS_PATH)")
+    args = parser.parse_args()
+    if not args.doc_store:
+        raise ValueError("--doc-store or DOC_STORE_PATH is required")
+
+    from itertools import islice
+    from sentence_transformers import SentenceTransformer
+    from docstore import DocStore
+
+    doc_store = DocStore(args.doc_store)
+    records, fields = {}, {}
+    for spec in args.namespace:
+        namespace, _, field_list = spec.partition("=")
+        fields[namespace] = [field for field in field_list.split(",") if field] or None
+        records[namespace] = list(islice(doc_store.iter_records(namespace), args.sample))
+        print(f"{namespace}: {len(records[namespace])} records")
+    centroids = build_centroids(SentenceTransformer(args.model, device="cpu"), records, fields)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(centroids, f)
+    print(f"Wrote {len(centroids)} centroids to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+load_dotenv("API.env")
+
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", 3))
+CHAT_SUMMARY_CHARS = int(os.getenv("CHAT_SUMMARY_CHARS", 1500))
+CHAT_MAX_DOCUMENTS = int(os.getenv("CHAT_MAX_DOCUMENTS", 16))
+# answers are quoted in the history up to this length
+_ANSWER_EXCERPT_CHARS = 400
+
+
+class Conversation:
+    def __init__(self, conversation_id, username):
+        """
+        State of one chat conversation: the documents retrieved so far, the entities they were
+        retrieved for and the history (recent turns verbatim, older ones in a rolling summary)
+
+        Callers hold `lock` while reading or updating the state, not across retrieval or generation:
+        concurrent messages of a conversation each see the history as it was when they started.
+
+        Args:
+            conversation_id (str): ID returned to the client
+            username (str): Owner, from the JWT
+        """
+        self.id = conversation_id
+        self.username = username
+        self.lock = threading.Lock()
+        self.documents = OrderedDict()  # (namespace, vector ID) -> record, oldest first
+        self.entities = set()  # lower-cased keywords already retrieved for
+        self.summary = ""
+        self.turns = deque()  # (question, answer excerpt, keywords) of the last CHAT_RECENT_TURNS turns
+        self.turn_count = 0
+        self.last_used = time.monotonic()
+
+    def new_entities(self, keywords):
+        return [keyword for keyword in keywords if keyword.lower() not in self.entities]
+
+    def add_documents(self, query_results, keywords, max_documents=CHAT_MAX_DOCUMENTS):
+        """
+        Remember newly retrieved documents, the least recently retrieved ones are dropped past max_documents
+
+        Args:
+            query_results (dict): Namespace to list of (vector ID, record)
+            keywords (list): Entities the documents were retrieved for
+        """
+        self.entities.update(keyword.lower() for keyword in keywords)
+        for name, matches in query_results.items():
+            for vector_id, record in matches:
+                self.documents.pop((name, vector_id), None)
+                self.documents[(name, vector_id)] = record
+        while len(self.documents) > max_documents:
+            self.documents.popitem(last=False)
+
+    def documents_by_namespace(self):
+        # (vector ID, record) pairs, as taken by context assembly
+        results = {}
+        for (name, vector_id), record in self.documents.items():
+            results.setdefault(name, []).append((vector_id, record))
+        return results
+
+    def add_turn(self, question, answer, keywords, recent_turns=CHAT_RECENT_TURNS,
+                 summary_chars=CHAT_SUMMARY_CHARS):
+        """
+        Append a turn, folding the oldest recent turn into the rolling summary
+
+        The summary keeps one line per older turn (its keywords and the start of the answer) and
+        drops its oldest lines beyond summary_chars, so prompts stay bounded however long the chat.
+        """
+        self.turns.append((question, answer[:_ANSWER_EXCERPT_CHARS], keywords))
+        self.turn_count += 1
+        while len(self.turns) > recent_turns:
+            old_question, old_answer, old_keywords = self.turns.popleft()
+            first_sentence = old_answer.split(". ")[0].strip()[:200]
+            line = f"- asked about {', '.join(old_keywords) or old_question[:80]}: {first_sentence}"
+            lines = (self.summary.splitlines() if self.summary else []) + [line]
+            while len(lines) > 1 and sum(len(l) + 1 for l in lines) > summary_chars:
+                lines.pop(0)
+            self.summary = "\n".join(lines)
+
+    def history(self):
+        """
+        Render the summary and recent turns for the prompt
+        """
+        parts = []
+        if self.summary:
+            parts.append(f"Earlier in this conversation:\n{self.summary}")
+        for question, answer, _ in self.turns:
+            parts.append(f"User: {question}\nAssistant: {answer}")
+        return "\n\n".join(parts)
+
+
+class ConversationStore:
+    def __init__(self, max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", 10000)),
+                 ttl=float(os.getenv("CHAT_SESSION_TTL", 1800))):
+        """
+        Bounded in-memory store of chat conversations, keyed by username and conversation ID
+
+        Args:
+            max_sessions (int, optional): Conversations kept, least recently used ones are evicted
+            ttl (float, optional): Seconds of inactivity after which a conversation expires
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._conversations = OrderedDict()  # (username, conversation ID) -> Conversation
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def _expire(self, now):
+        # least recently used first, stop at the first one still alive
+        while self._conversations:
+            conversation = next(iter(self._conversations.values()))
+            if now - conversation.last_used <= self.ttl:
+                break
+            self._conversations.popitem(last=False)
+            self.expired += 1
+
+    def get_or_create(self, username, conversation_id=None):
+        """
+        Return the user's conversation, or a new one if the ID is missing, unknown or expired
+
+        Conversations are looked up under the caller's username, IDs of other users are never found.
+
+        Returns:
+            Conversation: The conversation
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            conversation = self._conversations.get((username, conversation_id)) if conversation_id else None
+            if conversation is None:
+                conversation = Conversation(str(uuid.uuid4()), username)
+                self._conversations[(username, conversation.id)] = conversation
+                if len(self._conversations) > self.max_sessions:
+                    self._conversations.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._conversations.move_to_end((username, conversation_id))
+            conversation.last_used = now
+            return conversation
+
+    def delete(self, username, conversation_id):
+        """
+        Delete a conversation
+
+        Returns:
+            bool: Whether the conversation existed
+        """
+        with self._lock:
+            return self._conversations.pop((username, conversation_id), None) is not None
+
+    def stats(self):
+        return {"sessions": len(self._conversations), "evicted": self.evicted, "expired": self.expired}
@@ -0,0 +1,32 @@
+"""
+Shared setup of the API tests, run from Backend/API:
+
+    python -m pytest -q tests
+
+The modules read their configuration at import time, so the environment is set up before any
+of them is imported: SQLite instead of MySQL, a temporary journal, and the local stand-ins
+(bench_fakes) instead of Pinecone, the encoder and Gemini.
+"""
+import os
+import sys
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="datin-tests-")
+for name, value in {
+    "USE_LOCAL_STANDINS": "true",
+    "DB_BACKEND": "sqlite",
+    "SQLITE_PATH": os.path.join(_TMP_DIR, "datin.sqlite3"),
+    "LOG_QUEUE_DIR": os.path.join(_TMP_DIR, "log_queue"),
+    "NAMESPACES": "mitre_stix",
+    "STANDIN_CORPUS_SIZE": "50",
+    "STANDIN_INDEX_LATENCY": "0",
+    "STANDIN_LLM_FIRST_TOKEN": "0",
+    "STANDIN_LLM_TOKENS": "5",
+    "STANDIN_LLM_TOKEN_INTERVAL": "0",
+    "RAG_MAX_CONCURRENT": "2",
+    "RATE_LIMIT_BURST": "1000",
+    "BCRYPT_EXECUTOR": "thread",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+from admission import AdmissionController, SlotStreamingResponse
+
+
+def http_scope(path, query_string=b"", spec_version="2.3", headers=()):
+    return {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": spec_version}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query_string, "headers": [(b"host", b"test"), *headers],
+        "client": ("127.0.0.1", 50000), "server": ("test", 80),
+    }
+
+
+def request_receiver(body=b"", disconnect=False):
+    # the request body, then the client leaving or nothing until the server gives up on it
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        if disconnect:
+            return {"type": "http.disconnect"}
+        await asyncio.Event().wait()
+    return receive
+
+
+def body_with_cleanup(log):
+    async def body():
+        try:
+            for chunk in ("a", "b"):
+                yield chunk
+        finally:
+            log.append("closed")
+    return body()
+
+
+def test_admission_sheds_when_queue_is_full():
+    async def run():
+        admission = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=1)
+        await admission.acquire()
+        with pytest.raises(HTTPException) as error:
+            await admission.acquire()
+        assert error.value.status_code == 429
+        assert admission.shed == 1
+        admission.release()
+        async with admission.slot():
+            assert admission.active == 1
+        assert admission.active == 0
+    asyncio.run(run())
+
+
+def test_admission_sheds_after_queue_timeout():
+    async def run():
+        admission = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        await admission.acquire()
+        with pytest.raises(HTTPException) as error:
+            await admission.acquire()
+        assert error.value.status_code == 429 and error.value.headers["Retry-After"] == "1"
+        assert admission.waiting == 0 and admission.active == 1
+        admission.release()
+    asyncio.run(run())
+
+
+def test_slot_is_released_when_the_block_fails():
+    async def run():
+        admission = AdmissionController(max_concurrent=1)
+        with pytest.raises(RuntimeError):
+            async with admission.slot():
+                raise RuntimeError("pipeline failed")
+        assert admission.active == 0
+        async with admission.slot():
+            assert admission.active == 1
+    asyncio.run(run())
+
+
+def test_slot_response_releases_after_full_body():
+    async def run():
+        released, log, sent = [], [], []
+
+        async def send(message):
+            sent.append(message)
+
+        response = SlotStreamingResponse(body_with_cleanup(log), lambda: released.append(1), media_type="text/plain")
+        await response(http_scope("/"), request_receiver(), send)
+        assert b"".join(message.get("body", b"") for message in sent) == b"ab"
+        assert released == [1] and log == ["closed"]
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+def test_slot_response_releases_when_response_start_fails(spec_version):
+    async def run():
+        released, log = [], []
+
+        async def send(message):
+            raise OSError("connection reset")
+
+        response = SlotStreamingResponse(body_with_cleanup(log), lambda: released.append(1))
+        with pytest.raises(Exception):
+            await response(http_scope("/", spec_version=spec_version), request_receiver(), send)
+        # the body never started, its finally had nothing to run
+        assert released == [1] and log == []
+    asyncio.run(run())
+
+
+def test_slot_response_releases_when_client_gone_before_start():
+    async def run():
+        released, log = [], []
+
+        async def send(message):
+            await asyncio.sleep(0)
+
+        response = SlotStreamingResponse(body_with_cleanup(log), lambda: released.append(1))
+        await response(http_scope("/"), request_receiver(disconnect=True), send)
+        assert released == [1]
+    asyncio.run(run())
+
+
+@pytest.fixture(scope="module")
+def main_module():
+    import main
+    return main
+
+
+# route, query string, JSON body: every route taking an admission slot for a streamed response
+SLOT_ROUTES = [
+    ("/query-stream", b"query=APT28+tools", b""),
+    ("/query-stream", b"query=APT28+tools&sse=true", b""),
+    ("/query-batch", b"", json.dumps({"queries": ["APT28 tools", "Apache Struts"]}).encode()),
+]
+
+
+def route_scope(path, query_string):
+    return http_scope(path, query_string, headers=[(b"content-type", b"application/json")])
+
+
+@pytest.mark.parametrize("path,query_string,body", SLOT_ROUTES)
+def test_route_slot_released_when_response_start_fails(main_module, path, query_string, body):
+    async def run():
+        async def send(message):
+            if message["type"] == "http.response.start":
+                raise OSError("connection reset")
+
+        for _ in range(main_module.admission.max_concurrent + 1):
+            with pytest.raises(Exception):
+                await main_module.app(route_scope(path, query_string), request_receiver(body), send)
+            assert main_module.admission.active == 0
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("path,query_string,body", SLOT_ROUTES)
+def test_route_slot_released_when_client_gone_before_start(main_module, path, query_string, body):
+    async def run():
+        async def send(message):
+            await asyncio.sleep(0)
+
+        for _ in range(main_module.admission.max_concurrent + 1):
+            await main_module.app(route_scope(path, query_string), request_receiver(body, disconnect=True), send)
+            assert main_module.admission.active == 0
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("path,query_string,body", SLOT_ROUTES)
+def test_route_slot_released_after_full_response(main_module, path, query_string, body):
+    async def run():
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await main_module.app(route_scope(path, query_string), request_receiver(body), send)
+        assert sent[0]["status"] == 200 and not sent[-1]["more_body"]
+        assert main_module.admission.active == 0
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("path,query_string,body", SLOT_ROUTES)
+def test_route_slot_released_when_client_leaves_mid_stream(main_module, path, query_string, body):
+    async def run():
+        async def send(message):
+            if message["type"] == "http.response.body":
+                raise OSError("connection reset")
+
+        with pytest.raises(Exception):
+            await main_module.app(route_scope(path, query_string), request_receiver(body), send)
+        assert main_module.admission.active == 0
+    asyncio.run(run())
+
+
+def test_query_slot_released_when_the_pipeline_fails(main_module, monkeypatch):
+    import httpx
+
+    def failing(user_query):
+        raise RuntimeError("pipeline failed")
+    monkeypatch.setattr(main_module.Rag_Model, "Rag_Generator_caller", failing)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main_module.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*[
+                client.post("/query", params={"query": f"question {i}"})
+                for i in range(main_module.admission.max_concurrent + 1)
+            ])
+        assert [response.status_code for response in responses] == [500] * len(responses)
+        assert main_module.admission.active == 0
+    asyncio.run(run())
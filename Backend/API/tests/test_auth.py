@@ -0,0 +1,30 @@
+import time
+from auth import VerifiedTokenCache
+
+
+def test_cached_payload_expires_with_the_token():
+    cache = VerifiedTokenCache(ttl=60)
+    cache.put("fresh", {"username": "u", "exp": time.time() + 30})
+    cache.put("expired", {"username": "u", "exp": time.time() - 1})
+    assert cache.get("fresh")["username"] == "u"
+    assert cache.get("expired") is None and cache.get("unknown") is None
+
+
+def test_least_recently_used_tokens_are_evicted():
+    cache = VerifiedTokenCache(max_size=2, ttl=60)
+    payload = {"username": "u", "exp": time.time() + 30}
+    cache.put("a", payload)
+    cache.put("b", payload)
+    cache.get("a")
+    cache.put("c", payload)
+    assert cache.get("a") is not None and cache.get("b") is None and cache.get("c") is not None
+
+
+def test_revoked_token_stays_revoked_until_it_expires():
+    cache = VerifiedTokenCache()
+    cache.revoke("logged-out", expires_at=time.time() + 30)
+    cache.revoke("old", expires_at=time.time() - 1)
+    assert cache.is_revoked("logged-out") and not cache.is_revoked("other")
+    # expired revocations are dropped on the next revoke, the token itself fails verification anyway
+    cache.revoke("another", expires_at=time.time() + 30)
+    assert not cache.is_revoked("old")
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import pytest
+from coalescing import QueryCoalescer, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  APT28   Tools ") == normalize_query("apt28 tools")
+
+
+def test_identical_calls_share_one_execution():
+    calls = []
+    release = threading.Event()
+
+    def slow(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    async def run():
+        coalescer = QueryCoalescer()
+        waiters = [asyncio.ensure_future(coalescer.run("k", slow, 21)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        assert coalescer.in_flight_call("k") and not coalescer.in_flight_stream("k")
+        release.set()
+        assert await asyncio.gather(*waiters) == [42] * 5
+        assert calls == [21] and not coalescer.in_flight_call("k")
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "done"
+
+    async def run():
+        coalescer = QueryCoalescer()
+        leaving = asyncio.ensure_future(coalescer.run("k", slow))
+        staying = asyncio.ensure_future(coalescer.run("k", slow))
+        await asyncio.sleep(0.05)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await staying == "done"
+        assert leaving.cancelled()
+    asyncio.run(run())
+
+
+def counting_source(log, count=5, delay=0.01):
+    async def source():
+        try:
+            for i in range(count):
+                await asyncio.sleep(delay)
+                yield i
+        finally:
+            log.append("source closed")
+    return source
+
+
+def test_late_subscriber_replays_the_shared_stream():
+    async def run():
+        coalescer = QueryCoalescer()
+        log, starts = [], []
+
+        def factory():
+            starts.append(1)
+            return counting_source(log)()
+
+        async def subscriber(delay):
+            await asyncio.sleep(delay)
+            return [chunk async for chunk in coalescer.stream("k", factory)]
+
+        assert await asyncio.gather(subscriber(0), subscriber(0.025)) == [[0, 1, 2, 3, 4]] * 2
+        assert starts == [1] and not coalescer.in_flight_stream("k")
+    asyncio.run(run())
+
+
+def test_subscriber_leaving_early_does_not_stop_the_others():
+    async def run():
+        coalescer = QueryCoalescer()
+        log = []
+        leaving = coalescer.stream("k", counting_source(log))
+        assert await leaving.__anext__() == 0
+        staying = [chunk async for chunk in _join_then_leave(coalescer, leaving, counting_source(log))]
+        assert staying == [0, 1, 2, 3, 4]
+        assert log == ["source closed"]
+    asyncio.run(run())
+
+
+async def _join_then_leave(coalescer, leaving, source):
+    # joins the running stream, then the first subscriber goes away
+    joined = coalescer.stream("k", source)
+    yield await joined.__anext__()
+    await leaving.aclose()
+    async for chunk in joined:
+        yield chunk
+
+
+def test_last_subscriber_leaving_cancels_the_source():
+    async def run():
+        coalescer = QueryCoalescer()
+        log = []
+        subscribers = [coalescer.stream("k", counting_source(log, count=100)) for _ in range(2)]
+        for subscriber in subscribers:
+            assert await subscriber.__anext__() == 0
+        await subscribers[0].aclose()
+        assert coalescer.in_flight_stream("k")
+        await subscribers[1].aclose()
+        # the key is free at once, the cancelled source is closed on the next loop iterations
+        assert not coalescer.in_flight_stream("k")
+        await asyncio.sleep(0.05)
+        assert log == ["source closed"]
+    asyncio.run(run())
+
+
+def test_source_error_reaches_every_subscriber():
+    async def failing():
+        yield 1
+        raise RuntimeError("pipeline failed")
+
+    async def run():
+        coalescer = QueryCoalescer()
+
+        async def subscriber():
+            chunks = []
+            with pytest.raises(RuntimeError, match="pipeline failed"):
+                async for chunk in coalescer.stream("k", failing):
+                    chunks.append(chunk)
+            return chunks
+
+        assert await asyncio.gather(subscriber(), subscriber()) == [[1], [1]]
+        assert not coalescer.in_flight_stream("k")
+    asyncio.run(run())
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from embedding_export import EmbeddingExport, EmbeddingExportWriter
+
+
+def write_export(directory, count, fail=False):
+    with EmbeddingExportWriter(str(directory), model="test-model") as writer:
+        writer.append([f"id-{i}" for i in range(count)], np.eye(count, 4, dtype=np.float32),
+                      [{"n": i} for i in range(count)], "ns")
+        if fail:
+            raise RuntimeError("upload failed")
+
+
+def test_export_round_trip(tmp_path):
+    write_export(tmp_path, 3)
+    export = EmbeddingExport(str(tmp_path))
+    assert len(export) == 3 and export.dimension == 4
+    (namespace, ids, vectors, metadata), = export.batches(batch_size=10)
+    assert namespace == "ns" and ids == ["id-0", "id-1", "id-2"] and metadata[2] == {"n": 2}
+    assert np.array_equal(vectors, np.eye(3, 4, dtype=np.float32))
+
+
+def test_failed_export_is_marked_incomplete(tmp_path):
+    write_export(tmp_path, 3)
+    with pytest.raises(RuntimeError):
+        write_export(tmp_path, 2, fail=True)
+    # the previous export's manifest doesn't vouch for the new, failed one
+    with pytest.raises(ValueError, match="incomplete"):
+        EmbeddingExport(str(tmp_path))
+
+
+def test_interrupted_export_has_no_manifest(tmp_path):
+    write_export(tmp_path, 3)
+    writer = EmbeddingExportWriter(str(tmp_path))
+    with pytest.raises(ValueError, match="no manifest"):
+        EmbeddingExport(str(tmp_path))
+    writer.close()
+    assert len(EmbeddingExport(str(tmp_path))) == 0
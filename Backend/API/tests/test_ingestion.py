@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import uuid
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from ingestion import LogReportIngestor, ReportJournal
+from models import LogReport
+
+
+class FakeVectorStore:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.upserted = []
+
+    def encode_items(self, items, fields):
+        if self.fail:
+            raise RuntimeError("encoder unavailable")
+        # normalized random directions, no two reports are clustered as near-identical embeddings
+        embeddings = np.random.default_rng().normal(size=(len(items), 64)).astype(np.float32)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def upsert_items(self, items, ids, namespace, metadata_fn=None, embeddings=None):
+        self.upserted.extend(ids)
+
+
+def make_report():
+    # unique per test, the SQLite database is shared by the whole run
+    return LogReport(owner="analyst", tokenAddress="token", reward="1",
+                     content=f"Beaconing from host {uuid.uuid4()} to evil.example over port 443 every 60 seconds")
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_near_duplicate_is_rejected(tmp_path):
+    async def run():
+        ingestor = LogReportIngestor(FakeVectorStore(), queue_dir=str(tmp_path), flush_interval=0.05)
+        await ingestor.start()
+        try:
+            report = make_report()
+            report_id = await ingestor.submit(report)
+            with pytest.raises(HTTPException) as error:
+                await ingestor.submit(report.model_copy(update={"content": report.content + "!"}))
+            assert error.value.status_code == 409 and report_id in error.value.detail
+            assert ingestor.accepted == 1 and ingestor.rejected_duplicates == 1
+            await wait_for(lambda: ingestor.ingested == 1)
+            assert ingestor.pinecone_db.upserted == [report_id]
+        finally:
+            await ingestor.stop()
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("ingested", [True, False], ids=["stored", "journal-only"])
+def test_near_duplicate_is_rejected_after_restart(tmp_path, ingested):
+    async def run():
+        report = make_report()
+        first = LogReportIngestor(FakeVectorStore(fail=not ingested), queue_dir=str(tmp_path), flush_interval=0.05)
+        await first.start()
+        try:
+            report_id = await first.submit(report)
+            if ingested:
+                await wait_for(lambda: first.ingested == 1)
+        finally:
+            await first.stop()
+
+        second = LogReportIngestor(FakeVectorStore(), queue_dir=str(tmp_path), flush_interval=0.05)
+        await second.start()
+        try:
+            with pytest.raises(HTTPException) as error:
+                await second.submit(report)
+            assert error.value.status_code == 409 and report_id in error.value.detail
+        finally:
+            await second.stop()
+    asyncio.run(run())
+
+
+def test_journal_is_opened_by_the_running_app_only():
+    import main
+    import ingestion
+    assert os.path.isabs(ingestion.LOG_QUEUE_DIR)
+    assert main.log_ingestor is None
+
+    async def run():
+        async with main.lifespan(main.app):
+            assert main.log_ingestor.journal.path == os.path.join(os.environ["LOG_QUEUE_DIR"], "journal.log")
+        assert main.log_ingestor is None
+    asyncio.run(run())
+
+
+def journal_line(report_id, content="c"):
+    return (json.dumps({"id": report_id, "owner": "o", "content": content, "tokenAddress": "t",
+                        "reward": "1", "submitted_at": 0.0}) + "\n").encode()
+
+
+def test_journal_read_skips_corrupt_lines_and_stops_at_a_torn_record(tmp_path):
+    journal = ReportJournal(str(tmp_path))
+    journal.append([journal_line("a"), b'{"id": "torn", \n', journal_line("b"), b'{"id": "partial"'])
+    records, offset = journal.read(0, 10)
+    assert [record["id"] for record in records] == ["a", "b"]
+    # the record without its newline may still be being written, it is not consumed
+    assert offset == os.path.getsize(journal.path) - len(b'{"id": "partial"')
+    journal.close()
+
+
+def test_journal_commit_truncates_once_fully_consumed(tmp_path):
+    journal = ReportJournal(str(tmp_path))
+    journal.append([journal_line("a"), journal_line("b")])
+    records, offset = journal.read(0, 1)
+    assert journal.commit(offset) == offset and journal.committed_offset() == offset
+    records, offset = journal.read(offset, 10)
+    assert [record["id"] for record in records] == ["b"]
+    assert journal.commit(offset) == 0
+    assert os.path.getsize(journal.path) == 0 and journal.committed_offset() == 0
+    journal.close()
+
+
+def test_journal_offset_past_the_end_replays_from_the_start(tmp_path):
+    journal = ReportJournal(str(tmp_path))
+    journal.append([journal_line("a")])
+    # e.g. the log was emptied by hand, or a crash hit between truncate and offset write
+    with open(journal.offset_path, "w") as f:
+        f.write("4096")
+    assert journal.committed_offset() == 0
+    with open(journal.offset_path, "w") as f:
+        f.write("garbage")
+    assert journal.committed_offset() == 0
+    journal.close()
+
+
+def test_consumer_replays_the_journal_after_a_restart(tmp_path):
+    journal = ReportJournal(str(tmp_path))
+    ids = [str(uuid.uuid4()) for _ in range(3)]
+    # left behind by a previous run: two reports, a corrupt line and one more report
+    journal.append([journal_line(ids[0], "first report"), journal_line(ids[1], "second one"), b"not json\n",
+                    journal_line(ids[2], "third and last")])
+    journal.close()
+
+    async def run():
+        ingestor = LogReportIngestor(FakeVectorStore(), queue_dir=str(tmp_path), flush_interval=0.05)
+        await ingestor.start()
+        try:
+            await wait_for(lambda: ingestor.ingested == 3)
+            assert sorted(ingestor.pinecone_db.upserted) == sorted(ids)
+            await wait_for(lambda: ingestor.journal.committed_offset() == 0)
+            assert os.path.getsize(ingestor.journal.path) == 0
+        finally:
+            await ingestor.stop()
+    asyncio.run(run())
+
+
+def test_consumer_retries_a_failed_batch_without_losing_it(tmp_path):
+    async def run():
+        store = FakeVectorStore(fail=True)
+        ingestor = LogReportIngestor(store, queue_dir=str(tmp_path), flush_interval=0.02)
+        await ingestor.start()
+        try:
+            report_id = await ingestor.submit(make_report())
+            await asyncio.sleep(0.1)
+            assert ingestor.ingested == 0
+            store.fail = False
+            await wait_for(lambda: ingestor.ingested == 1)
+            assert store.upserted == [report_id]
+        finally:
+            await ingestor.stop()
+    asyncio.run(run())
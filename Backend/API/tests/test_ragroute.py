@@ -0,0 +1,15 @@
+from bench_fakes import build_local_rag_model
+
+
+def test_unreachable_exploit_files_leave_the_answer_intact():
+    # nothing listens on the discard port, every GitLab fetch fails to connect
+    rag_model = build_local_rag_model(NameSpaces=["exploit_db"], corpus_size=20,
+                                      exploit_raw_base="http://127.0.0.1:9")
+    query_matches = rag_model._search("Apache Struts remote code execution")
+    assert query_matches["exploit_db"]
+    context = rag_model._assemble_context(
+        rag_model._with_vector_ids(query_matches, rag_model._hydrate_records(query_matches)))
+    assert "file: " in context
+    # failed fetches are neither cached nor part of the rendered records
+    assert not rag_model._gitlab_cache and not rag_model._render_cache
+    assert rag_model.Rag_Generator_caller("Apache Struts remote code execution")
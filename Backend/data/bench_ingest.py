@@ -0,0 +1,362 @@
+"""
+Ingestion throughput benchmark for the clean -> chunk -> embed -> upsert pipeline
+
+    python bench_ingest.py --mitre-records 20000 --exploit-records 20000
+    python bench_ingest.py --mitre-dir Mitre_Stix/enterprise-attack --exploit-csv ExploitDB/files_exploits.csv
+    python bench_ingest.py --profile ingest.prof --flamegraph ingest.folded --json ingest.json
+    python bench_ingest.py --export --bulk-workers 8 --index-latency 0.05
+
+Runs the same cleaning and chunking functions as the data scripts, then embeds and upserts with
+the API's PineconeDB against the local Pinecone stand-in, on a synthetic corpus or a sample of
+the real data. Reports records/sec per stage and peak RSS after each stage. The folded stacks
+written by --flamegraph can be rendered with flamegraph.pl or speedscope.
+"""
+import argparse
+import contextlib
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+import numpy as np
+
+# the stand-ins and the batched PineconeDB live with the API (this directory has an older pineconedb.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "API"))
+
+from bench_fakes import FakeEncoder, FakePinecone, generate_corpus
+from pineconedb import PineconeDB
+from embedding_export import EmbeddingExportWriter, EmbeddingExport, bulk_load
+from json_cleaning import process_folder
+from json_chunking import split_json_files
+from csv_cleaning import clean_csv, columns_to_remove
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class StackSampler:
+    def __init__(self, interval=0.005):
+        """
+        Sampling profiler collecting folded stacks of the main thread
+
+        Args:
+            interval (float, optional): Seconds between samples
+        """
+        self.interval = interval
+        self.stage = "setup"  # root frame of the samples, set as the pipeline advances
+        self.counts = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)})")
+                frame = frame.f_back
+            self.counts[";".join([self.stage, *reversed(stack)])] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def write_stix_bundles(directory, records, files, seed=0):
+    """
+    Write MITRE records as STIX bundles, with the attack-pattern and incomplete objects the
+    cleaning step drops
+
+    Returns:
+        int: Number of objects written
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    objects = []
+    for record in records:
+        objects.append({**record, "external_references": [
+            {"source_name": "mitre-attack", "url": f"https://attack.mitre.org/{record['id'][-8:]}"}]})
+        if rng.random() < 0.3:
+            objects.append({**record, "id": f"attack-pattern--{rng.getrandbits(128):032x}", "type": "attack-pattern"})
+        if rng.random() < 0.1:
+            objects.append({"id": f"relationship--{rng.getrandbits(128):032x}", "type": "relationship"})
+    per_file = -(-len(objects) // files)
+    for i in range(files):
+        with open(os.path.join(directory, f"bundle-{i}.json"), "w") as f:
+            json.dump({"type": "bundle", "objects": objects[i * per_file:(i + 1) * per_file]}, f)
+    return len(objects)
+
+
+def write_exploit_csv(path, records):
+    """
+    Write ExploitDB records in the layout of files_exploits.csv, including the dropped columns
+
+    Returns:
+        int: Number of rows written
+    """
+    fieldnames = [*records[0], "codes", "tags", "aliases", *columns_to_remove]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, restval="")
+        writer.writeheader()
+        writer.writerows(records)
+    return len(records)
+
+
+def sample_exploit_csv(source, path, limit):
+    with open(source, newline="", encoding="utf-8") as src, open(path, "w", newline="", encoding="utf-8") as dst:
+        reader = csv.DictReader(src)
+        writer = csv.DictWriter(dst, fieldnames=reader.fieldnames)
+        writer.writeheader()
+        rows = 0
+        for row in reader:
+            if limit and rows >= limit:
+                break
+            writer.writerow(row)
+            rows += 1
+    return rows
+
+
+def sample_stix_bundles(source, directory, limit):
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for filename in sorted(os.listdir(source)):
+        if filename.endswith(".json"):
+            with open(os.path.join(source, filename), "r", encoding="utf-8") as f:
+                bundle = json.load(f)
+            objects = bundle.get("objects", [])[:limit - count if limit else None]
+            with open(os.path.join(directory, filename), "w", encoding="utf-8") as f:
+                json.dump({**bundle, "objects": objects}, f)
+            count += len(objects)
+            if limit and count >= limit:
+                break
+    return count
+
+
+def load_records(directory, namespace):
+    records = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json"):
+            with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            records.extend((namespace, {**item, "_source_file": filename}) for item in data)
+    return records
+
+
+def vector_metadata(item):
+    # same trimming as PineconeDB.upload_json_files
+    return {k: v for k, v in item.items() if k != "external_references"}
+
+
+class Pipeline:
+    def __init__(self, args, workdir, sampler=None):
+        self.args = args
+        self.workdir = workdir
+        self.sampler = sampler
+        self.results = []
+        self.paths = {name: os.path.join(workdir, name) for name in
+                      ("stix", "filtered", "chunked", "exploitdb", "exploitdb-json")}
+        self.pinecone_db = None
+        self.items = []
+        self.embeddings = None
+
+    def stage(self, name, fn):
+        """
+        Run one stage, recording its record count, throughput and the peak RSS so far
+
+        fn returns the number of records it processed.
+        """
+        if self.sampler is not None:
+            self.sampler.stage = name
+        output = io.StringIO()
+        start = time.perf_counter()
+        # the data scripts print per file, keep the report readable
+        with contextlib.redirect_stdout(sys.stdout if self.args.verbose else output):
+            records = fn()
+        elapsed = time.perf_counter() - start
+        result = {
+            "stage": name,
+            "records": records,
+            "seconds": round(elapsed, 4),
+            "records_per_s": round(records / elapsed, 1) if elapsed else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        self.results.append(result)
+        print(f"{name:<12} records={records:<8} seconds={result['seconds']:>9.3f} "
+              f"records/s={result['records_per_s']:>11.1f} peak_rss={result['peak_rss_mb']:>8.1f}MB")
+
+    def prepare(self):
+        os.makedirs(self.paths["exploitdb"], exist_ok=True)
+        raw_csv = os.path.join(self.workdir, "files_exploits.csv")
+        if self.args.mitre_dir:
+            mitre = sample_stix_bundles(self.args.mitre_dir, self.paths["stix"], self.args.mitre_records)
+        else:
+            corpus = generate_corpus(n_mitre=self.args.mitre_records, n_exploits=self.args.exploit_records)
+            mitre = write_stix_bundles(self.paths["stix"], corpus["mitre_stix"], self.args.files)
+        if self.args.exploit_csv:
+            exploits = sample_exploit_csv(self.args.exploit_csv, raw_csv, self.args.exploit_records)
+        else:
+            exploits = write_exploit_csv(raw_csv, generate_corpus(0, self.args.exploit_records)["exploit_db"])
+        return mitre + exploits
+
+    def clean_mitre(self):
+        process_folder(self.paths["stix"], self.paths["filtered"])
+        count = 0
+        for filename in os.listdir(self.paths["filtered"]):
+            with open(os.path.join(self.paths["filtered"], filename), "r") as f:
+                count += len(json.load(f))
+        return count
+
+    def clean_exploits(self):
+        return clean_csv(os.path.join(self.workdir, "files_exploits.csv"),
+                         os.path.join(self.paths["exploitdb"], "filtered_exploits.csv"))
+
+    def convert_exploits(self):
+        # same conversion as CsvVectorUploader._convert_csv_to_json
+        os.makedirs(self.paths["exploitdb-json"], exist_ok=True)
+        with open(os.path.join(self.paths["exploitdb"], "filtered_exploits.csv"), mode="r", encoding="utf-8") as csv_file:
+            data = list(csv.DictReader(csv_file))
+        with open(os.path.join(self.paths["exploitdb-json"], "filtered_exploits.json"), mode="w", encoding="utf-8") as json_file:
+            json.dump(data, json_file, indent=4)
+        return len(data)
+
+    def chunk(self):
+        split_json_files(self.paths["filtered"], self.paths["chunked"], chunk_size=self.args.chunk_size)
+        self.items = (load_records(self.paths["chunked"], "mitre_stix")
+                      + load_records(self.paths["exploitdb-json"], "exploit_db"))
+        return len(self.items)
+
+    def embed(self):
+        items = [item for _, item in self.items]
+        if self.args.embed_mode == "per-item":
+            # one encoder call per record, as PineconeDB.upload_json_files does
+            self.embeddings = np.asarray([self.pinecone_db.create_embedding(item) for item in items], dtype=np.float32)
+        else:
+            self.embeddings = self.pinecone_db.encode_items(items)
+        return len(items)
+
+    def upsert(self):
+        by_namespace = {}
+        for i, (namespace, _) in enumerate(self.items):
+            by_namespace.setdefault(namespace, []).append(i)
+        for namespace, indexes in by_namespace.items():
+            self.pinecone_db.upsert_items(
+                [self.items[i][1] for i in indexes],
+                [f"{namespace}-{i}" for i in indexes],
+                namespace,
+                metadata_fn=vector_metadata,
+                embeddings=self.embeddings[indexes]
+            )
+        return len(self.items)
+
+    def export(self):
+        with EmbeddingExportWriter(os.path.join(self.workdir, "export")) as writer:
+            for start in range(0, len(self.items), self.args.batch_size):
+                batch = self.items[start:start + self.args.batch_size]
+                for namespace in dict.fromkeys(namespace for namespace, _ in batch):
+                    indexes = [start + i for i, (item_namespace, _) in enumerate(batch) if item_namespace == namespace]
+                    writer.append([f"{namespace}-{i}" for i in indexes], self.embeddings[indexes],
+                                  [vector_metadata(self.items[i][1]) for i in indexes], namespace)
+        return writer.count
+
+    def bulk_load(self):
+        # a fresh index filled from the export, the encoder isn't involved
+        index = FakePinecone(latency=self.args.index_latency).Index("bench-bulk-load")
+        return bulk_load(EmbeddingExport(os.path.join(self.workdir, "export")), index,
+                         batch_size=self.args.batch_size, workers=self.args.bulk_workers)
+
+    def run(self):
+        encoder = None
+        if self.args.real_encoder:
+            from sentence_transformers import SentenceTransformer
+            encoder = SentenceTransformer(self.args.real_encoder, device="cpu")
+        self.pinecone_db = PineconeDB(
+            None, "bench-ingest",
+            batch_size=self.args.batch_size,
+            pinecone_client=FakePinecone(latency=self.args.index_latency),
+            model=encoder or FakeEncoder(latency=self.args.encoder_latency)
+        )
+        self.stage("prepare", self.prepare)
+        self.stage("clean_mitre", self.clean_mitre)
+        self.stage("clean_csv", self.clean_exploits)
+        self.stage("convert_csv", self.convert_exploits)
+        self.stage("chunk", self.chunk)
+        self.stage("embed", self.embed)
+        self.stage("upsert", self.upsert)
+        if self.args.export:
+            self.stage("export", self.export)
+            self.stage("bulk_load", self.bulk_load)
+        return self.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data ingestion pipeline against a local vector store")
+    parser.add_argument("--mitre-records", type=int, default=10000, help="Synthetic MITRE records, or the sample size with --mitre-dir")
+    parser.add_argument("--exploit-records", type=int, default=10000, help="Synthetic ExploitDB rows, or the sample size with --exploit-csv")
+    parser.add_argument("--mitre-dir", default=None, help="Directory of STIX bundles to sample instead of synthetic data")
+    parser.add_argument("--exploit-csv", default=None, help="files_exploits.csv to sample instead of synthetic data")
+    parser.add_argument("--files", type=int, default=3, help="Synthetic STIX bundle files")
+    parser.add_argument("--chunk-size", type=int, default=510)
+    parser.add_argument("--batch-size", type=int, default=127, help="Vectors per upsert call")
+    parser.add_argument("--embed-mode", choices=["per-item", "batched"], default="per-item",
+                        help="per-item matches upload_json_files, batched matches upsert_items")
+    parser.add_argument("--encoder-latency", type=float, default=0.0, help="Seconds per encode call of the fake encoder")
+    parser.add_argument("--real-encoder", default=None, help="Sentence Transformer model to use instead of the fake encoder")
+    parser.add_argument("--index-latency", type=float, default=0.0, help="Seconds per upsert call")
+    parser.add_argument("--export", action="store_true", help="Also export the embeddings and bulk load them into a new index")
+    parser.add_argument("--bulk-workers", type=int, default=4, help="Concurrent upsert calls of the bulk load")
+    parser.add_argument("--profile", default=None, help="Write cProfile stats to this file")
+    parser.add_argument("--flamegraph", default=None, help="Write sampled folded stacks to this file")
+    parser.add_argument("--sample-interval", type=float, default=0.005, help="Seconds between flamegraph samples")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the data scripts' progress output")
+    args = parser.parse_args()
+
+    sampler = StackSampler(args.sample_interval) if args.flamegraph else None
+    profiler = cProfile.Profile() if args.profile else None
+    with tempfile.TemporaryDirectory() as workdir:
+        pipeline = Pipeline(args, workdir, sampler)
+        if sampler is not None:
+            sampler.start()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            results = pipeline.run()
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            if sampler is not None:
+                sampler.stop()
+
+    if profiler is not None:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    if sampler is not None:
+        sampler.write(args.flamegraph)
+        print(f"Folded stacks written to {args.flamegraph} ({sum(sampler.counts.values())} samples)")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": vars(args), "results": results, "peak_rss_mb": peak_rss_mb()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
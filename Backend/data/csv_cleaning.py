@@ -9,11 +9,17 @@ columns_to_remove = [
     'application_url', 
     'source_url'
 ]
-for file in files: 
+
+def clean_csv(input_path, output_path):
     # Read the CSV file
-    df = pd.read_csv(f'ExploitDB/files_{file}.csv')
+    df = pd.read_csv(input_path)
     # Remove the specified columns
     df_filtered = df.drop(columns=columns_to_remove)
     # Save to CSV file
-    df_filtered.to_csv(f'ExploitDB/filtered_{file}.csv', index=False)
-print("Data has been saved to CSV format.")
+    df_filtered.to_csv(output_path, index=False)
+    return len(df_filtered)
+
+if __name__ == '__main__':
+    for file in files: 
+        clean_csv(f'ExploitDB/files_{file}.csv', f'ExploitDB/filtered_{file}.csv')
+    print("Data has been saved to CSV format.")
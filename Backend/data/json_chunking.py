@@ -39,6 +39,7 @@ def split_json_files(input_dir, output_dir, chunk_size=510):
 # Example usage
 input_directory = ["enterprise", "ics", "mobile"]  # Change this to your input directory
 
-for dirs in input_directory:
-    print(f"Mitre_Stix/filtered-{dirs}", f"Mitre_Stix/chunked-{dirs}")
-    split_json_files(f"Mitre_Stix/filtered-{dirs}", f"Mitre_Stix/chunked-{dirs}")
+if __name__ == '__main__':
+    for dirs in input_directory:
+        print(f"Mitre_Stix/filtered-{dirs}", f"Mitre_Stix/chunked-{dirs}")
+        split_json_files(f"Mitre_Stix/filtered-{dirs}", f"Mitre_Stix/chunked-{dirs}")
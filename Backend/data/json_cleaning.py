@@ -55,5 +55,6 @@ def process_folder(input_folder: str, output_folder: str) -> None:
 # new comments here
 folders=("enterprise", "mobile", "ics")
 
-for x in folders:
-    process_folder(f"Mitre_Stix/{x}-attack", f"Mitre_Stix/filtered-{x}")
\ No newline at end of file
+if __name__ == '__main__':
+    for x in folders:
+        process_folder(f"Mitre_Stix/{x}-attack", f"Mitre_Stix/filtered-{x}")